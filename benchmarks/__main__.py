@@ -0,0 +1,64 @@
+import argparse
+import json
+import sys
+
+from benchmarks.suite import BENCHMARKS, compare, run_suite
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        prog="python -m benchmarks",
+        description="Run the benchmark suite and compare the results with a baseline",
+    )
+    parser.add_argument("names", nargs="*", help="benchmarks to run, default: all")
+    parser.add_argument("--scale", type=float, default=1.0, help="multiplies sizes")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="write the results as JSON to this file")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=0.1,
+        help="fail when a benchmark is this much slower than the baseline",
+    )
+    parser.add_argument("--list", action="store_true", help="list the benchmarks")
+    args = parser.parse_args()
+
+    if args.list:
+        for name, info in BENCHMARKS.items():
+            print(f"{name} ({info.size} items)")
+        return 0
+    unknown = [name for name in args.names if name not in BENCHMARKS]
+    if unknown:
+        parser.error(f"unknown benchmarks: {', '.join(unknown)}")
+
+    results = run_suite(args.names, args.scale, args.repeat)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+    if not args.baseline:
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    if baseline.get("scale") != results["scale"]:
+        print(
+            f"warning: baseline was run with scale {baseline.get('scale')}, "
+            f"not {results['scale']}"
+        )
+    comparisons, regressions = compare(results, baseline, args.threshold)
+    for c in comparisons:
+        flag = " REGRESSION" if c in regressions else ""
+        print(
+            f"{c.name}: {c.baseline:.0f} -> {c.current:.0f} items/s "
+            f"({c.change * 100:+.1f}%){flag}"
+        )
+    if regressions:
+        print(f"{len(regressions)} benchmarks regressed more than {args.threshold:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
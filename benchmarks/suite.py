@@ -0,0 +1,356 @@
+import asyncio
+import inspect
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+import time
+from typing import Callable, Dict, List, NamedTuple, Optional
+
+from models.blocks import OpenBlock, SendBlock
+from models.messages import MessageParser, PublishMessage
+from network.block_handler import BlockHandler
+from storage.account_index import AccountIndex
+from storage.in_memory import InMemoryStorage
+from storage.lmdb_storage import LmdbStorage
+from storage.storage import Storage
+from util.crypto import (
+    hash_blocks,
+    sign,
+    verify_pow_batch,
+    verify_signatures_batch,
+)
+from util.numbers import deterministic_key
+
+# A benchmark gets a size and does its setup, then returns a callable that runs the measured work
+# once and returns the number of items it processed. The callable may return a coroutine.
+Benchmark = Callable[[int], Callable]
+
+
+class BenchmarkInfo(NamedTuple):
+    function: Benchmark
+    # Items per run at scale 1
+    size: int
+
+
+BENCHMARKS: Dict[str, BenchmarkInfo] = {}
+# Teardown callbacks of the benchmarks that have been set up
+CLEANUP: List[Callable] = []
+
+
+def benchmark(name: str, size: int):
+    def register(function: Benchmark):
+        BENCHMARKS[name] = BenchmarkInfo(function, size)
+        return function
+
+    return register
+
+
+def random_send_blocks(n: int) -> List[SendBlock]:
+    return [SendBlock.parse(os.urandom(SendBlock.LENGTH)) for _ in range(n)]
+
+
+@benchmark("block_parse", 100000)
+def bench_block_parse(n):
+    wire_data = [os.urandom(SendBlock.LENGTH) for _ in range(n)]
+
+    def run():
+        for data in wire_data:
+            SendBlock.parse(data)
+        return n
+
+    return run
+
+
+@benchmark("message_parse", 100000)
+def bench_message_parse(n):
+    datagrams = [
+        PublishMessage(block_type=block.block_type, block=block).to_bytes()
+        for block in random_send_blocks(n)
+    ]
+
+    def run():
+        for data in datagrams:
+            MessageParser.parse(data).block_hash
+        return n
+
+    return run
+
+
+@benchmark("block_hash", 100000)
+def bench_block_hash(n):
+    wire_data = [os.urandom(SendBlock.LENGTH) for _ in range(n)]
+
+    def run():
+        # Parsed again every run, since the hash is cached on the block
+        for data in wire_data:
+            SendBlock.parse(data).hash_sync()
+        return n
+
+    return run
+
+
+@benchmark("hash_blocks", 500000)
+def bench_hash_blocks(n):
+    data = os.urandom(n * SendBlock.LENGTH)
+
+    def run():
+        hash_blocks(data, SendBlock.LENGTH, SendBlock.HASHED_LENGTH)
+        return n
+
+    return run
+
+
+@benchmark("pow_verify", 100000)
+def bench_pow_verify(n):
+    items = [(os.urandom(32), os.urandom(8)) for _ in range(n)]
+
+    def run():
+        verify_pow_batch(items)
+        return n
+
+    return run
+
+
+def signed_open_blocks(n: int, source: bytes = bytes(32)) -> List[OpenBlock]:
+    blocks = []
+    for i in range(n):
+        private_key, public_key = deterministic_key(bytes(32), i)
+        block = OpenBlock(source, public_key, public_key, bytes(64), bytes(8))
+        block.signature = sign(block.hash_sync(), private_key)
+        blocks.append(block)
+    return blocks
+
+
+@benchmark("signature_verify", 200)
+def bench_signature_verify(n):
+    items = [block.signature_item() for block in signed_open_blocks(n)]
+
+    def run():
+        assert all(verify_signatures_batch(items))
+        return n
+
+    return run
+
+
+def storage_benchmark(storage: Storage, n: int, operation: str):
+    items = {block.hash_sync(): block.to_bytes() for block in random_send_blocks(n)}
+    if operation == "bulk_get":
+        storage.bulk_put(items)
+    keys = list(items)
+
+    def run():
+        if operation == "bulk_put":
+            storage.bulk_put(items)
+        else:
+            storage.bulk_get(keys)
+        return n
+
+    return run
+
+
+class TemporaryLmdb:
+    # An LmdbStorage in a temporary directory that is removed at exit
+    def __init__(self):
+        self.path = tempfile.mkdtemp()
+        self.storage = LmdbStorage({"path": self.path, "map_size": 1024**3})
+
+    def close(self):
+        self.storage.close()
+        shutil.rmtree(self.path, ignore_errors=True)
+
+
+@benchmark("storage_memory_bulk_put", 100000)
+def bench_memory_bulk_put(n):
+    return storage_benchmark(InMemoryStorage(), n, "bulk_put")
+
+
+@benchmark("storage_memory_bulk_get", 100000)
+def bench_memory_bulk_get(n):
+    return storage_benchmark(InMemoryStorage(), n, "bulk_get")
+
+
+@benchmark("storage_lmdb_bulk_put", 100000)
+def bench_lmdb_bulk_put(n):
+    lmdb = TemporaryLmdb()
+    CLEANUP.append(lmdb.close)
+    return storage_benchmark(lmdb.storage, n, "bulk_put")
+
+
+@benchmark("storage_lmdb_bulk_get", 100000)
+def bench_lmdb_bulk_get(n):
+    lmdb = TemporaryLmdb()
+    CLEANUP.append(lmdb.close)
+    return storage_benchmark(lmdb.storage, n, "bulk_get")
+
+
+@benchmark("chain_walk_lmdb", 100000)
+def bench_chain_walk(n):
+    # Follows the previous field from the head of one long chain, like db_bench's chain loads
+    lmdb = TemporaryLmdb()
+    CLEANUP.append(lmdb.close)
+    previous = bytes(32)
+    items = {}
+    for _ in range(n):
+        block = SendBlock(previous, os.urandom(32), bytes(16), bytes(64), bytes(8))
+        previous = block.hash_sync()
+        items[previous] = block.to_bytes()
+    lmdb.storage.bulk_put(items)
+    head = previous
+
+    def run():
+        count = 0
+        current = head
+        with lmdb.storage.env.begin(buffers=True) as txn:
+            while True:
+                value = txn.get(current)
+                if value is None:
+                    break
+                count += 1
+                # The previous field follows the block type byte
+                current = bytes(value[1:33])
+        return count
+
+    return run
+
+
+@benchmark("chain_pull_indexed_lmdb", 100000)
+def bench_chain_pull_indexed(n):
+    # The same chain as chain_walk_lmdb, read with the account index: the hashes of all heights
+    # in one batch, then the blocks in one batch
+    tables = [TemporaryLmdb() for _ in range(4)]
+    CLEANUP.extend(table.close for table in tables)
+    blocks, index = tables[0].storage, AccountIndex(*(t.storage for t in tables[1:]))
+    account = os.urandom(32)
+    chain = [OpenBlock(os.urandom(32), account, account, bytes(64), bytes(8))]
+    for _ in range(n - 1):
+        previous = chain[-1].hash_sync()
+        chain.append(
+            SendBlock(previous, os.urandom(32), bytes(16), bytes(64), bytes(8))
+        )
+    blocks.bulk_put({block.hash_sync(): block.to_bytes() for block in chain})
+    index.add_blocks(chain)
+
+    def run():
+        info = index.account_info(account)
+        hashes = index.chain_hashes(account, 1, info.block_count)
+        return len(blocks.bulk_get(hashes))
+
+    return run
+
+
+@benchmark("block_handler", 200)
+def bench_block_handler(n):
+    # Open blocks with valid signatures through the whole pipeline. PoW is checked against the
+    # lowest threshold, since generating real work would take far longer than the benchmark.
+    source = os.urandom(32)
+    blocks = signed_open_blocks(n, source)
+
+    async def run():
+        storage = InMemoryStorage()
+        storage.put(source, b"source")
+        block_handler = BlockHandler(storage, pow_threshold=0)
+        await block_handler.start()
+        for block in blocks:
+            await block_handler.handle_block(block)
+        await block_handler.stop()
+        assert len(storage.data) == n + 1
+        return n
+
+    return run
+
+
+class Result(NamedTuple):
+    items: int
+    seconds: float
+
+    @property
+    def items_per_second(self) -> float:
+        return self.items / self.seconds if self.seconds else 0.0
+
+    def to_json(self) -> Dict:
+        return dict(
+            items=self.items,
+            seconds=self.seconds,
+            items_per_second=self.items_per_second,
+        )
+
+
+def run_benchmark(name: str, scale: float = 1.0, repeat: int = 3) -> Result:
+    # The fastest of repeat runs is reported, it is the least disturbed by other work
+    info = BENCHMARKS[name]
+    run = info.function(max(1, int(info.size * scale)))
+    loop = asyncio.new_event_loop()
+    best: Optional[Result] = None
+    try:
+        for _ in range(repeat):
+            s = time.perf_counter()
+            items = run()
+            if inspect.isawaitable(items):
+                items = loop.run_until_complete(items)
+            result = Result(items, time.perf_counter() - s)
+            if best is None or result.seconds < best.seconds:
+                best = result
+    finally:
+        loop.close()
+        while CLEANUP:
+            CLEANUP.pop()()
+    return best
+
+
+def environment() -> Dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True
+        ).stdout.strip()
+    except OSError:
+        commit = ""
+    return dict(
+        python=platform.python_version(),
+        platform=platform.platform(),
+        cpus=os.cpu_count(),
+        commit=commit,
+        time=time.time(),
+    )
+
+
+def run_suite(
+    names: Optional[List[str]] = None, scale: float = 1.0, repeat: int = 3
+) -> Dict:
+    results = {}
+    for name in names or list(BENCHMARKS):
+        result = run_benchmark(name, scale, repeat)
+        print(
+            f"{name}: {result.items} items in {result.seconds * 1000:.1f}ms, "
+            f"{result.items_per_second:.0f} items/s"
+        )
+        results[name] = result.to_json()
+    return dict(environment=environment(), scale=scale, results=results)
+
+
+class Comparison(NamedTuple):
+    name: str
+    baseline: float
+    current: float
+
+    @property
+    def change(self) -> float:
+        # Relative change in items per second, negative is slower
+        return self.current / self.baseline - 1 if self.baseline else 0.0
+
+
+def compare(results: Dict, baseline: Dict, threshold: float = 0.1):
+    # Returns all comparisons and the regressions: benchmarks more than threshold slower than the
+    # baseline. Benchmarks missing from either side are skipped.
+    comparisons = [
+        Comparison(
+            name,
+            baseline["results"][name]["items_per_second"],
+            result["items_per_second"],
+        )
+        for name, result in results["results"].items()
+        if name in baseline["results"]
+    ]
+    regressions = [c for c in comparisons if c.change < -threshold]
+    return comparisons, regressions
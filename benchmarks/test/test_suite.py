@@ -0,0 +1,37 @@
+from benchmarks.suite import BENCHMARKS, compare, run_benchmark, run_suite
+
+
+def test_run_benchmarks():
+    for name in ["block_parse", "storage_lmdb_bulk_get", "block_handler"]:
+        result = run_benchmark(name, scale=0.01, repeat=1)
+        assert result.items == max(1, int(BENCHMARKS[name].size * 0.01))
+        assert result.items_per_second > 0
+
+
+def test_run_suite_results():
+    results = run_suite(["pow_verify"], scale=0.01, repeat=1)
+    assert results["scale"] == 0.01
+    assert results["results"]["pow_verify"]["items"] == 1000
+    assert "python" in results["environment"]
+
+
+def test_compare():
+    baseline = {
+        "results": {
+            "a": {"items_per_second": 100.0},
+            "b": {"items_per_second": 100.0},
+            "c": {"items_per_second": 100.0},
+        }
+    }
+    results = {
+        "results": {
+            "a": {"items_per_second": 95.0},
+            "b": {"items_per_second": 80.0},
+            "new": {"items_per_second": 1.0},
+        }
+    }
+    comparisons, regressions = compare(results, baseline, threshold=0.1)
+
+    assert [c.name for c in comparisons] == ["a", "b"]
+    assert [c.name for c in regressions] == ["b"]
+    assert round(regressions[0].change, 2) == -0.2
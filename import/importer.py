@@ -1,44 +1,250 @@
+import argparse
+import json
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Set, Tuple
+
 import lmdb
 
-env = lmdb.Environment("data.ldb", map_size=1024 ** 4, subdir=False, max_dbs=128)
+from models.blocks import BLOCK_CLASSES, BlockType
+from storage.account_index import AccountIndex, open_lmdb_ledger
+from storage.storage import Storage
+from util.crypto import hash_blocks
+
+# Block tables of the reference node's ledger. Values are the block followed by the hash of the
+# next block in the account chain.
+TABLES = {
+    "send": BlockType.SEND,
+    "receive": BlockType.RECEIVE,
+    "open": BlockType.OPEN,
+    "change": BlockType.CHANGE,
+}
+SUCCESSOR_LENGTH = 32
+
+
+def get_ledger(
+    kind: str, path: str, index: bool = False
+) -> Tuple[Storage, Optional[AccountIndex]]:
+    # The block storage, and the account index if asked for. Settings are for a bulk load. Writes
+    # are not synced to disk, so after a system crash (rather than an interrupted import) the
+    # import should be started over.
+    if kind == "rocks":
+        from storage.rocks_storage import RocksStorage
+
+        # The index tables are stored next to the blocks
+        tables = [
+            RocksStorage({"path": f"{path}{suffix}", "bulk_ingest": True})
+            for suffix in ["", ".accounts", ".heights", ".chains"][: 4 if index else 1]
+        ]
+        return tables[0], AccountIndex(*tables[1:]) if index else None
+    if kind == "lmdb":
+        # The layout of server.py, with the index in the same environment
+        storage, account_index = open_lmdb_ledger(
+            {
+                "path": path,
+                "map_size": 64 * 1024**3,
+                "sync": False,
+                "metasync": False,
+                "writemap": True,
+                "map_async": True,
+            }
+        )
+        return storage, account_index if index else None
+    raise ValueError(f"Unknown storage {kind}")
+
+
+class Checkpoints:
+    # The last key written of each table, saved to a JSON file after every batch. Keys are
+    # iterated in order, so a table continues after its last key on resume.
+    def __init__(self, path: str):
+        self.path = path
+        self.lock = threading.Lock()
+        self.tables: Dict[str, Dict] = {}
+        if os.path.exists(path):
+            with open(path) as f:
+                self.tables = json.load(f)
+
+    def last_key(self, table: str) -> Optional[bytes]:
+        checkpoint = self.tables.get(table)
+        return bytes.fromhex(checkpoint["last_key"]) if checkpoint else None
+
+    def rows(self, table: str) -> int:
+        return self.tables.get(table, {}).get("rows", 0)
+
+    def is_done(self, table: str) -> bool:
+        return self.tables.get(table, {}).get("done", False)
+
+    def save(self, table: str, last_key: bytes, rows: int, done: bool = False):
+        with self.lock:
+            self.tables[table] = dict(last_key=last_key.hex(), rows=rows, done=done)
+            # Written to a temporary file first, so an interruption never leaves a broken file
+            with open(self.path + ".tmp", "w") as f:
+                json.dump(self.tables, f)
+            os.replace(self.path + ".tmp", self.path)
+
+
+class Importer:
+    def __init__(
+        self,
+        source: lmdb.Environment,
+        storage: Storage,
+        checkpoints: Checkpoints,
+        batch_size: int = 50000,
+        verify: bool = False,
+        index: Optional[AccountIndex] = None,
+    ):
+        self.source = source
+        self.storage = storage
+        self.checkpoints = checkpoints
+        self.batch_size = batch_size
+        self.verify = verify
+        self.index = index
+
+        # Storage backends don't all allow concurrent writes, so tables are read, split and hashed
+        # in parallel but written one batch at a time
+        self.write_lock = threading.Lock()
+        self.rows: Dict[str, int] = {}
+        # Tables read to the end, in this run or an earlier one
+        self.done: Set[str] = set()
+        self.mismatches = 0
+
+    def import_table(self, table: str, db):
+        block_type = TABLES[table]
+        block_class = BLOCK_CLASSES[block_type]
+        type_byte = bytes([block_type.value])
+        rows = self.rows[table] = self.checkpoints.rows(table)
+        last_key = self.checkpoints.last_key(table)
+        if self.checkpoints.is_done(table):
+            self.done.add(table)
+            return
+
+        with self.source.begin(db=db, buffers=True) as txn:
+            cursor = txn.cursor()
+            if last_key is None:
+                more = cursor.first()
+            else:
+                more = cursor.set_range(last_key)
+                if more and bytes(cursor.key()) == last_key:
+                    more = cursor.next()
+
+            while more:
+                keys: List[bytes] = []
+                blocks = bytearray()
+                while more and len(keys) < self.batch_size:
+                    keys.append(bytes(cursor.key()))
+                    blocks += cursor.value()[:-SUCCESSOR_LENGTH]
+                    more = cursor.next()
 
+                if self.verify:
+                    self.verify_hashes(keys, blocks, block_class)
 
-send_db = env.open_db(b"send")
-receive_db = env.open_db(b"receive")
-open_db = env.open_db(b"open")
-change_db = env.open_db(b"change")
-blocks_info_db = env.open_db(b"blocks_info")
+                length = block_class.LENGTH
+                batch = {
+                    key: type_byte + bytes(blocks[i * length : (i + 1) * length])
+                    for i, key in enumerate(keys)
+                }
+                with self.write_lock:
+                    self.storage.bulk_put(batch)
+                rows += len(keys)
+                self.rows[table] = rows
+                self.checkpoints.save(table, keys[-1], rows, done=not more)
+        self.done.add(table)
 
-with env.begin(db=blocks_info_db) as txn:
-    cursor = txn.cursor()
-    c = 0
-    for k, v in cursor:
-        c += 1
-    print(f"blocks_info had {c} keys")
+    def verify_hashes(self, keys: List[bytes], blocks: bytearray, block_class):
+        hashes = hash_blocks(blocks, block_class.LENGTH, block_class.HASHED_LENGTH)
+        for i, key in enumerate(keys):
+            if hashes[i * 32 : (i + 1) * 32] != key:
+                with self.write_lock:
+                    self.mismatches += 1
+                print(f"{block_class.BLOCK_TYPE.name} block {key.hex()} doesn't match")
 
+    def run(self, tables: List[str], progress_interval: float = 5.0):
+        # One thread per table. LMDB cursors and hashlib release the GIL for large parts of the
+        # work, and storage writes overlap with reading the next batch.
+        threads = [
+            threading.Thread(
+                target=self.import_table,
+                args=(table, self.source.open_db(table.encode(), create=False)),
+                name=table,
+            )
+            for table in tables
+        ]
+        start_rows = sum(self.checkpoints.rows(table) for table in tables)
+        s = time.time()
+        for thread in threads:
+            thread.start()
 
-def iterate_db(txn):
-    cursor = txn.cursor()
-    c = 0
-    for hash, v in cursor:
-        block_bytes = v[:-32]
-        next_block = v[-32:]
-        c += 1
-    return c
+        last_time, last_rows = s, start_rows
+        while any(thread.is_alive() for thread in threads):
+            deadline = time.time() + progress_interval
+            for thread in threads:
+                thread.join(max(0.0, deadline - time.time()))
+            now = time.time()
+            rows = sum(self.rows.values())
+            print(
+                f"{rows} rows, {(rows - last_rows) / (now - last_time):.0f} rows/s "
+                + ", ".join(f"{table}:{count}" for table, count in self.rows.items())
+            )
+            last_time, last_rows = now, rows
 
+        e = time.time()
+        rows = sum(self.rows.values()) - start_rows
+        print(
+            f"imported {rows} rows in {e - s:.1f}s, {rows / (e - s):.0f} rows/s on average"
+        )
+        if self.mismatches:
+            print(f"{self.mismatches} blocks didn't match their hash")
 
-with env.begin(db=send_db) as txn:
-    send_count = iterate_db(txn)
-    print(f"got {send_count} send blocks")
+        # Tables are imported in hash order, so the heights of a chain are only known once all of
+        # its blocks are stored. The index is built from the storage after the last table is done.
+        if self.index is not None and self.done.issuperset(TABLES):
+            s = time.time()
+            count = self.index.rebuild(self.storage)
+            print(f"indexed {count} blocks in {time.time() - s:.1f}s")
 
-with env.begin(db=receive_db) as txn:
-    receive_count = iterate_db(txn)
-    print(f"got {receive_count} receive blocks")
 
-with env.begin(db=open_db) as txn:
-    open_count = iterate_db(txn)
-    print(f"got {open_count} open blocks")
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Import the blocks of a reference node's ledger"
+    )
+    parser.add_argument("--source", default="data.ldb", help="reference node data.ldb")
+    parser.add_argument("--storage", default="lmdb", choices=["lmdb", "rocks"])
+    parser.add_argument("--destination", default="lm.db")
+    parser.add_argument("--checkpoint", default="import.checkpoint.json")
+    parser.add_argument("--batch-size", type=int, default=50000)
+    parser.add_argument(
+        "--tables", nargs="+", default=list(TABLES), choices=list(TABLES)
+    )
+    parser.add_argument(
+        "--index",
+        action="store_true",
+        help="build the account index next to the destination after the import",
+    )
+    parser.add_argument(
+        "--verify", action="store_true", help="check the block hashes against the keys"
+    )
+    args = parser.parse_args()
 
-with env.begin(db=change_db) as txn:
-    change_count = iterate_db(txn)
-    print(f"got {change_count} change blocks")
+    env = lmdb.Environment(
+        args.source,
+        map_size=1024**4,
+        subdir=False,
+        max_dbs=128,
+        readonly=True,
+        lock=False,
+    )
+    storage, index = get_ledger(args.storage, args.destination, args.index)
+    importer = Importer(
+        env, storage, Checkpoints(args.checkpoint), args.batch_size, args.verify, index
+    )
+    tables = [storage] + (
+        [index.accounts, index.heights, index.chains] if index else []
+    )
+    try:
+        importer.run(args.tables)
+    finally:
+        for table in tables:
+            if hasattr(table, "finish_bulk_ingest"):
+                table.finish_bulk_ingest()
+            table.close()
@@ -0,0 +1,85 @@
+import importlib
+import os
+
+import lmdb
+import pytest
+
+from models.blocks import OpenBlock, SendBlock
+from storage.account_index import AccountIndex, AccountInfo
+from storage.in_memory import InMemoryStorage
+
+# "import" is a keyword, so the package can't be imported with an import statement
+importer = importlib.import_module("import.importer")
+
+
+@pytest.fixture
+def blocks():
+    sends = [
+        SendBlock(bytes([i] * 32), bytes(32), bytes(16), bytes(64), bytes(8))
+        for i in range(5)
+    ]
+    opens = [
+        OpenBlock(bytes([i] * 32), bytes(32), bytes([i] * 32), bytes(64), bytes(8))
+        for i in range(3)
+    ]
+    return sends + opens
+
+
+@pytest.fixture
+def source(tmp_path, blocks):
+    env = lmdb.Environment(
+        str(tmp_path / "data.ldb"), subdir=False, max_dbs=8, map_size=10 * 1024 * 1024
+    )
+    for table in importer.TABLES:
+        env.open_db(table.encode())
+    with env.begin(write=True) as txn:
+        for block in blocks:
+            db = env.open_db(block.block_type.name.lower().encode(), txn=txn)
+            # The value ends with the hash of the next block in the chain
+            txn.put(block.hash_sync(), block.data + bytes([7] * 32), db=db)
+    yield env
+    env.close()
+
+
+def test_import(tmp_path, source, blocks):
+    storage = InMemoryStorage()
+    checkpoints = importer.Checkpoints(str(tmp_path / "checkpoint.json"))
+    imp = importer.Importer(source, storage, checkpoints, batch_size=2, verify=True)
+    imp.run(list(importer.TABLES), progress_interval=0.01)
+
+    assert storage.data == {block.hash_sync(): block.to_bytes() for block in blocks}
+    assert imp.mismatches == 0
+    assert checkpoints.is_done("send") and checkpoints.rows("send") == 5
+
+
+def test_import_resumes_from_checkpoint(tmp_path, source, blocks):
+    path = str(tmp_path / "checkpoint.json")
+    sends = sorted(
+        (block for block in blocks if isinstance(block, SendBlock)),
+        key=lambda block: block.hash_sync(),
+    )
+    importer.Checkpoints(path).save("send", sends[1].hash_sync(), 2)
+
+    storage = InMemoryStorage()
+    imp = importer.Importer(source, storage, importer.Checkpoints(path))
+    imp.run(["send"], progress_interval=0.01)
+
+    # Only the blocks after the checkpoint are imported
+    assert set(storage.data) == {block.hash_sync() for block in sends[2:]}
+    assert importer.Checkpoints(path).rows("send") == 5
+    assert os.path.exists(path)
+
+
+def test_import_builds_index(tmp_path, source, blocks):
+    storage = InMemoryStorage()
+    index = AccountIndex()
+    checkpoints = importer.Checkpoints(str(tmp_path / "checkpoint.json"))
+    imp = importer.Importer(source, storage, checkpoints, batch_size=2, index=index)
+    imp.run(list(importer.TABLES), progress_interval=0.01)
+
+    # The sends don't follow any of the open blocks, so every chain is an open block
+    for block in blocks[5:]:
+        assert index.account_info(block.account) == AccountInfo(
+            block.hash_sync(), block.hash_sync(), 1
+        )
+    assert index.block_height(blocks[0].hash_sync()) is None
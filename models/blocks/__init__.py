@@ -1,35 +1,39 @@
+from typing import Dict, Optional, Type
+
+from util.crypto import blake2b_hash
 from .block import Block, BlockType
 from .send import SendBlock
 from .change import ChangeBlock
 from .receive import ReceiveBlock
 from .open import OpenBlock
 
+BLOCK_CLASSES: Dict[BlockType, Type[Block]] = {
+    BlockType.SEND: SendBlock,
+    BlockType.RECEIVE: ReceiveBlock,
+    BlockType.OPEN: OpenBlock,
+    BlockType.CHANGE: ChangeBlock,
+}
+
 
 class BlockParser:
     @staticmethod
     def length(block_type: BlockType) -> int:
-        if block_type == BlockType.SEND:
-            return SendBlock.LENGTH
-        elif block_type == BlockType.RECEIVE:
-            return ReceiveBlock.LENGTH
-        elif block_type == BlockType.OPEN:
-            return OpenBlock.LENGTH
-        elif block_type == BlockType.CHANGE:
-            return ChangeBlock.LENGTH
-        else:
-            return 0
+        cls = BLOCK_CLASSES.get(block_type)
+        return cls.LENGTH if cls is not None else 0
 
     @staticmethod
-    def parse(block_type: BlockType, data: bytes) -> Block:
-        if block_type == BlockType.SEND:
-            return SendBlock.parse(data)
-        elif block_type == BlockType.RECEIVE:
-            return ReceiveBlock.parse(data)
-        elif block_type == BlockType.OPEN:
-            return OpenBlock.parse(data)
-        elif block_type == BlockType.CHANGE:
-            return ChangeBlock.parse(data)
-        else:
-            pass
+    def parse(
+        block_type: BlockType, data: bytes, block_hash: Optional[bytes] = None
+    ) -> Block:
+        cls = BLOCK_CLASSES.get(block_type)
+        if cls is None:
+            return Block(block_type)
+        return cls.parse(data, block_hash)
 
-        return Block(block_type)
+    @staticmethod
+    def block_hash(block_type: BlockType, data: bytes) -> bytes:
+        # The hash of a block from its undecoded data, without constructing the block
+        cls = BLOCK_CLASSES.get(block_type)
+        if cls is None or not cls.HASHED_LENGTH:
+            return bytes()
+        return blake2b_hash(data[: cls.HASHED_LENGTH])
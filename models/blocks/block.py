@@ -1,10 +1,12 @@
 import asyncio
 from enum import IntEnum
-from typing import List
+from typing import List, Optional, Tuple
 
 from util.crypto import (
     verify_pow_async,
     verify_signature_async,
+    blake2b_hash,
+    blake2b_async,
 )
 
 
@@ -17,28 +19,91 @@ class BlockType(IntEnum):
     CHANGE = 5
 
 
+# A field of a block, stored as a range of the block's wire data. Blocks keep the buffer they were
+# parsed from instead of one bytes object per field, and fields are sliced out when accessed.
+class Field:
+    __slots__ = ("start", "end", "hashed")
+
+    def __init__(self, start: int, end: int, hashed: bool = False):
+        self.start = start
+        self.end = end
+        self.hashed = hashed
+
+    def __get__(self, block: "Block", owner=None) -> bytes:
+        if block is None:
+            return self
+        return block._data[self.start : self.end]
+
+    def __set__(self, block: "Block", value: bytes):
+        assert (
+            len(value) == self.end - self.start
+        ), f"Invalid field length! Expected: {self.end - self.start}, actual: {len(value)}"
+        block._data = block._data[: self.start] + bytes(value) + block._data[self.end :]
+        if self.hashed:
+            block._hash = None
+
+
 class Block:
-    @classmethod
-    def parse(cls, data: bytes):
-        pass
+    __slots__ = ("block_type", "_data", "_hash")
+
+    BLOCK_TYPE = BlockType.INVALID
+    LENGTH = 0
+    # The block hash covers the first HASHED_LENGTH bytes of the block data
+    HASHED_LENGTH = 0
 
-    def __init__(self, block_type: BlockType):
-        self.work: bytes = bytes()
-        self.signature: bytes = bytes()
+    @classmethod
+    def parse(cls, data: bytes, block_hash: Optional[bytes] = None):
+        # Blocks must own their data. Parsing from a bytes object keeps it as is, views into a
+        # (possibly reused) receive buffer are copied once. block_hash can be given if the hash of
+        # the data is already known, so it isn't computed again.
+        if type(data) is not bytes:
+            data = bytes(data)
+        block = cls.__new__(cls)
+        Block.__init__(block, cls.BLOCK_TYPE, data)
+        block._hash = block_hash
+        return block
+
+    def __init__(self, block_type: BlockType, data: bytes = bytes()):
+        assert (
+            len(data) == self.LENGTH
+        ), f"Invalid data length! Expected: {self.LENGTH}, actual: {len(data)}"
         self.block_type: BlockType = block_type
+        self._data: bytes = data
+        self._hash: Optional[bytes] = None
 
     @property
-    def root(self) -> bytes:
+    def data(self) -> bytes:
+        # The block without the type byte, as it follows the header of a message
+        return self._data
+
+    @property
+    def work(self) -> bytes:
         return bytes()
 
-    def hash_sync(self):
+    @property
+    def signature(self) -> bytes:
         return bytes()
 
+    @property
+    def root(self) -> bytes:
+        return bytes()
+
+    def hash_sync(self) -> bytes:
+        if self._hash is None:
+            if not self.HASHED_LENGTH:
+                return bytes()
+            self._hash = blake2b_hash(memoryview(self._data)[: self.HASHED_LENGTH])
+        return self._hash
+
     def dependencies(self) -> List[bytes]:
         return []
 
-    async def hash(self):
-        return bytes()
+    async def hash(self) -> bytes:
+        if self._hash is None:
+            if not self.HASHED_LENGTH:
+                return bytes()
+            self._hash = await blake2b_async(self._data[: self.HASHED_LENGTH])
+        return self._hash
 
     async def verify(self):
         results = await asyncio.gather(
@@ -56,6 +121,17 @@ class Block:
             return await verify_signature_async(_hash, self.signature, self.account)
         return True
 
+    def signature_item(
+        self, account: Optional[bytes] = None
+    ) -> Tuple[bytes, bytes, bytes]:
+        # (hash, signature, public_key) triple as expected by verify_signatures_batch. Send, receive
+        # and change blocks don't contain their account, so it has to be given, see AccountIndex.
+        if account is None:
+            raise ValueError(
+                f"{self.block_type.name} block needs the account to verify"
+            )
+        return self.hash_sync(), self.signature, account
+
     async def verify_consistency(self):
         # Check that hashes it references exist.
         # Check that there is no conflicting transactions (branches)
@@ -64,7 +140,7 @@ class Block:
         return True
 
     def to_bytes(self) -> bytes:
-        return bytes([self.block_type.value])
+        return bytes([self.block_type.value]) + self._data
 
     def __str__(self) -> str:
         return f"<Block {self.block_type.name}>"
@@ -0,0 +1,81 @@
+import os
+import sys
+import time
+import tracemalloc
+
+from models.blocks import SendBlock
+from util.crypto import blake2b_hash
+
+
+# The block representation before blocks were slotted: one bytes object per field in the instance
+# __dict__ and no hash caching
+class LegacySendBlock:
+    @classmethod
+    def parse(cls, data: bytes):
+        previous = data[0:32]
+        destination = data[32:64]
+        balance = data[64:80]
+        signature = data[80:144]
+        work = data[144:152]
+        return cls(previous, destination, balance, signature, work)
+
+    def __init__(self, previous, destination, balance, signature, work):
+        self.previous = previous
+        self.destination = destination
+        self.balance = balance
+        self.signature = signature
+        self.work = work
+
+    def hash_sync(self):
+        return blake2b_hash(self.previous + self.destination + self.balance)
+
+
+def get_wire_data(n):
+    return [os.urandom(SendBlock.LENGTH) for _ in range(n)]
+
+
+def benchmark_memory(cls, wire_data):
+    tracemalloc.start()
+    blocks = [cls.parse(data) for data in wire_data]
+    size, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{cls.__name__}: {len(blocks)} blocks use {size / 1024 / 1024:.1f}MB, "
+        f"{size / len(blocks):.0f}B per block (excluding the wire data)"
+    )
+    return blocks
+
+
+def benchmark_parse(cls, wire_data):
+    s = time.time()
+    for data in wire_data:
+        cls.parse(data)
+    e = time.time()
+    print(
+        f"{cls.__name__}: parsed {len(wire_data)} blocks in {(e-s)*1000}ms, "
+        f"{(e-s)*1000000/len(wire_data)}us per"
+    )
+
+
+def benchmark_hash(blocks, hashes_per_block=3):
+    # A block is typically hashed by the message verification, the pipeline and as storage key
+    s = time.time()
+    for block in blocks:
+        for i in range(hashes_per_block):
+            block.hash_sync()
+    e = time.time()
+    print(
+        f"{type(blocks[0]).__name__}: hashed {len(blocks)} blocks {hashes_per_block} times in "
+        f"{(e-s)*1000}ms, {(e-s)*1000000/len(blocks)}us per block"
+    )
+
+
+if __name__ == "__main__":
+    n = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    wire_data = get_wire_data(n)
+
+    for cls in [LegacySendBlock, SendBlock]:
+        blocks = benchmark_memory(cls, wire_data)
+        benchmark_parse(cls, wire_data)
+        benchmark_hash(blocks)
+        del blocks
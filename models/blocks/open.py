@@ -1,56 +1,43 @@
-from typing import List
+from typing import List, Optional, Tuple
 
-from util.crypto import blake2b_hash, blake2b_async, verify_signature_async
-from .block import Block, BlockType
+from util.crypto import verify_signature_async
+from .block import Block, BlockType, Field
 
 
 class OpenBlock(Block):
-    LENGTH = 168
+    __slots__ = ()
 
-    @classmethod
-    def parse(cls, data: bytes):
-        assert (
-            len(data) == cls.LENGTH
-        ), f"Invalid data length! Expected: {cls.LENGTH}, actual: {len(data)}"
-        source = data[0:32]
-        representative = data[32:64]
-        account = data[64:96]
-        signature = data[96:160]
-        work = data[160:168]
+    BLOCK_TYPE = BlockType.OPEN
+    LENGTH = 168
+    HASHED_LENGTH = 96
 
-        return cls(source, representative, account, signature, work)
+    source = Field(0, 32, hashed=True)
+    representative = Field(32, 64, hashed=True)
+    account = Field(64, 96, hashed=True)
+    signature = Field(96, 160)
+    work = Field(160, 168)
 
     def __init__(self, source, representative, account, signature, work):
-        super(OpenBlock, self).__init__(BlockType.OPEN)
-        self.source = source
-        self.representative = representative
-        self.account = account
-        self.signature = signature
-        self.work = work
+        super(OpenBlock, self).__init__(
+            BlockType.OPEN,
+            b"".join([source, representative, account, signature, work]),
+        )
 
     @property
     def root(self):
         return self.account
 
-    def hash_sync(self):
-        return blake2b_hash(self.source + self.representative + self.account)
-
     def dependencies(self) -> List[bytes]:
+        # The genesis block opens the genesis account with the account itself as source
+        if self.source == self.account:
+            return []
         return [self.source]
 
+    def signature_item(
+        self, account: Optional[bytes] = None
+    ) -> Tuple[bytes, bytes, bytes]:
+        return self.hash_sync(), self.signature, self.account
+
     async def verify_signature(self):
         _hash = await self.hash()
         return await verify_signature_async(_hash, self.signature, self.account)
-
-    async def hash(self):
-        return await blake2b_async(self.source + self.representative + self.account)
-
-    def to_bytes(self) -> bytes:
-        return (
-            super(OpenBlock, self).to_bytes()
-            + self.source
-            + self.representative
-            + self.account
-            + self.signature
-            + self.work
-        )
\ No newline at end of file
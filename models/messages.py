@@ -1,10 +1,20 @@
 import asyncio
 from enum import IntEnum
-from typing import List, Optional
+from typing import TYPE_CHECKING, Container, Dict, List, Optional, Type
 
 from models.blocks import Block, BlockType, BlockParser
 from models.peer import Peer
-from util.crypto import verify_signature_async, blake2b_async
+from models.vote import Vote
+from util.crypto import verify_signature_async
+
+if TYPE_CHECKING:
+    from network.vote_verifier import VoteVerifier
+
+NETWORK_MAGIC = b"RC"
+# The header and the block type byte
+HEADER_LENGTH = 8
+# IPv6 address and port
+PEER_LENGTH = 18
 
 
 class MessageType(IntEnum):
@@ -33,7 +43,7 @@ class BulkPullAccountFlags(IntEnum):
 class Header:
     @classmethod
     def parse(cls, data: bytes):
-        magic = data[0:2]
+        magic = bytes(data[0:2])
         version_max = data[2]
         version_current = data[3]
         version_min = data[4]
@@ -58,7 +68,7 @@ class Header:
 
     @classmethod
     def default_header(cls, message_type: MessageType):
-        return cls(b"RC", 5, 5, 1, message_type, 0)
+        return cls(NETWORK_MAGIC, 5, 5, 1, message_type, 0)
 
     def to_bytes(self):
         return self.magic + bytes(
@@ -73,31 +83,74 @@ class Header:
 
 
 class Message:
+    # Messages are parsed from a memoryview of the received data, which must not change while the
+    # message is in use. An embedded block is only decoded when the block attribute is accessed,
+    # so messages that are dropped early never construct it. block_hash is computed from the raw
+    # block data.
     @classmethod
-    def parse(cls, header: Header, block_type: BlockType, data: bytes):
-        pass
+    def parse(cls, header: Header, block_type: BlockType, data: memoryview):
+        return cls(header, block_type)
 
     def __init__(self, header: Header, block_type: BlockType):
         self.header = header
         self.block_type = block_type
-        self.block: Optional[Block] = None
-
-    async def verify(self):
+        self._block: Optional[Block] = None
+        self._block_data: Optional[memoryview] = None
+        self._block_hash: Optional[bytes] = None
+
+    @property
+    def block(self) -> Optional[Block]:
+        if self._block is None and self._block_data is not None:
+            self._block = BlockParser.parse(
+                self.block_type, self._block_data, self._block_hash
+            )
+            self._block_data = None
+        return self._block
+
+    @block.setter
+    def block(self, block: Optional[Block]):
+        self._block = block
+        self._block_data = None
+        self._block_hash = None
+
+    def set_block_data(self, data: memoryview):
+        length = BlockParser.length(self.block_type)
+        if len(data) != length:
+            raise ValueError(
+                f"Invalid block length! Expected: {length}, actual: {len(data)}"
+            )
+        self._block = None
+        self._block_data = data
+        self._block_hash = None
+
+    @property
+    def block_hash(self) -> bytes:
+        if self._block is not None:
+            return self._block.hash_sync()
+        if self._block_hash is None and self._block_data is not None:
+            self._block_hash = BlockParser.block_hash(self.block_type, self._block_data)
+        return self._block_hash
+
+    async def verify(self, seen: Optional[Container[bytes]] = None):
+        # Blocks whose hash is in seen have been verified before, and are not verified again
         return self.header.verify()
 
+    async def verify_block(self, seen: Optional[Container[bytes]] = None):
+        if seen is not None and self.block_hash in seen:
+            return True
+        return await self.block.verify()
+
     def to_bytes(self):
         return self.header.to_bytes() + bytes([self.block_type.value])
 
 
 class KeepAliveMessage(Message):
     @classmethod
-    def parse(cls, header: Header, block_type: BlockType, data: bytes):
-        peers: List[Peer] = []
-        for i in range(0, len(data), 18):
-            ip = data[i : i + 18]
-            peers.append(Peer(ip))
-        # print(peers)
-        return cls(header, block_type, peers)
+    def parse(cls, header: Header, block_type: BlockType, data: memoryview):
+        # Peers are decoded when they are accessed
+        message = cls(header, block_type)
+        message._peer_data = data
+        return message
 
     def __init__(
         self,
@@ -112,7 +165,24 @@ class KeepAliveMessage(Message):
 
         super(KeepAliveMessage, self).__init__(header, block_type)
 
-        self.peers = peers
+        self._peers: Optional[List[Peer]] = peers
+        self._peer_data: Optional[memoryview] = None
+
+    @property
+    def peers(self) -> List[Peer]:
+        if self._peer_data is not None:
+            data = self._peer_data
+            self._peers = [
+                Peer(bytes(data[i : i + PEER_LENGTH]))
+                for i in range(0, len(data) - PEER_LENGTH + 1, PEER_LENGTH)
+            ]
+            self._peer_data = None
+        return self._peers
+
+    @peers.setter
+    def peers(self, peers: List[Peer]):
+        self._peers = peers
+        self._peer_data = None
 
     def to_bytes(self):
         # TODO: Add peers
@@ -121,9 +191,10 @@ class KeepAliveMessage(Message):
 
 class PublishMessage(Message):
     @classmethod
-    def parse(cls, header: Header, block_type: BlockType, data: bytes):
-        block: Block = BlockParser.parse(block_type, data)
-        return cls(header, block_type, block)
+    def parse(cls, header: Header, block_type: BlockType, data: memoryview):
+        message = cls(header, block_type)
+        message.set_block_data(data)
+        return message
 
     def __init__(
         self,
@@ -136,21 +207,22 @@ class PublishMessage(Message):
         super(PublishMessage, self).__init__(header, block_type)
         self.block = block
 
-    async def verify(self):
-        result = asyncio.gather(
-            super(PublishMessage, self).verify(), self.block.verify()
+    async def verify(self, seen: Optional[Container[bytes]] = None):
+        results = await asyncio.gather(
+            super(PublishMessage, self).verify(), self.verify_block(seen)
         )
-        return all(result)
+        return all(results)
 
     def to_bytes(self):
-        return super(PublishMessage, self).to_bytes() + self.block.to_bytes()
+        return super(PublishMessage, self).to_bytes() + self.block.data
 
 
 class ReqMessage(Message):
     @classmethod
-    def parse(cls, header: Header, block_type: BlockType, data: bytes):
-        block: Block = BlockParser.parse(block_type, data)
-        return cls(header, block_type, block)
+    def parse(cls, header: Header, block_type: BlockType, data: memoryview):
+        message = cls(header, block_type)
+        message.set_block_data(data)
+        return message
 
     def __init__(
         self,
@@ -163,27 +235,29 @@ class ReqMessage(Message):
         super(ReqMessage, self).__init__(header, block_type)
         self.block = block
 
-    async def verify(self):
-        result = asyncio.gather(super(ReqMessage, self).verify(), self.block.verify())
-        return all(result)
+    async def verify(self, seen: Optional[Container[bytes]] = None):
+        results = await asyncio.gather(
+            super(ReqMessage, self).verify(), self.verify_block(seen)
+        )
+        return all(results)
 
     def to_bytes(self):
-        return super(ReqMessage, self).to_bytes() + self.block.to_bytes()
+        return super(ReqMessage, self).to_bytes() + self.block.data
 
 
 class AckMessage(Message):
     @classmethod
-    def parse(cls, header: Header, block_type: BlockType, data: bytes):
-        # TODO: Create Vote class
-        vote = dict(account=data[0:32], signature=data[32:96], sequence=data[96:104])
-        block: Block = BlockParser.parse(block_type, data[104:])
-        return cls(header, block_type, vote, block)
+    def parse(cls, header: Header, block_type: BlockType, data: memoryview):
+        vote = Vote.parse(data[: Vote.LENGTH])
+        message = cls(header, block_type, vote)
+        message.set_block_data(data[Vote.LENGTH :])
+        return message
 
     def __init__(
         self,
         header: Header = None,
         block_type: BlockType = BlockType.INVALID,
-        vote=None,
+        vote: Optional[Vote] = None,
         block: Block = None,
     ):
         if header is None:
@@ -192,30 +266,39 @@ class AckMessage(Message):
         self.vote = vote
         self.block = block
 
-    async def verify_signature(self):
-        _hash = await blake2b_async(await self.block.hash() + self.vote["sequence"])
-        return await verify_signature_async(
-            _hash, self.vote["signature"], self.vote["account"]
-        )
+    async def verify_signature(self, votes: Optional["VoteVerifier"] = None):
+        # With a VoteVerifier, votes that were verified before are not checked again and the
+        # others are verified in batches
+        if votes is not None:
+            return await votes.verify(self.vote, self.block_hash)
+        _hash, signature, account = self.vote.signature_item(self.block_hash)
+        return await verify_signature_async(_hash, signature, account)
 
-    async def verify(self):
+    async def verify(
+        self,
+        seen: Optional[Container[bytes]] = None,
+        votes: Optional["VoteVerifier"] = None,
+    ):
+        # The vote signature is checked even if the block has been seen before
         results = await asyncio.gather(
             super(AckMessage, self).verify(),
-            self.block.verify(),
-            self.verify_signature(),
+            self.verify_block(seen),
+            self.verify_signature(votes),
         )
         return all(results)
 
     def to_bytes(self):
-        return super(AckMessage, self).to_bytes() + self.block.to_bytes()
+        return (
+            super(AckMessage, self).to_bytes() + self.vote.to_bytes() + self.block.data
+        )
 
 
 class FrontierReqMessage(Message):
     @classmethod
-    def parse(cls, header: Header, block_type: BlockType, data: bytes):
-        account = data[0:32]
-        age = data[32:36]
-        count = data[36:40]
+    def parse(cls, header: Header, block_type: BlockType, data: memoryview):
+        account = bytes(data[0:32])
+        age = bytes(data[32:36])
+        count = bytes(data[36:40])
         return cls(header, block_type, account, age, count)
 
     def __init__(
@@ -244,9 +327,9 @@ class FrontierReqMessage(Message):
 
 class BulkPullMessage(Message):
     @classmethod
-    def parse(cls, header: Header, block_type: BlockType, data: bytes):
-        start = data[0:32]
-        end = data[32:64]
+    def parse(cls, header: Header, block_type: BlockType, data: memoryview):
+        start = bytes(data[0:32])
+        end = bytes(data[32:64])
         return cls(header, block_type, start, end)
 
     def __init__(
@@ -266,23 +349,26 @@ class BulkPullMessage(Message):
         return super(BulkPullMessage, self).to_bytes() + self.start + self.end
 
 
+MESSAGE_TYPES: Dict[MessageType, Type[Message]] = {
+    MessageType.KEEPALIVE: KeepAliveMessage,
+    MessageType.PUBLISH: PublishMessage,
+    MessageType.CONFIRM_REQ: ReqMessage,
+    MessageType.CONFIRM_ACK: AckMessage,
+    MessageType.BULK_PULL: BulkPullMessage,
+    MessageType.FRONTIER_REQ: FrontierReqMessage,
+}
+
+
 class MessageParser:
     @staticmethod
     def parse(data: bytes) -> Message:
-        # print('parsing message..')
-        if len(data) < 8:
-            pass  # raise
-
-        header: Header = Header.parse(data[:7])
-        block_type: BlockType = BlockType(data[7])
-
-        if header.message_type == MessageType.KEEPALIVE:
-            return KeepAliveMessage.parse(header, block_type, data[8:])
-        elif header.message_type == MessageType.PUBLISH:
-            return PublishMessage.parse(header, block_type, data[8:])
-        elif header.message_type == MessageType.CONFIRM_REQ:
-            return ReqMessage.parse(header, block_type, data[8:])
-        elif header.message_type == MessageType.CONFIRM_ACK:
-            return AckMessage.parse(header, block_type, data[8:])
-
-        return Message(header, block_type)
+        # Nothing is copied here, message classes only copy the fields they decode
+        if len(data) < HEADER_LENGTH:
+            raise ValueError(f"Message too short: {len(data)} bytes")
+        view = memoryview(data)
+
+        header: Header = Header.parse(view)
+        block_type: BlockType = BlockType(view[7])
+
+        cls = MESSAGE_TYPES.get(header.message_type, Message)
+        return cls.parse(header, block_type, view[HEADER_LENGTH:])
@@ -0,0 +1,65 @@
+import pytest
+
+from models.blocks import BlockParser, BlockType, OpenBlock, SendBlock
+from util.crypto import blake2b_hash
+
+
+@pytest.fixture
+def send_block():
+    return SendBlock(
+        bytes([1] * 32), bytes([2] * 32), bytes([3] * 16), bytes(64), bytes(8)
+    )
+
+
+def test_parse_to_bytes_roundtrip(send_block):
+    data = send_block.to_bytes()
+    block = BlockParser.parse(BlockType(data[0]), data[1:])
+    assert block.to_bytes() == data
+    assert block.previous == bytes([1] * 32)
+    assert block.balance == bytes([3] * 16)
+
+
+def test_parse_copies_views(send_block):
+    buffer = bytearray(send_block.to_bytes())
+    block = BlockParser.parse(BlockType.SEND, memoryview(buffer)[1:])
+    buffer[1:33] = bytes(32)
+    assert block.previous == bytes([1] * 32)
+
+
+def test_blocks_have_no_dict(send_block):
+    assert not hasattr(send_block, "__dict__")
+
+
+def test_hash_is_cached(send_block):
+    expected = blake2b_hash(bytes([1] * 32) + bytes([2] * 32) + bytes([3] * 16))
+    assert send_block.hash_sync() == expected
+    assert send_block.hash_sync() is send_block.hash_sync()
+
+
+def test_setting_hashed_field_clears_hash(send_block):
+    old_hash = send_block.hash_sync()
+    send_block.work = bytes([9] * 8)
+    assert send_block.hash_sync() == old_hash
+
+    send_block.balance = bytes(16)
+    assert send_block.hash_sync() != old_hash
+    assert send_block.to_bytes()[65:81] == bytes(16)
+
+
+@pytest.mark.asyncio
+async def test_async_hash_matches_sync():
+    block = OpenBlock(bytes(32), bytes([1] * 32), bytes([2] * 32), bytes(64), bytes(8))
+    assert await block.hash() == blake2b_hash(
+        bytes(32) + bytes([1] * 32) + bytes([2] * 32)
+    )
+
+
+def test_open_block_dependencies():
+    account = bytes([4] * 32)
+    assert OpenBlock(
+        bytes([1] * 32), account, account, bytes(64), bytes(8)
+    ).dependencies() == [bytes([1] * 32)]
+    # The genesis block has no block to depend on
+    assert (
+        OpenBlock(account, account, account, bytes(64), bytes(8)).dependencies() == []
+    )
@@ -0,0 +1,80 @@
+import pytest
+
+from models.blocks import OpenBlock, SendBlock
+from models.messages import (
+    AckMessage,
+    BulkPullMessage,
+    Header,
+    KeepAliveMessage,
+    Message,
+    MessageParser,
+    MessageType,
+    PublishMessage,
+)
+
+
+@pytest.fixture
+def send_block():
+    return SendBlock(
+        bytes([1] * 32), bytes([2] * 32), bytes(16), bytes([3] * 64), bytes(8)
+    )
+
+
+def test_publish_block_is_decoded_lazily(send_block):
+    data = PublishMessage(block_type=send_block.block_type, block=send_block).to_bytes()
+    message = MessageParser.parse(data)
+
+    assert isinstance(message, PublishMessage)
+    assert message.block_hash == send_block.hash_sync()
+    assert message._block is None
+
+    assert message.block.to_bytes() == send_block.to_bytes()
+    assert type(message.block.data) is bytes
+    assert message.to_bytes() == data
+
+
+def test_ack_message_parse(send_block):
+    vote = bytes([4] * 32) + bytes([5] * 64) + bytes([6] * 8)
+    data = (
+        Header.default_header(MessageType.CONFIRM_ACK).to_bytes()
+        + bytes([send_block.block_type.value])
+        + vote
+        + send_block.data
+    )
+    message = MessageParser.parse(data)
+
+    assert isinstance(message, AckMessage)
+    assert message.vote.account == bytes([4] * 32)
+    assert message.vote.sequence == bytes([6] * 8)
+    assert message.to_bytes() == data
+    assert message.block_hash == send_block.hash_sync()
+
+
+def test_keepalive_peers(send_block):
+    peer = bytes(10) + bytes([255, 255, 127, 0, 0, 1]) + (7075).to_bytes(2, "little")
+    data = KeepAliveMessage().to_bytes() + peer * 2
+    message = MessageParser.parse(data)
+
+    assert len(message.peers) == 2
+    assert message.peers[0].to_tuple() == ("::ffff:7f00:1", 7075)
+
+
+def test_parse_rejects_invalid_messages(send_block):
+    data = PublishMessage(block_type=send_block.block_type, block=send_block).to_bytes()
+    with pytest.raises(ValueError):
+        MessageParser.parse(data[:5])
+    with pytest.raises(ValueError):
+        MessageParser.parse(data[:-1])
+
+    # An open block type with send block data
+    with pytest.raises(ValueError):
+        MessageParser.parse(data[:7] + bytes([OpenBlock.BLOCK_TYPE.value]) + data[8:])
+
+
+def test_parse_table_dispatch():
+    message = MessageParser.parse(BulkPullMessage(start=bytes([1] * 32)).to_bytes())
+    assert isinstance(message, BulkPullMessage)
+    assert message.start == bytes([1] * 32)
+
+    data = Header.default_header(MessageType.TELEMETRY_REQ).to_bytes() + bytes(1)
+    assert type(MessageParser.parse(data)) is Message
@@ -0,0 +1,44 @@
+from typing import Tuple
+
+from util.crypto import blake2b_hash
+
+
+class Vote:
+    # A representative's vote for a block, as it precedes the block in a confirm_ack message
+    __slots__ = ("account", "signature", "sequence")
+
+    LENGTH = 104
+
+    @classmethod
+    def parse(cls, data: bytes):
+        account = bytes(data[0:32])
+        signature = bytes(data[32:96])
+        sequence = bytes(data[96:104])
+        return cls(account, signature, sequence)
+
+    def __init__(self, account: bytes, signature: bytes, sequence: bytes):
+        self.account = account
+        self.signature = signature
+        self.sequence = sequence
+
+    def vote_hash(self, block_hash: bytes) -> bytes:
+        # The signed message
+        return blake2b_hash(block_hash + self.sequence)
+
+    def signature_item(self, block_hash: bytes) -> Tuple[bytes, bytes, bytes]:
+        # (hash, signature, public_key) triple as expected by verify_signatures_batch
+        return self.vote_hash(block_hash), self.signature, self.account
+
+    def cache_key(self, block_hash: bytes) -> bytes:
+        # Identifies the vote independent of the message it arrived in. The signature is part of
+        # it, so a cached vote only vouches for copies carrying the signature that was checked.
+        return self.account + block_hash + self.sequence + self.signature
+
+    def to_bytes(self) -> bytes:
+        return self.account + self.signature + self.sequence
+
+    def __str__(self):
+        return f"<Vote {self.account.hex()}, sequence:{self.sequence.hex()}>"
+
+    def __repr__(self):
+        return str(self)
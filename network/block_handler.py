@@ -1,86 +1,412 @@
 import asyncio
+import json
 import logging
-from asyncio import Queue
-from typing import List
+import time
+from asyncio import Queue, QueueFull
+from enum import Enum
+from typing import Dict, List, Optional, Tuple
 
-from models.blocks import Block
+from models.blocks import Block, BlockType
+from network.dependency_registry import DependencyRegistry
+from network.metrics import StageMetrics
+from network.seen_filter import RecentlySeen
+from network.sharded_queue import ShardedQueue
+from storage.account_index import AccountIndex
 from storage.storage import Storage
+from util.crypto import (
+    POW_THRESHOLD,
+    verify_signatures_batch_async,
+    verify_pow_batch_async,
+)
+
+
+async def get_batch(queue: Queue, max_size: int, timeout: float = 0) -> List:
+    # Waits for at least one item, then drains whatever else is already queued. With a timeout,
+    # keeps waiting for more items until the batch is full or the timeout has passed.
+    items = [await queue.get()]
+    deadline = asyncio.get_event_loop().time() + timeout
+    while len(items) < max_size:
+        if not queue.empty():
+            items.append(queue.get_nowait())
+            continue
+
+        remaining = deadline - asyncio.get_event_loop().time()
+        if remaining <= 0:
+            break
+        try:
+            items.append(await asyncio.wait_for(queue.get(), remaining))
+        except asyncio.TimeoutError:
+            break
+    return items
+
+
+class OverloadPolicy(Enum):
+    # What to do with a block from the network when the first stage is full
+    DROP_NEWEST = "drop_newest"
+    DROP_OLDEST = "drop_oldest"
 
 
 class BlockHandler:
-    def __init__(self, storage: Storage):
-        self.pow_queue: Queue = Queue()
-        self.dep_queue: Queue = Queue()
-        self.signature_queue: Queue = Queue()
-        self.storage_queue: Queue = Queue()
-        self.unresolved_queue: Queue = Queue()
+    def __init__(
+        self,
+        storage: Storage,
+        pow_batch_size: int = 16384,
+        signature_batch_size: int = 256,
+        dependency_capacity: int = 100000,
+        storage_batch_size: int = 1024,
+        storage_batch_timeout: float = 0.05,
+        pow_queue_size: int = 16384,
+        dep_queue_size: int = 4096,
+        signature_queue_size: int = 4096,
+        storage_queue_size: int = 4096,
+        overload_policy: OverloadPolicy = OverloadPolicy.DROP_NEWEST,
+        pow_workers: int = 1,
+        dep_workers: int = 1,
+        signature_workers: int = 1,
+        metrics_interval: float = 0,
+        recently_seen_capacity: int = 200000,
+        pow_threshold: int = POW_THRESHOLD,
+        account_index: Optional[AccountIndex] = None,
+    ):
+        # The queues are bounded, so a full stage makes the stage before it wait. Producers that
+        # await handle_block are slowed down the same way.
+        # Each stage has one queue shard per worker. Blocks are routed by chain, see chain_key.
+        self.pow_queue = ShardedQueue(pow_workers, pow_queue_size)
+        self.dep_queue = ShardedQueue(dep_workers, dep_queue_size)
+        self.signature_queue = ShardedQueue(signature_workers, signature_queue_size)
+        # Group commits need a single writer
+        self.storage_queue = ShardedQueue(1, storage_queue_size)
+        # Routing keys of the blocks in the pipeline, by block hash
+        self.chain_keys: Dict[bytes, bytes] = {}
+        # Blocks waiting for dependencies that are not committed yet
+        self.dependency_registry = DependencyRegistry(dependency_capacity)
+        # Hashes of recently committed blocks. Only blocks that passed verification are added,
+        # so an invalid copy of a block can't keep the valid one out.
+        self.recently_seen = RecentlySeen(recently_seen_capacity)
+        # Blocks released from the registry, on their way back to the dependency queue. This queue
+        # can't be bounded since the storage stage must never wait for the dependency stage, but
+        # it never holds more blocks than the registry.
+        self.release_queue: Queue = Queue()
+        # Accounts of the blocks that passed the signature check and are queued for storage, by
+        # block hash. Blocks depending on them, or on the previous block of their chain ahead of
+        # them in the pipeline, don't wait for the commit, so a chain arriving at once is
+        # committed in a few large batches rather than one batch per block.
+        self.accepted: Dict[bytes, bytes] = {}
+        self.overload_policy = overload_policy
 
-        self.pow_consumer = None
-        self.dep_consumer = None
-        self.signature_consumer = None
+        self.consumers: List[asyncio.Future] = []
 
-        self.invalid_pow_count = 0
-        self.invalid_signature_count = 0
+        self.metrics: Dict[str, StageMetrics] = {
+            name: StageMetrics(name) for name in ["pow", "dep", "signature", "storage"]
+        }
+        # Seconds between metrics dumps, 0 to disable them
+        self.metrics_interval = metrics_interval
+        self.dropped_count = 0
+        # Duplicates of blocks that were still in the pipeline or parked
+        self.pipeline_duplicate_count = 0
+
+        # Batches above POW_PROCESS_BATCH_SIZE are split across processes, which only happens when
+        # a backlog has built up in the queue
+        self.pow_batch_size = pow_batch_size
+        # Lower thresholds are for test networks and benchmarks
+        self.pow_threshold = pow_threshold
+        self.signature_batch_size = signature_batch_size
+        self.storage_batch_size = storage_batch_size
+        self.storage_batch_timeout = storage_batch_timeout
 
         self.storage = storage
+        # Updated with every committed batch. Also gives the account of send, receive and change
+        # blocks for the signature check, since their previous block is always committed first.
+        self.account_index = (
+            account_index if account_index is not None else AccountIndex()
+        )
 
     async def start(self):
-        self.pow_consumer: asyncio.Future = asyncio.ensure_future(
-            self.consume_pow_queue()
-        )
-        self.dep_consumer: asyncio.Future = asyncio.ensure_future(
-            self.consume_dep_queue()
-        )
-        self.signature_consumer: asyncio.Future = asyncio.ensure_future(
-            self.consume_signature_queue()
+        coroutines = (
+            [self.consume_pow_queue(queue) for queue in self.pow_queue.queues]
+            + [self.consume_dep_queue(queue) for queue in self.dep_queue.queues]
+            + [
+                self.consume_signature_queue(queue)
+                for queue in self.signature_queue.queues
+            ]
+            + [self.consume_storage_queue(), self.consume_release_queue()]
         )
+        if self.metrics_interval:
+            coroutines.append(self.dump_metrics())
+        self.consumers = [asyncio.ensure_future(coro) for coro in coroutines]
 
     async def stop(self):
-        await asyncio.gather(
-            self.pow_queue.join(),
-            self.signature_queue.join(),
-            # Storage queue is not consumed yet, so it shouldn't be joined
-            # self.storage_queue.join(),
-        )
-        self.pow_consumer.cancel()
-        self.dep_consumer.cancel()
-        self.signature_consumer.cancel()
+        # Each stage feeds the next one, so they are drained in pipeline order. Committing blocks
+        # can release parked blocks back into the dependency queue, so repeat until all are empty.
+        queues = [
+            self.pow_queue,
+            self.dep_queue,
+            self.signature_queue,
+            self.storage_queue,
+            self.release_queue,
+        ]
+        while True:
+            for queue in queues:
+                await queue.join()
+            if all(queue.empty() for queue in queues):
+                break
+        for consumer in self.consumers:
+            consumer.cancel()
+
+    @property
+    def invalid_pow_count(self) -> int:
+        return self.metrics["pow"].invalid
+
+    @property
+    def invalid_signature_count(self) -> int:
+        return self.metrics["signature"].invalid
 
-    async def handle_block(self, block: Block):
-        return await self.pow_queue.put(block)
+    def metrics_snapshot(self) -> Dict:
+        queues = {
+            "pow": self.pow_queue,
+            "dep": self.dep_queue,
+            "signature": self.signature_queue,
+            "storage": self.storage_queue,
+        }
+        return {
+            "stages": {
+                name: metrics.snapshot(queues[name].queues)
+                for name, metrics in self.metrics.items()
+            },
+            "dropped": self.dropped_count,
+            "duplicates": {
+                "recently_seen_hits": self.recently_seen.hits,
+                "recently_seen_misses": self.recently_seen.misses,
+                "in_pipeline": self.pipeline_duplicate_count,
+            },
+            "dependency_registry": {
+                "size": len(self.dependency_registry),
+                "parked": self.dependency_registry.parked_count,
+                "released": self.dependency_registry.released_count,
+                "evicted": self.dependency_registry.evicted_count,
+            },
+        }
 
-    async def consume_pow_queue(self):
+    async def dump_metrics(self):
         while True:
-            block: Block = await self.pow_queue.get()
-            valid = await block.verify_pow()
-            if valid:
-                await self.dep_queue.put(block)
+            await asyncio.sleep(self.metrics_interval)
+            print(json.dumps(self.metrics_snapshot()))
+
+    def chain_key(self, block: Block) -> bytes:
+        # Blocks of the same account chain must leave the pipeline in order, so they are routed to
+        # the same worker in every stage. Send, receive and change blocks don't contain their
+        # account, so a block gets the key of its previous block if that is still in the
+        # pipeline. Otherwise the previous block has been committed already (or hasn't arrived),
+        # and the block starts a new key.
+        block_hash = block.hash_sync()
+        key = self.chain_keys.get(block_hash)
+        if key is None:
+            if block.block_type == BlockType.OPEN:
+                key = block.account
             else:
-                self.invalid_pow_count += 1
-            self.pow_queue.task_done()
+                key = self.chain_keys.get(block.root, block.root)
+            self.chain_keys[block_hash] = key
+        return key
+
+    def leave_pipeline(self, block: Block):
+        self.chain_keys.pop(block.hash_sync(), None)
+
+    def is_duplicate(self, block: Block) -> bool:
+        return self.is_duplicate_hash(block.hash_sync())
+
+    def is_duplicate_hash(self, block_hash: bytes) -> bool:
+        # Only needs the block hash, so duplicates are dropped before any PoW or signature checks
+        if block_hash in self.chain_keys or block_hash in self.dependency_registry:
+            self.pipeline_duplicate_count += 1
+            return True
+        return self.recently_seen.check(block_hash)
+
+    async def handle_block(self, block: Block) -> bool:
+        # Waits while the pipeline is full. Returns whether the block was queued.
+        if self.is_duplicate(block):
+            return False
+        await self.pow_queue.put(block, self.chain_key(block))
+        return True
+
+    def handle_block_nowait(
+        self, block: Block, checked_duplicate: bool = False
+    ) -> bool:
+        # For blocks from the network, where waiting would only delay other messages. If the
+        # pipeline is full a block is dropped according to the overload policy. Returns whether
+        # the block was queued. checked_duplicate skips the duplicate check for callers that
+        # already did it with is_duplicate_hash, so every block is counted once.
+        if not checked_duplicate and self.is_duplicate(block):
+            return False
 
-    async def consume_dep_queue(self):
+        key = self.chain_key(block)
+        queue = self.pow_queue.shard(key)
+        try:
+            queue.put_nowait(block)
+            return True
+        except QueueFull:
+            pass
+
+        self.dropped_count += 1
+        if self.overload_policy == OverloadPolicy.DROP_OLDEST:
+            self.leave_pipeline(queue.get_nowait())
+            queue.task_done()
+            queue.put_nowait(block)
+            return True
+        self.leave_pipeline(block)
+        return False
+
+    def block_committed(self, block_hash: bytes):
+        # Blocks that were only waiting for this block go through the dependency check again
+        for block in self.dependency_registry.release(block_hash):
+            self.release_queue.put_nowait(block)
+
+    async def consume_pow_queue(self, queue: Queue):
+        while True:
+            blocks: List[Block] = await get_batch(queue, self.pow_batch_size)
+            s = time.monotonic()
+            results = await verify_pow_batch_async(
+                [(block.root, block.work) for block in blocks],
+                threshold=self.pow_threshold,
+            )
+            self.metrics["pow"].record_batch(len(blocks), time.monotonic() - s)
+            for block, valid in zip(blocks, results):
+                if valid:
+                    await self.dep_queue.put(block, self.chain_key(block))
+                else:
+                    self.metrics["pow"].invalid += 1
+                    self.leave_pipeline(block)
+                queue.task_done()
+
+    async def consume_release_queue(self):
+        while True:
+            block: Block = await self.release_queue.get()
+            await self.dep_queue.put(block, self.chain_key(block))
+            self.release_queue.task_done()
+
+    async def consume_dep_queue(self, queue: Queue):
         while True:
-            block: Block = await self.dep_queue.get()
+            block: Block = await queue.get()
+            s = time.monotonic()
             deps: List[bytes] = block.dependencies()
+            # A previous block with the same chain key entered the pipeline first, and every stage
+            # keeps the order of a chain, so it is checked and committed before this block. If it
+            # is rejected, this block is rejected by the signature stage for lack of an account.
+            key = self.chain_key(block)
+            ahead = block.root if self.chain_keys.get(block.root) == key else None
 
-            all_exist = all(
-                [val is not None for val in self.storage.bulk_get(deps).values()]
-            )
+            missing = [
+                dep
+                for dep, val in self.storage.bulk_get(deps).items()
+                if val is None and dep not in self.accepted and dep != ahead
+            ]
+            self.metrics["dep"].record_batch(1, time.monotonic() - s)
 
-            if all_exist:
-                await self.signature_queue.put(block)
+            if not missing:
+                await self.signature_queue.put(block, key)
             else:
-                pass
-                # Need to add block to a dependency registry so that it can be processed later
-            self.dep_queue.task_done()
+                self.dependency_registry.park(block, missing)
+                self.metrics["dep"].parked += 1
+                self.leave_pipeline(block)
+            queue.task_done()
 
-    async def consume_signature_queue(self):
-        while True:
-            block: Block = await self.signature_queue.get()
-            valid = await block.verify_signature()
-            if valid:
-                await self.storage_queue.put(block)
+    def block_accounts(self, blocks: List[Block]) -> List[Optional[bytes]]:
+        # Open blocks contain their account, the others have the account of their previous block,
+        # which is indexed, accepted and waiting to be committed, or earlier in blocks. None if
+        # the previous block is unknown, as after a fork.
+        heights = self.account_index.bulk_block_heights(
+            [
+                block.root
+                for block in blocks
+                if block.block_type != BlockType.OPEN
+                and block.root not in self.accepted
+            ]
+        )
+        accounts = []
+        batch_accounts: Dict[bytes, Optional[bytes]] = {}
+        for block in blocks:
+            if block.block_type == BlockType.OPEN:
+                account = block.account
+            elif block.root in batch_accounts:
+                account = batch_accounts[block.root]
+            elif block.root in self.accepted:
+                account = self.accepted[block.root]
             else:
-                self.invalid_signature_count += 1
-            self.signature_queue.task_done()
+                height = heights.get(block.root)
+                account = height.account if height is not None else None
+            batch_accounts[block.hash_sync()] = account
+            accounts.append(account)
+        return accounts
+
+    def signature_items(
+        self, blocks: List[Block], accounts: List[Optional[bytes]]
+    ) -> List[Optional[Tuple[bytes, bytes, bytes]]]:
+        # None for blocks that can't be verified, which are rejected: blocks without an account and
+        # blocks without a signature. Nothing here may raise, an exception would end the stage's
+        # consumer.
+        items = []
+        for block, account in zip(blocks, accounts):
+            try:
+                items.append(
+                    block.signature_item(account) if account is not None else None
+                )
+            except (NotImplementedError, ValueError):
+                logging.warning(f"Can't verify the signature of {block}")
+                items.append(None)
+        return items
+
+    async def consume_signature_queue(self, queue: Queue):
+        while True:
+            blocks: List[Block] = await get_batch(queue, self.signature_batch_size)
+            s = time.monotonic()
+            accounts = self.block_accounts(blocks)
+            items = self.signature_items(blocks, accounts)
+            verified = iter(
+                await verify_signatures_batch_async([i for i in items if i is not None])
+            )
+            results = [item is not None and next(verified) for item in items]
+            self.metrics["signature"].record_batch(len(blocks), time.monotonic() - s)
+            rejected = set()
+            for block, account, valid in zip(blocks, accounts, results):
+                # The account of a block following a rejected block of the batch is not known
+                if valid and block.root in rejected:
+                    valid = False
+                if valid:
+                    await self.storage_queue.put(block, self.chain_key(block))
+                    # Only once the block is queued, so it is committed before or together with
+                    # the blocks that depend on it
+                    self.accepted[block.hash_sync()] = account
+                else:
+                    rejected.add(block.hash_sync())
+                    self.metrics["signature"].invalid += 1
+                    self.leave_pipeline(block)
+                queue.task_done()
+
+    async def consume_storage_queue(self):
+        # Blocks are committed in groups, so the per-write cost of the storage backend is paid
+        # once per batch instead of once per block
+        queue = self.storage_queue.queues[0]
+        while True:
+            blocks: List[Block] = await get_batch(
+                queue, self.storage_batch_size, self.storage_batch_timeout
+            )
+            s = time.monotonic()
+            # Index records are written with the blocks, in one transaction where the storage
+            # supports it, and before the blocks are committed, which releases the blocks that
+            # follow them
+            _, index_writes = self.account_index.index_writes(blocks)
+            self.storage.bulk_put_tables(
+                [
+                    (
+                        self.storage,
+                        {block.hash_sync(): block.to_bytes() for block in blocks},
+                    )
+                ]
+                + index_writes
+            )
+            self.metrics["storage"].record_batch(len(blocks), time.monotonic() - s)
+            for block in blocks:
+                self.accepted.pop(block.hash_sync(), None)
+                self.leave_pipeline(block)
+                self.recently_seen.add(block.hash_sync())
+                self.block_committed(block.hash_sync())
+                queue.task_done()
@@ -0,0 +1,112 @@
+import asyncio
+from collections import deque
+from typing import Deque, Iterable, List, Optional, Tuple
+
+from storage.account_index import AccountIndex
+
+
+class PullRequest:
+    __slots__ = ("account", "head", "end", "attempts")
+
+    def __init__(self, account: bytes, head: bytes, end: bytes = bytes(32)):
+        self.account = account
+        self.head = head
+        # Pull blocks from head down to (but not including) end. Zero means the whole chain.
+        self.end = end
+        self.attempts = 0
+
+    def __str__(self):
+        return f"<PullRequest {self.account.hex()}, attempts:{self.attempts}>"
+
+    def __repr__(self):
+        return str(self)
+
+
+class BootstrapScheduler:
+    # Hands out bulk pulls to any number of connection workers from one shared queue. Failed
+    # pulls are retried with exponential backoff until max_attempts is reached.
+    def __init__(
+        self,
+        pulls: Iterable[PullRequest],
+        max_attempts: int = 5,
+        backoff: float = 0.5,
+        max_backoff: float = 30.0,
+    ):
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+
+        self.queue: Deque[PullRequest] = deque()
+        # Pulls that are queued, in progress or waiting to be retried
+        self.outstanding = 0
+
+        self.completed_count = 0
+        self.retry_count = 0
+        self.failed: List[PullRequest] = []
+
+        self._wakeup = asyncio.Event()
+
+        for pull in pulls:
+            self.add(pull)
+
+    def add(self, pull: PullRequest):
+        self.outstanding += 1
+        self._enqueue(pull)
+
+    def _enqueue(self, pull: PullRequest):
+        self.queue.append(pull)
+        self._wakeup.set()
+
+    async def next_pull(self) -> Optional[PullRequest]:
+        # Returns None when all pulls have completed or failed
+        while True:
+            if len(self.queue):
+                return self.queue.popleft()
+
+            if self.outstanding == 0:
+                return None
+
+            # Pulls are still in progress or waiting for a retry, and may come back
+            self._wakeup.clear()
+            await self._wakeup.wait()
+
+    def complete(self, pull: PullRequest):
+        self.completed_count += 1
+        self._done()
+
+    def retry(self, pull: PullRequest):
+        pull.attempts += 1
+        if pull.attempts >= self.max_attempts:
+            self.failed.append(pull)
+            self._done()
+            return
+
+        self.retry_count += 1
+        delay = min(self.backoff * 2 ** (pull.attempts - 1), self.max_backoff)
+        asyncio.get_event_loop().call_later(delay, self._enqueue, pull)
+
+    def _done(self):
+        self.outstanding -= 1
+        if self.outstanding == 0:
+            self._wakeup.set()
+
+
+def diff_frontiers(
+    frontiers: List[Tuple[bytes, bytes]], index: AccountIndex
+) -> List[PullRequest]:
+    # Returns pulls for the accounts whose frontier we don't have. If we have an older head of the
+    # account chain, only the blocks after it are pulled. Both take one batched index lookup.
+    have_frontier = index.bulk_block_heights([head for _, head in frontiers])
+    missing = [
+        (account, head) for account, head in frontiers if have_frontier[head] is None
+    ]
+
+    local = index.bulk_account_info([account for account, _ in missing])
+    pulls = []
+    for account, head in missing:
+        info = local[account]
+        if info is not None:
+            pulls.append(PullRequest(account, head, end=info.head))
+        else:
+            pulls.append(PullRequest(account, head))
+    return pulls
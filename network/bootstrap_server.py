@@ -0,0 +1,188 @@
+import asyncio
+from collections import deque
+from typing import Deque, Iterator, Optional
+
+from models.blocks import BlockType
+from models.messages import (
+    HEADER_LENGTH,
+    FrontierReqMessage,
+    Message,
+    MessageParser,
+    MessageType,
+)
+from network.udp import check_header
+from storage.account_index import AccountIndex
+from storage.storage import Storage
+
+# Length of the requests after the header
+REQUEST_LENGTHS = {
+    MessageType.FRONTIER_REQ: 40,
+    MessageType.BULK_PULL: 64,
+}
+# Responses are collected into writes of about this size
+WRITE_SIZE = 64 * 1024
+# Frontiers, or blocks of a chain, read from storage at a time
+SCAN_SIZE = 1024
+
+FRONTIERS_END = bytes(64)
+BULK_PULL_END = bytes([BlockType.NOT_A_BLOCK.value])
+
+
+def frontier_response(
+    index: AccountIndex,
+    start: bytes = bytes(32),
+    count: int = 0xFFFFFFFF,
+    write_size: int = WRITE_SIZE,
+) -> Iterator[bytes]:
+    # Yields the (account, head) pairs of up to count accounts from start on, in ascending account
+    # order, as writes of about write_size
+    buffer = bytearray()
+    while count > 0:
+        items = index.frontiers(start, min(SCAN_SIZE, count))
+        for account, head in items:
+            buffer += account
+            buffer += head
+            if len(buffer) >= write_size:
+                yield bytes(buffer)
+                buffer.clear()
+        if len(items) < SCAN_SIZE:
+            break
+        count -= len(items)
+        # The smallest key after the last account
+        start = items[-1][0] + bytes(1)
+    buffer += FRONTIERS_END
+    yield bytes(buffer)
+
+
+def bulk_pull_response(
+    blocks: Storage,
+    index: AccountIndex,
+    start: bytes,
+    end: bytes = bytes(32),
+    write_size: int = WRITE_SIZE,
+) -> Iterator[bytes]:
+    # Yields the chain newest first from start, which is an account or a block hash, until the
+    # open block or the block after end. If end is not in the chain, the whole chain is sent.
+    # The heights of start and end give the block hashes from the index, which are read in large
+    # batches instead of one previous hash at a time.
+    info = index.account_info(start)
+    if info is not None:
+        account, high = start, info.block_count
+    else:
+        height = index.block_height(start)
+        account, high = height if height is not None else (None, 0)
+    low = 1
+    if account is not None and end != bytes(32):
+        height = index.block_height(end)
+        if height is not None and height.account == account and height.height <= high:
+            low = height.height + 1
+
+    # Stored values are the block type byte followed by the block, which is also how blocks are
+    # sent
+    buffer = bytearray()
+    while high >= low:
+        page_low = max(low, high - SCAN_SIZE + 1)
+        hashes = index.chain_hashes(account, page_low, high)
+        values = blocks.bulk_get(hashes)
+        # Blocks are indexed as they are committed, so this only stops on a damaged ledger
+        if len(hashes) <= high - page_low or any(v is None for v in values.values()):
+            break
+        for block_hash in reversed(hashes):
+            buffer += values[block_hash]
+            if len(buffer) >= write_size:
+                yield bytes(buffer)
+                buffer.clear()
+        high = page_low - 1
+    buffer += BULK_PULL_END
+    yield bytes(buffer)
+
+
+class BootstrapServerProtocol(asyncio.Protocol):
+    # Serves frontier_req and bulk_pull from our ledger. Requests on a connection are answered in
+    # order. Responses are generated a write at a time: one write per event loop iteration, and
+    # none while the transport has paused writing, so a slow client never makes us buffer more
+    # than about one write beyond the transport's high water mark.
+    def __init__(
+        self, blocks: Storage, index: AccountIndex, write_size: int = WRITE_SIZE
+    ):
+        self.blocks = blocks
+        self.index = index
+        self.write_size = write_size
+        self.transport: Optional[asyncio.Transport] = None
+        self.buffer = bytearray()
+        self.requests: Deque[Message] = deque()
+        self.response: Optional[Iterator[bytes]] = None
+        self.paused = False
+        # Whether a call to write_next is scheduled
+        self.scheduled = False
+        self.bytes_sent = 0
+
+    def connection_made(self, transport: asyncio.Transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        self.transport = None
+        self.requests.clear()
+        self.response = None
+
+    def data_received(self, data: bytes):
+        self.buffer += data
+        while len(self.buffer) >= HEADER_LENGTH:
+            if not check_header(self.buffer[:HEADER_LENGTH]):
+                print("invalid request header, closing connection")
+                self.transport.close()
+                return
+            message_type = MessageType(self.buffer[5])
+            length = REQUEST_LENGTHS.get(message_type)
+            if length is None:
+                print(f"unsupported request {message_type.name}, closing connection")
+                self.transport.close()
+                return
+            if len(self.buffer) < HEADER_LENGTH + length:
+                break
+            self.requests.append(
+                MessageParser.parse(bytes(self.buffer[: HEADER_LENGTH + length]))
+            )
+            del self.buffer[: HEADER_LENGTH + length]
+        self.schedule()
+
+    def pause_writing(self):
+        self.paused = True
+
+    def resume_writing(self):
+        self.paused = False
+        self.schedule()
+
+    def schedule(self):
+        if not self.scheduled and not self.paused and self.transport is not None:
+            self.scheduled = True
+            asyncio.get_event_loop().call_soon(self.write_next)
+
+    def write_next(self):
+        self.scheduled = False
+        if self.paused or self.transport is None:
+            return
+        while self.response is None:
+            if not self.requests:
+                return
+            self.response = self.respond(self.requests.popleft())
+
+        data = next(self.response, None)
+        if data is None:
+            self.response = None
+        else:
+            self.bytes_sent += len(data)
+            # Writing may pause the transport, which stops the response until it resumes
+            self.transport.write(data)
+        self.schedule()
+
+    def respond(self, message: Message) -> Iterator[bytes]:
+        if isinstance(message, FrontierReqMessage):
+            # Block times are not stored, so the age limit is ignored
+            count = int.from_bytes(message.count, byteorder="little")
+            return frontier_response(
+                self.index, message.account, count, self.write_size
+            )
+        return bulk_pull_response(
+            self.blocks, self.index, message.start, message.end, self.write_size
+        )
@@ -0,0 +1,66 @@
+from collections import OrderedDict
+from typing import Dict, List, Set, Tuple
+
+from models.blocks import Block
+
+
+class DependencyRegistry:
+    # Holds blocks that can't be processed until their missing dependencies are committed. Blocks
+    # are indexed by each missing dependency hash, so committing a block releases its dependents
+    # in O(1). At most capacity blocks are held (roughly capacity * 250B of memory); when full, the
+    # oldest block is evicted to make room.
+    def __init__(self, capacity: int = 100000):
+        self.capacity = capacity
+        # block hash -> (block, hashes of its missing dependencies), oldest first
+        self.blocks: "OrderedDict[bytes, Tuple[Block, Set[bytes]]]" = OrderedDict()
+        # missing dependency hash -> hashes of the blocks waiting for it
+        self.dependents: Dict[bytes, Set[bytes]] = {}
+
+        self.parked_count = 0
+        self.released_count = 0
+        self.evicted_count = 0
+
+    def __len__(self):
+        return len(self.blocks)
+
+    def __contains__(self, block_hash: bytes):
+        return block_hash in self.blocks
+
+    def park(self, block: Block, missing: List[bytes]):
+        block_hash = block.hash_sync()
+        if block_hash in self.blocks:
+            return
+
+        if len(self.blocks) >= self.capacity:
+            self.evict_oldest()
+
+        self.blocks[block_hash] = (block, set(missing))
+        for dependency in missing:
+            self.dependents.setdefault(dependency, set()).add(block_hash)
+        self.parked_count += 1
+
+    def release(self, dependency: bytes) -> List[Block]:
+        # Called when the dependency has been committed. Returns the blocks that are no longer
+        # missing any dependencies.
+        waiting = self.dependents.pop(dependency, None)
+        if not waiting:
+            return []
+
+        ready: List[Block] = []
+        for block_hash in waiting:
+            block, missing = self.blocks[block_hash]
+            missing.discard(dependency)
+            if not missing:
+                del self.blocks[block_hash]
+                ready.append(block)
+        self.released_count += len(ready)
+        return ready
+
+    def evict_oldest(self):
+        block_hash, (block, missing) = self.blocks.popitem(last=False)
+        for dependency in missing:
+            waiting = self.dependents[dependency]
+            waiting.discard(block_hash)
+            if not waiting:
+                del self.dependents[dependency]
+        self.evicted_count += 1
@@ -0,0 +1,115 @@
+import time
+from asyncio import Queue
+from collections import deque
+from typing import Deque, Dict, Iterable, Tuple
+
+# Bucket i counts durations below 2**i microseconds, the last bucket counts everything above
+BUCKET_COUNT = 32
+# Items per second are measured over about this many seconds
+RATE_WINDOW = 10.0
+
+
+class Histogram:
+    # Durations in power of two buckets of microseconds. Recording is a few integer operations,
+    # so it is cheap enough to do for every block.
+    __slots__ = ("buckets", "count", "total")
+
+    def __init__(self):
+        self.buckets = [0] * BUCKET_COUNT
+        self.count = 0
+        self.total = 0.0
+
+    def record(self, seconds: float, count: int = 1):
+        bucket = min(int(seconds * 1000000).bit_length(), BUCKET_COUNT - 1)
+        self.buckets[bucket] += count
+        self.count += count
+        self.total += seconds * count
+
+    def merge(self, other: "Histogram"):
+        for i, value in enumerate(other.buckets):
+            self.buckets[i] += value
+        self.count += other.count
+        self.total += other.total
+
+    def percentile(self, p: float) -> float:
+        # Upper bound of the bucket containing the percentile, in seconds
+        if self.count == 0:
+            return 0.0
+        target = self.count * p / 100
+        seen = 0
+        for i, value in enumerate(self.buckets):
+            seen += value
+            if seen >= target:
+                return (2**i) / 1000000
+        return (2 ** (BUCKET_COUNT - 1)) / 1000000
+
+    def snapshot(self) -> Dict[str, float]:
+        return {
+            "count": self.count,
+            "mean": self.total / self.count if self.count else 0.0,
+            "p50": self.percentile(50),
+            "p90": self.percentile(90),
+            "p99": self.percentile(99),
+        }
+
+
+class TimedQueue(Queue):
+    # Records how long each item waited in the queue. Items leave an asyncio.Queue in the order
+    # they were added, so the enqueue times are kept in a parallel deque.
+    def _init(self, maxsize):
+        super(TimedQueue, self)._init(maxsize)
+        self.enqueue_times: Deque[float] = deque()
+        self.wait = Histogram()
+
+    def _put(self, item):
+        super(TimedQueue, self)._put(item)
+        self.enqueue_times.append(time.monotonic())
+
+    def _get(self):
+        self.wait.record(time.monotonic() - self.enqueue_times.popleft())
+        return super(TimedQueue, self)._get()
+
+
+class StageMetrics:
+    def __init__(self, name: str):
+        self.name = name
+        self.processed = 0
+        self.invalid = 0
+        self.parked = 0
+        self.processing = Histogram()
+
+        # (time, processed) after each batch. The first sample is the last one from before the
+        # rate window, so snapshots can measure the rate without changing any state.
+        self.samples: Deque[Tuple[float, int]] = deque([(time.monotonic(), 0)])
+
+    def record_batch(self, size: int, seconds: float):
+        # The batch duration is spread evenly over its items
+        self.processed += size
+        self.processing.record(seconds / size, size)
+
+        now = time.monotonic()
+        self.samples.append((now, self.processed))
+        while len(self.samples) > 2 and self.samples[1][0] < now - RATE_WINDOW:
+            self.samples.popleft()
+
+    def snapshot(self, queues: Iterable[TimedQueue]) -> Dict:
+        # Items per second since the first sample, over at least the last RATE_WINDOW seconds
+        start_time, start_processed = self.samples[0]
+        elapsed = time.monotonic() - start_time
+        rate = (self.processed - start_processed) / elapsed if elapsed else 0.0
+
+        queue_depth = 0
+        wait = Histogram()
+        for queue in queues:
+            queue_depth += queue.qsize()
+            wait.merge(queue.wait)
+
+        return {
+            "queue_depth": queue_depth,
+            "processed": self.processed,
+            "items_per_second": rate,
+            "invalid": self.invalid,
+            "parked": self.parked,
+            "wait": wait.snapshot(),
+            "processing": self.processing.snapshot(),
+        }
@@ -0,0 +1,34 @@
+from typing import Set
+
+
+class RecentlySeen:
+    # Set of recently seen keys with a bounded size. Keys are added to the current generation;
+    # when it is half full it replaces the previous generation, which is forgotten. Lookups and
+    # inserts are O(1), and between capacity / 2 and capacity of the latest keys are remembered.
+    def __init__(self, capacity: int = 200000):
+        self.generation_size = max(1, capacity // 2)
+        self.current: Set[bytes] = set()
+        self.previous: Set[bytes] = set()
+
+        self.hits = 0
+        self.misses = 0
+
+    def __contains__(self, key: bytes):
+        return key in self.current or key in self.previous
+
+    def __len__(self):
+        return len(self.current) + len(self.previous)
+
+    def check(self, key: bytes) -> bool:
+        # Same as `key in self`, but counted as a hit or miss
+        if key in self:
+            self.hits += 1
+            return True
+        self.misses += 1
+        return False
+
+    def add(self, key: bytes):
+        self.current.add(key)
+        if len(self.current) >= self.generation_size:
+            self.previous = self.current
+            self.current = set()
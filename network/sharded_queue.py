@@ -0,0 +1,32 @@
+from typing import List
+
+from network.metrics import TimedQueue
+
+
+class ShardedQueue:
+    # A pipeline stage queue split into one queue per worker. Items with the same key always go to
+    # the same shard, so they are processed in order, while items with different keys are
+    # processed in parallel by different workers.
+    def __init__(self, shards: int = 1, maxsize: int = 0):
+        # maxsize is the capacity of the whole stage, divided between the shards
+        shard_size = max(1, maxsize // shards) if maxsize else 0
+        self.queues: List[TimedQueue] = [TimedQueue(shard_size) for _ in range(shards)]
+
+    def shard(self, key: bytes) -> TimedQueue:
+        return self.queues[hash(key) % len(self.queues)]
+
+    async def put(self, item, key: bytes):
+        await self.shard(key).put(item)
+
+    def put_nowait(self, item, key: bytes):
+        self.shard(key).put_nowait(item)
+
+    def qsize(self) -> int:
+        return sum(queue.qsize() for queue in self.queues)
+
+    def empty(self) -> bool:
+        return all(queue.empty() for queue in self.queues)
+
+    async def join(self):
+        for queue in self.queues:
+            await queue.join()
@@ -0,0 +1,215 @@
+import argparse
+import asyncio
+import bisect
+import time
+from typing import Dict, Iterator, Optional, Tuple
+
+import uvloop
+
+from models.blocks import BlockType
+from models.messages import (
+    HEADER_LENGTH,
+    BulkPullMessage,
+    FrontierReqMessage,
+    MessageParser,
+    MessageType,
+)
+from network.bootstrap_server import (
+    BULK_PULL_END,
+    FRONTIERS_END,
+    REQUEST_LENGTHS,
+    WRITE_SIZE,
+)
+from network.udp import check_header
+from storage.snapshot import HASH_LENGTH, Snapshot
+
+
+def parse_peer(value: str) -> Tuple[str, int]:
+    # host:port, where the host may be an IPv6 address with colons of its own
+    host, _, port = value.rpartition(":")
+    return host.strip("[]"), int(port)
+
+
+class SnapshotLedger:
+    # Answers bootstrap requests from a ledger snapshot. Frontiers come from the account index in
+    # ascending account order, chains are walked back from a block along previous hashes.
+    def __init__(self, snapshot: Snapshot):
+        self.snapshot = snapshot
+        accounts = snapshot.accounts()
+        self.accounts = sorted(accounts)
+        self.heads = [accounts[account].head for account in self.accounts]
+        self.head_offsets = {
+            account: entry.head_offset for account, entry in accounts.items()
+        }
+
+        # File offset of every block record by block hash
+        self.offsets: Dict[bytes, int] = {}
+        view = snapshot.view
+        for segment in snapshot.block_segments:
+            for offset in range(segment.offset, segment.end, segment.record_size):
+                self.offsets[bytes(view[offset : offset + HASH_LENGTH])] = offset
+
+    def frontiers(
+        self, start: bytes = bytes(32), count: int = 0xFFFFFFFF
+    ) -> Iterator[Tuple[bytes, bytes]]:
+        # (account, head) of up to count accounts from start on
+        i = bisect.bisect_left(self.accounts, start)
+        for j in range(i, min(len(self.accounts), i + count)):
+            yield self.accounts[j], self.heads[j]
+
+    def chain(
+        self, start: bytes, end: bytes = bytes(32)
+    ) -> Iterator[Tuple[BlockType, memoryview]]:
+        # Blocks newest first from start, which is an account or a block hash, until the open
+        # block or the block after end
+        offset = self.head_offsets.get(start)
+        if offset is None:
+            offset = self.offsets.get(start)
+        while offset is not None:
+            block_hash, block_type, data = self.snapshot.block_at(offset)
+            if block_hash == end:
+                return
+            yield block_type, data
+            if block_type == BlockType.OPEN:
+                return
+            # The previous hash is the first field of the other legacy blocks
+            offset = self.offsets.get(bytes(data[:32]))
+
+
+class Shaper:
+    # Simulates the link to a remote peer. Every response starts after latency seconds, and the
+    # data of all connections shares bandwidth bytes per second, 0 being unlimited.
+    def __init__(self, latency: float = 0.0, bandwidth: float = 0.0):
+        self.latency = latency
+        self.bandwidth = bandwidth
+        # When the link is free to send the next data
+        self.available_at = 0.0
+
+    async def delay(self):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+
+    async def send(self, writer: asyncio.StreamWriter, data: bytes):
+        if self.bandwidth:
+            now = time.monotonic()
+            self.available_at = max(now, self.available_at) + len(data) / self.bandwidth
+            await asyncio.sleep(self.available_at - now)
+        writer.write(data)
+        await writer.drain()
+
+
+class SnapshotPeer:
+    # A local stand-in for a bootstrap peer. It speaks the TCP bootstrap protocol of a reference
+    # node, so the frontier and bulk pull path of server.py can run against it on one machine.
+    def __init__(self, ledger: SnapshotLedger, shaper: Optional[Shaper] = None):
+        self.ledger = ledger
+        self.shaper = shaper or Shaper()
+        self.connections = 0
+        self.frontier_requests = 0
+        self.bulk_pulls = 0
+        self.bytes_sent = 0
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        self.connections += 1
+        try:
+            while True:
+                header = await reader.readexactly(HEADER_LENGTH)
+                if not check_header(header):
+                    print("invalid request header, closing connection")
+                    break
+                length = REQUEST_LENGTHS.get(MessageType(header[5]))
+                if length is None:
+                    print(f"unsupported request {MessageType(header[5]).name}")
+                    break
+                message = MessageParser.parse(header + await reader.readexactly(length))
+
+                await self.shaper.delay()
+                if isinstance(message, FrontierReqMessage):
+                    self.frontier_requests += 1
+                    await self.send_frontiers(writer, message)
+                elif isinstance(message, BulkPullMessage):
+                    self.bulk_pulls += 1
+                    await self.send_chain(writer, message)
+        except (asyncio.IncompleteReadError, ConnectionError):
+            # The client closed the connection
+            pass
+        finally:
+            writer.close()
+            self.connections -= 1
+
+    async def send_frontiers(
+        self, writer: asyncio.StreamWriter, message: FrontierReqMessage
+    ):
+        # Snapshots have no block times, so the age limit is ignored
+        count = int.from_bytes(message.count, byteorder="little")
+        buffer = bytearray()
+        for account, head in self.ledger.frontiers(message.account, count):
+            buffer += account
+            buffer += head
+            if len(buffer) >= WRITE_SIZE:
+                await self.send(writer, buffer)
+                buffer = bytearray()
+        buffer += FRONTIERS_END
+        await self.send(writer, buffer)
+
+    async def send_chain(self, writer: asyncio.StreamWriter, message: BulkPullMessage):
+        buffer = bytearray()
+        for block_type, data in self.ledger.chain(message.start, message.end):
+            buffer.append(block_type.value)
+            buffer += data
+            if len(buffer) >= WRITE_SIZE:
+                await self.send(writer, buffer)
+                buffer = bytearray()
+        buffer += BULK_PULL_END
+        await self.send(writer, buffer)
+
+    async def send(self, writer: asyncio.StreamWriter, data: bytes):
+        self.bytes_sent += len(data)
+        await self.shaper.send(writer, data)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Serve frontier_req and bulk_pull from a ledger snapshot"
+    )
+    parser.add_argument("snapshot", help="ledger snapshot, see util.ledger_generator")
+    parser.add_argument("--listen", type=parse_peer, default=("::1", 7075))
+    parser.add_argument(
+        "--latency", type=float, default=0.0, help="seconds before each response"
+    )
+    parser.add_argument(
+        "--bandwidth", type=float, default=0.0, help="bytes per second, 0 is unlimited"
+    )
+    args = parser.parse_args()
+
+    loop = uvloop.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    s = time.time()
+    snapshot = Snapshot(args.snapshot)
+    ledger = SnapshotLedger(snapshot)
+    print(
+        f"indexed {len(ledger.offsets)} blocks of {len(ledger.accounts)} accounts "
+        f"in {(time.time()-s)*1000:.0f}ms"
+    )
+
+    peer = SnapshotPeer(ledger, Shaper(args.latency, args.bandwidth))
+    host, port = args.listen
+    server = loop.run_until_complete(
+        asyncio.start_server(peer.handle_connection, host, port)
+    )
+    print(f"serving {args.snapshot} on {host} {port}")
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        print(
+            f"served {peer.frontier_requests} frontier requests and {peer.bulk_pulls} "
+            f"bulk pulls, {peer.bytes_sent} bytes"
+        )
+        server.close()
+        snapshot.close()
+        loop.close()
@@ -0,0 +1,116 @@
+import asyncio
+from abc import ABC, abstractmethod
+from typing import AsyncIterator, List, Tuple
+
+from models.blocks import Block, BlockParser, BlockType
+
+# Bytes requested from the stream per read. Large reads mean one await per chunk of blocks instead
+# of several awaits per block.
+READ_SIZE = 64 * 1024
+
+FRONTIER_LENGTH = 64
+
+
+class StreamDecoder(ABC):
+    # Incoming data is collected in one reusable bytearray. Decoded frames are removed from the
+    # front of it in one go after each decode, so data is never copied more than once per frame.
+    def __init__(self):
+        self.buffer = bytearray()
+        self.finished = False
+
+    def feed(self, data: bytes):
+        self.buffer += data
+
+    def reset(self):
+        # Start decoding a new response on the same stream, keeping any buffered data
+        self.finished = False
+
+    def decode(self, max_count: int = 0) -> List:
+        view = memoryview(self.buffer)
+        try:
+            items, offset = self.decode_frames(view, max_count)
+        finally:
+            view.release()
+        del self.buffer[:offset]
+        return items
+
+    @abstractmethod
+    def decode_frames(self, view: memoryview, max_count: int) -> Tuple[List, int]:
+        # Returns the frames decoded from the start of view, up to max_count unless it is 0, and
+        # the length they take up
+        pass
+
+
+class BlockStreamDecoder(StreamDecoder):
+    # Decodes the blocks of a bulk_pull response: a block type byte followed by the block, until a
+    # NOT_A_BLOCK type byte.
+    def decode_frames(self, view: memoryview, max_count: int) -> Tuple[List, int]:
+        blocks: List[Block] = []
+        offset = 0
+        while offset < len(view) and not self.finished:
+            try:
+                block_type = BlockType(view[offset])
+            except ValueError:
+                raise Exception(f"{view[offset]:02x} is not a valid block type..")
+
+            if block_type == BlockType.NOT_A_BLOCK:
+                offset += 1
+                self.finished = True
+                break
+
+            length = BlockParser.length(block_type)
+            if length == 0:
+                raise Exception(f"{block_type.name} is not a valid block type..")
+
+            end = offset + 1 + length
+            if end > len(view):
+                # The rest of the block has not been received yet
+                break
+
+            blocks.append(BlockParser.parse(block_type, view[offset + 1 : end]))
+            offset = end
+
+            if max_count != 0 and len(blocks) == max_count:
+                break
+        return blocks, offset
+
+
+class FrontierStreamDecoder(StreamDecoder):
+    # Decodes the (account, block hash) pairs of a frontier_req response, until the zero account.
+    def decode_frames(self, view: memoryview, max_count: int) -> Tuple[List, int]:
+        frontiers: List[Tuple[bytes, bytes]] = []
+        offset = 0
+        while offset + FRONTIER_LENGTH <= len(view):
+            account = bytes(view[offset : offset + 32])
+            offset += FRONTIER_LENGTH
+            if account == bytes(32):
+                self.finished = True
+                break
+            frontiers.append((account, bytes(view[offset - 32 : offset])))
+
+            if max_count != 0 and len(frontiers) == max_count:
+                break
+        return frontiers, offset
+
+
+async def read_batches(
+    reader: asyncio.StreamReader,
+    decoder: StreamDecoder,
+    read_size: int = READ_SIZE,
+    max_count: int = 0,
+) -> AsyncIterator[List]:
+    # Yields the frames decoded from each received chunk until the end of the response, or until
+    # max_count frames unless it is 0. Data after the last frame stays in the decoder.
+    count = 0
+    while True:
+        batch = decoder.decode(max_count - count if max_count else 0)
+        count += len(batch)
+        if batch:
+            yield batch
+        if decoder.finished or (max_count and count >= max_count):
+            return
+
+        data = await reader.read(read_size)
+        if not data:
+            raise EOFError("unexpected end of stream")
+        decoder.feed(data)
@@ -1,9 +1,19 @@
+import asyncio
+
 import pytest
 
-from models.blocks import OpenBlock
-from network.block_handler import BlockHandler
+from models.blocks import Block, BlockType, ChangeBlock, OpenBlock, SendBlock
+import network.block_handler as block_handler_module
+from network.block_handler import BlockHandler, OverloadPolicy
+from storage.account_index import AccountIndex, open_lmdb_ledger
 from storage.in_memory import InMemoryStorage
-from util.crypto import sign
+from util.crypto import (
+    POW_PROCESS_BATCH_SIZE,
+    TEST_POW_THRESHOLD,
+    generate_work,
+    sign,
+)
+from util.ledger_generator import LedgerGenerator
 from util.numbers import deterministic_key
 from storage.storage import Storage
 
@@ -78,7 +88,55 @@ async def test_block_handler_queues_block_with_missing_dep(storage, open_block):
     assert block_handler.invalid_pow_count == 0
     assert block_handler.invalid_signature_count == 0
     assert block_handler.storage_queue.qsize() == 0
-    # TODO: Check that block is put into "dependency watcher"
+    assert open_block.hash_sync() in block_handler.dependency_registry
+
+
+@pytest.mark.asyncio
+async def test_block_handler_releases_block_when_dep_committed(storage, open_block):
+    block_handler = BlockHandler(storage)
+
+    await block_handler.start()
+    await block_handler.handle_block(open_block)
+    await block_handler.stop()
+    assert storage.get(open_block.hash_sync()) is None
+
+    await block_handler.start()
+    storage.put(open_block.source, b"")
+    block_handler.block_committed(open_block.source)
+    await block_handler.stop()
+
+    assert open_block.hash_sync() not in block_handler.dependency_registry
+    assert block_handler.dependency_registry.released_count == 1
+    assert storage.get(open_block.hash_sync()) == open_block.to_bytes()
+
+
+class CountingStorage(InMemoryStorage):
+    def __init__(self):
+        super(CountingStorage, self).__init__()
+        self.bulk_put_count = 0
+
+    def bulk_put(self, kv):
+        self.bulk_put_count += 1
+        super(CountingStorage, self).bulk_put(kv)
+
+
+@pytest.mark.asyncio
+async def test_block_handler_commits_in_batches():
+    storage = CountingStorage()
+    block_handler = BlockHandler(storage, storage_batch_timeout=0.1)
+
+    blocks = [
+        OpenBlock(bytes([i]) * 32, bytes(32), bytes(32), bytes(64), bytes(8))
+        for i in range(5)
+    ]
+    await block_handler.start()
+    for block in blocks:
+        await block_handler.storage_queue.put(block, block.account)
+    await block_handler.stop()
+
+    assert storage.bulk_put_count == 1
+    for block in blocks:
+        assert storage.get(block.hash_sync()) == block.to_bytes()
 
 
 @pytest.mark.asyncio
@@ -96,4 +154,316 @@ async def test_block_handler_accepts_valid_pow_and_signature(
 
     assert block_handler.invalid_pow_count == 0
     assert block_handler.invalid_signature_count == 0
-    assert block_handler.storage_queue.qsize() == 1
+    assert storage.get(open_block.hash_sync()) == open_block.to_bytes()
+
+
+@pytest.mark.asyncio
+async def test_block_handler_verifies_signatures_in_batches(
+    storage: Storage, open_block: OpenBlock
+):
+    block_handler = BlockHandler(storage, signature_batch_size=2)
+
+    for dep in open_block.dependencies():
+        storage.put(dep, b"")
+
+    # Same account, so the PoW is valid, but a different hash than open_block
+    invalid_block = OpenBlock(
+        bytes([1] * 32),
+        open_block.representative,
+        open_block.account,
+        bytes(64),
+        open_block.work,
+    )
+    storage.put(invalid_block.source, b"")
+
+    await block_handler.start()
+    for block in [open_block, invalid_block]:
+        await block_handler.handle_block(block)
+    await block_handler.stop()
+
+    assert block_handler.invalid_pow_count == 0
+    assert block_handler.invalid_signature_count == 1
+    assert storage.get(open_block.hash_sync()) == open_block.to_bytes()
+
+
+@pytest.mark.asyncio
+async def test_block_handler_applies_backpressure(storage, open_block):
+    block_handler = BlockHandler(storage, pow_queue_size=1)
+
+    other_block = OpenBlock(bytes(32), bytes(32), bytes(32), bytes(64), bytes(8))
+
+    await block_handler.handle_block(open_block)
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.wait_for(block_handler.handle_block(other_block), 0.01)
+
+
+@pytest.mark.asyncio
+async def test_block_handler_drops_newest_when_full(storage, open_block):
+    block_handler = BlockHandler(storage, pow_queue_size=1)
+    other_block = OpenBlock(bytes(32), bytes(32), bytes(32), bytes(64), bytes(8))
+
+    assert block_handler.handle_block_nowait(open_block)
+    assert not block_handler.handle_block_nowait(other_block)
+    assert block_handler.dropped_count == 1
+    assert block_handler.pow_queue.queues[0].get_nowait() is open_block
+
+
+@pytest.mark.asyncio
+async def test_block_handler_drops_oldest_when_full(storage, open_block):
+    block_handler = BlockHandler(
+        storage, pow_queue_size=1, overload_policy=OverloadPolicy.DROP_OLDEST
+    )
+    other_block = OpenBlock(bytes(32), bytes(32), bytes(32), bytes(64), bytes(8))
+
+    assert block_handler.handle_block_nowait(open_block)
+    assert block_handler.handle_block_nowait(other_block)
+    assert block_handler.dropped_count == 1
+    assert block_handler.pow_queue.queues[0].get_nowait() is other_block
+
+
+@pytest.mark.asyncio
+async def test_block_handler_with_multiple_workers(storage, open_block):
+    block_handler = BlockHandler(
+        storage, pow_workers=3, dep_workers=2, signature_workers=4
+    )
+
+    for dep in open_block.dependencies():
+        storage.put(dep, b"")
+
+    await block_handler.start()
+    await block_handler.handle_block(open_block)
+    await block_handler.stop()
+
+    assert storage.get(open_block.hash_sync()) == open_block.to_bytes()
+    assert block_handler.chain_keys == {}
+
+
+def test_block_handler_routes_chain_to_same_worker(storage, open_block):
+    block_handler = BlockHandler(storage, pow_workers=8)
+    send_block = SendBlock(
+        open_block.hash_sync(), bytes(32), bytes(16), bytes(64), bytes(8)
+    )
+    next_send_block = SendBlock(
+        send_block.hash_sync(), bytes(32), bytes(16), bytes(64), bytes(8)
+    )
+
+    keys = [
+        block_handler.chain_key(block)
+        for block in [open_block, send_block, next_send_block]
+    ]
+    assert keys == [open_block.account] * 3
+
+    # Once the previous block has left the pipeline, ordering no longer depends on it
+    block_handler.leave_pipeline(send_block)
+    block_handler.leave_pipeline(next_send_block)
+    assert block_handler.chain_key(next_send_block) == send_block.hash_sync()
+
+
+@pytest.mark.asyncio
+async def test_block_handler_metrics_snapshot(storage, open_block_without_pow):
+    block_handler = BlockHandler(storage)
+
+    await block_handler.start()
+    await block_handler.handle_block(open_block_without_pow)
+    await block_handler.stop()
+
+    snapshot = block_handler.metrics_snapshot()
+    assert snapshot["stages"]["pow"]["processed"] == 1
+    assert snapshot["stages"]["pow"]["invalid"] == 1
+    assert snapshot["stages"]["pow"]["wait"]["count"] == 1
+    assert snapshot["stages"]["dep"]["processed"] == 0
+    assert snapshot["stages"]["pow"]["queue_depth"] == 0
+
+
+@pytest.mark.asyncio
+async def test_block_handler_drops_duplicates(storage, open_block):
+    block_handler = BlockHandler(storage)
+
+    for dep in open_block.dependencies():
+        storage.put(dep, b"")
+
+    await block_handler.start()
+    assert await block_handler.handle_block(open_block)
+    # Still in the pipeline
+    assert not await block_handler.handle_block(open_block)
+    await block_handler.stop()
+
+    # Committed
+    assert not await block_handler.handle_block(open_block)
+    assert not block_handler.handle_block_nowait(open_block)
+    assert block_handler.pipeline_duplicate_count == 1
+    assert block_handler.recently_seen.hits == 2
+    assert block_handler.metrics["pow"].processed == 1
+
+
+@pytest.mark.asyncio
+async def test_block_handler_accepts_block_after_invalid_copy(storage, open_block):
+    valid_block = OpenBlock.parse(open_block.to_bytes()[1:])
+    invalid_block = open_block
+    invalid_block.signature = bytes(64)
+    block_handler = BlockHandler(storage)
+
+    for dep in open_block.dependencies():
+        storage.put(dep, b"")
+
+    await block_handler.start()
+    await block_handler.handle_block(invalid_block)
+    await block_handler.stop()
+    await block_handler.start()
+    assert await block_handler.handle_block(valid_block)
+    await block_handler.stop()
+
+    assert block_handler.invalid_signature_count == 1
+    assert storage.get(valid_block.hash_sync()) == valid_block.to_bytes()
+
+
+@pytest.mark.asyncio
+async def test_block_handler_indexes_ledger(storage):
+    generator = LedgerGenerator(accounts=4, blocks=16)
+    generator.generate()
+    # The source of the genesis open block is the genesis account itself
+    storage.put(generator.public_key(0), b"")
+    index = AccountIndex()
+    block_handler = BlockHandler(
+        storage, pow_threshold=TEST_POW_THRESHOLD, account_index=index
+    )
+
+    # Chains are handed in account order, so blocks arrive before their sources are committed.
+    # Send, receive and change blocks are verified with the account from the index.
+    await block_handler.start()
+    for chain in generator.chains:
+        for block in chain:
+            await block_handler.handle_block(block)
+    await block_handler.stop()
+
+    assert block_handler.invalid_signature_count == 0
+    assert len(storage.data) == 16 + 1
+    for i, chain in enumerate(generator.chains):
+        info = index.account_info(generator.public_key(i))
+        assert info.head == chain[-1].hash_sync()
+        assert info.block_count == len(chain)
+
+
+@pytest.mark.asyncio
+async def test_block_handler_rejects_block_of_unknown_account(storage):
+    # The previous block is stored, but not indexed, so the block's account is unknown
+    block = SendBlock(bytes([1] * 32), bytes(32), bytes(16), bytes(64), bytes(8))
+    storage.put(block.previous, b"")
+    block_handler = BlockHandler(storage, pow_threshold=0)
+
+    await block_handler.start()
+    await block_handler.handle_block(block)
+    await block_handler.stop()
+
+    assert block_handler.invalid_signature_count == 1
+    assert storage.get(block.hash_sync()) is None
+
+
+@pytest.mark.asyncio
+async def test_block_handler_rejects_block_without_signature(storage):
+    # Blocks of unknown types have no signature, the stage must reject them and keep running
+    block = Block(BlockType.INVALID)
+    block_handler = BlockHandler(storage, pow_threshold=0)
+
+    await block_handler.start()
+    await block_handler.handle_block(block)
+    await asyncio.wait_for(block_handler.stop(), 1)
+
+    assert block_handler.invalid_signature_count == 1
+
+
+@pytest.mark.asyncio
+async def test_block_handler_pow_backlog_reaches_process_pool(storage, monkeypatch):
+    batch_sizes = []
+    verify = block_handler_module.verify_pow_batch_async
+
+    async def record_batch(items, *args, **kwargs):
+        batch_sizes.append(len(items))
+        return await verify(items, *args, **kwargs)
+
+    monkeypatch.setattr(block_handler_module, "verify_pow_batch_async", record_batch)
+    block_handler = BlockHandler(storage)
+    # A backlog built up before the stage runs is verified in one batch, which is large enough
+    # to be split across processes
+    for i in range(POW_PROCESS_BATCH_SIZE + 1):
+        assert block_handler.handle_block_nowait(
+            SendBlock(
+                i.to_bytes(32, "little"), bytes(32), bytes(16), bytes(64), bytes(8)
+            )
+        )
+    await block_handler.start()
+    await asyncio.wait_for(block_handler.stop(), 10)
+
+    assert batch_sizes == [POW_PROCESS_BATCH_SIZE + 1]
+
+
+def make_chain(length):
+    # A signed chain of the genesis account, oldest block first
+    chain = [
+        OpenBlock(pub, pub, pub, bytes(64), generate_work(pub, TEST_POW_THRESHOLD))
+    ]
+    for i in range(length - 1):
+        root = chain[-1].hash_sync()
+        chain.append(
+            ChangeBlock(root, pub, bytes(64), generate_work(root, TEST_POW_THRESHOLD))
+        )
+    for block in chain:
+        block.signature = sign(block.hash_sync(), priv)
+    return chain
+
+
+@pytest.mark.asyncio
+async def test_block_handler_commits_long_chain_in_few_batches():
+    # A chain handed in at once, as after a bulk pull. Blocks follow their previous block through
+    # the pipeline without waiting for it to be committed, so the batches fill up.
+    chain = make_chain(100)
+    storage = CountingStorage()
+    block_handler = BlockHandler(storage, pow_threshold=TEST_POW_THRESHOLD)
+    await block_handler.start()
+    for block in chain:
+        await block_handler.handle_block(block)
+    await asyncio.wait_for(block_handler.stop(), 1)
+
+    assert block_handler.invalid_signature_count == 0
+    assert len(storage.data) == 100
+    assert storage.bulk_put_count <= 5
+    assert block_handler.account_index.account_info(pub).block_count == 100
+    assert not block_handler.accepted
+
+
+@pytest.mark.asyncio
+async def test_block_handler_rejects_blocks_after_rejected_block(storage):
+    chain = make_chain(10)
+    chain[3].signature = bytes(64)
+    block_handler = BlockHandler(storage, pow_threshold=TEST_POW_THRESHOLD)
+    await block_handler.start()
+    for block in chain:
+        await block_handler.handle_block(block)
+    await asyncio.wait_for(block_handler.stop(), 1)
+
+    # Blocks that already passed the dependency check are never committed without their
+    # previous block
+    assert set(storage.data) == {block.hash_sync() for block in chain[:3]}
+    assert block_handler.account_index.account_info(pub).block_count == 3
+    assert not block_handler.accepted
+
+
+@pytest.mark.asyncio
+async def test_block_handler_commits_index_with_blocks(tmp_path):
+    chain = make_chain(5)
+    storage, index = open_lmdb_ledger(
+        {"path": str(tmp_path), "map_size": 10 * 1024 * 1024}
+    )
+    block_handler = BlockHandler(
+        storage, pow_threshold=TEST_POW_THRESHOLD, account_index=index
+    )
+    await block_handler.start()
+    for block in chain:
+        await block_handler.handle_block(block)
+    await asyncio.wait_for(block_handler.stop(), 1)
+
+    assert storage.scan(bytes(), 10) == sorted(
+        (block.hash_sync(), block.to_bytes()) for block in chain
+    )
+    assert index.account_info(pub).head == chain[-1].hash_sync()
+    storage.close()
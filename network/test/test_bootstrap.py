@@ -0,0 +1,94 @@
+import asyncio
+
+import pytest
+
+from models.blocks import OpenBlock
+from network.bootstrap import BootstrapScheduler, PullRequest, diff_frontiers
+from storage.account_index import AccountIndex
+
+
+def pull_requests(n):
+    return [PullRequest(bytes([i]) * 32, bytes(32)) for i in range(n)]
+
+
+async def worker(scheduler, pulled, fail_accounts=()):
+    while True:
+        pull = await scheduler.next_pull()
+        if pull is None:
+            return
+        # Give other workers a chance to run
+        await asyncio.sleep(0)
+        if pull.account in fail_accounts:
+            scheduler.retry(pull)
+        else:
+            pulled.append(pull.account)
+            scheduler.complete(pull)
+
+
+@pytest.mark.asyncio
+async def test_workers_share_queue():
+    scheduler = BootstrapScheduler(pull_requests(50))
+    pulled = []
+    await asyncio.gather(*[worker(scheduler, pulled) for i in range(5)])
+
+    assert sorted(pulled) == sorted(pull.account for pull in pull_requests(50))
+    assert scheduler.completed_count == 50
+    assert scheduler.outstanding == 0
+
+
+@pytest.mark.asyncio
+async def test_failed_pull_is_retried():
+    scheduler = BootstrapScheduler(pull_requests(2), backoff=0.001)
+    pulled = []
+    failing = {bytes([1]) * 32}
+
+    async def flaky_worker():
+        while True:
+            pull = await scheduler.next_pull()
+            if pull is None:
+                return
+            if pull.account in failing:
+                failing.remove(pull.account)
+                scheduler.retry(pull)
+            else:
+                pulled.append(pull.account)
+                scheduler.complete(pull)
+
+    await asyncio.wait_for(flaky_worker(), 1)
+    assert len(pulled) == 2
+    assert scheduler.retry_count == 1
+    assert not scheduler.failed
+
+
+@pytest.mark.asyncio
+async def test_pull_fails_after_max_attempts():
+    scheduler = BootstrapScheduler(pull_requests(2), max_attempts=3, backoff=0.001)
+    pulled = []
+    failing = {bytes([1]) * 32}
+
+    await asyncio.wait_for(
+        asyncio.gather(*[worker(scheduler, pulled, failing) for i in range(2)]), 1
+    )
+    assert pulled == [bytes([0]) * 32]
+    assert [pull.account for pull in scheduler.failed] == [bytes([1]) * 32]
+    assert scheduler.failed[0].attempts == 3
+
+
+def test_diff_frontiers():
+    up_to_date = OpenBlock(bytes(32), bytes(32), bytes([1]) * 32, bytes(64), bytes(8))
+    behind = OpenBlock(bytes(32), bytes(32), bytes([2]) * 32, bytes(64), bytes(8))
+    index = AccountIndex()
+    index.add_blocks([up_to_date, behind])
+
+    frontiers = [
+        (up_to_date.account, up_to_date.hash_sync()),
+        (behind.account, bytes([12]) * 32),
+        (bytes([3]) * 32, bytes([13]) * 32),
+    ]
+    pulls = diff_frontiers(frontiers, index)
+
+    # Only the blocks after our head are pulled for an account we have
+    assert [(pull.account, pull.head, pull.end) for pull in pulls] == [
+        (behind.account, bytes([12]) * 32, behind.hash_sync()),
+        (bytes([3]) * 32, bytes([13]) * 32, bytes(32)),
+    ]
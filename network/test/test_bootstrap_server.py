@@ -0,0 +1,156 @@
+import asyncio
+
+import pytest
+
+from models.blocks import ChangeBlock, OpenBlock, SendBlock
+from models.messages import BulkPullMessage, FrontierReqMessage
+from network.bootstrap_server import (
+    FRONTIERS_END,
+    BootstrapServerProtocol,
+    bulk_pull_response,
+    frontier_response,
+)
+from network.stream_decoder import (
+    BlockStreamDecoder,
+    FrontierStreamDecoder,
+    read_batches,
+)
+from storage.account_index import AccountIndex
+from storage.in_memory import InMemoryStorage
+
+account = bytes([1] * 32)
+
+
+@pytest.fixture
+def chain():
+    # Oldest block first
+    blocks = [OpenBlock(bytes(32), account, account, bytes(64), bytes(8))]
+    for i in range(20):
+        previous = blocks[-1].hash_sync()
+        if i % 2:
+            blocks.append(ChangeBlock(previous, bytes(32), bytes(64), bytes(8)))
+        else:
+            blocks.append(
+                SendBlock(previous, bytes(32), bytes(16), bytes(64), bytes(8))
+            )
+    return blocks
+
+
+@pytest.fixture
+def storage(chain):
+    # One long chain and 10 accounts with only an open block
+    opens = [
+        OpenBlock(bytes(32), bytes(32), bytes([i] * 32), bytes(64), bytes(8))
+        for i in range(2, 12)
+    ]
+    blocks = InMemoryStorage()
+    blocks.bulk_put({block.hash_sync(): block.to_bytes() for block in chain + opens})
+    index = AccountIndex()
+    index.add_blocks(chain + opens)
+    return blocks, index
+
+
+def frontiers(index):
+    return [
+        (account, value[:32]) for account, value in sorted(index.accounts.data.items())
+    ]
+
+
+def test_frontier_response(storage, monkeypatch):
+    _, index = storage
+    # Pages of 3 accounts, and writes of 2 frontiers
+    monkeypatch.setattr("network.bootstrap_server.SCAN_SIZE", 3)
+    writes = list(frontier_response(index, write_size=128))
+    assert len(writes) == 6
+    data = b"".join(writes)
+    assert data[-64:] == FRONTIERS_END
+    assert data[:-64] == b"".join(k + v for k, v in frontiers(index))
+
+    data = b"".join(frontier_response(index, bytes([5] * 32), count=4))
+    assert data[:-64:64] == b"".join(bytes([i]) for i in range(5, 9))
+
+
+def test_bulk_pull_response(storage, chain, monkeypatch):
+    blocks, index = storage
+    # Pages of 3 blocks
+    monkeypatch.setattr("network.bootstrap_server.SCAN_SIZE", 3)
+    data = b"".join(bulk_pull_response(blocks, index, account, write_size=500))
+    assert data == b"".join(block.to_bytes() for block in reversed(chain)) + bytes([1])
+
+    # Only the blocks after end, starting from a block hash instead of the account
+    data = b"".join(
+        bulk_pull_response(blocks, index, chain[10].hash_sync(), chain[5].hash_sync())
+    )
+    assert data == b"".join(b.to_bytes() for b in reversed(chain[6:11])) + bytes([1])
+
+    # Nothing after the head, and an end from another chain is ignored
+    head = chain[-1].hash_sync()
+    assert b"".join(bulk_pull_response(blocks, index, account, head)) == bytes([1])
+    data = b"".join(bulk_pull_response(blocks, index, account, bytes([3] * 32)))
+    assert len(data) == sum(len(block.to_bytes()) for block in chain) + 1
+
+    assert b"".join(bulk_pull_response(blocks, index, bytes(32))) == bytes([1])
+
+
+@pytest.mark.asyncio
+async def test_serve_requests(storage, chain):
+    blocks, index = storage
+    server = await asyncio.get_event_loop().create_server(
+        lambda: BootstrapServerProtocol(blocks, index), "127.0.0.1", 0
+    )
+    port = server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+
+    # Both requests are sent at once, and answered in order
+    writer.write(
+        FrontierReqMessage(count=bytes([255] * 4)).to_bytes()
+        + BulkPullMessage(start=account).to_bytes()
+    )
+    received = []
+    async for batch in read_batches(reader, FrontierStreamDecoder()):
+        received.extend(batch)
+    assert received == frontiers(index)
+
+    pulled = []
+    async for batch in read_batches(reader, BlockStreamDecoder()):
+        pulled.extend(batch)
+    assert [b.hash_sync() for b in pulled] == [b.hash_sync() for b in reversed(chain)]
+
+    writer.close()
+    server.close()
+
+
+class FakeTransport:
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+        # The buffer of a slow client fills up after every write
+        self.protocol.pause_writing()
+
+    def close(self):
+        pass
+
+
+@pytest.mark.asyncio
+async def test_writing_stops_while_paused(storage, chain):
+    blocks, index = storage
+    protocol = BootstrapServerProtocol(blocks, index, write_size=500)
+    transport = FakeTransport(protocol)
+    protocol.connection_made(transport)
+
+    message = BulkPullMessage(start=account).to_bytes()
+    # Requests may arrive in pieces
+    protocol.data_received(message[:10])
+    protocol.data_received(message[10:])
+    await asyncio.sleep(0.01)
+    assert len(transport.written) == 1
+
+    while protocol.response is not None or protocol.requests:
+        protocol.resume_writing()
+        await asyncio.sleep(0)
+    data = b"".join(transport.written)
+    assert data == b"".join(block.to_bytes() for block in reversed(chain)) + bytes([1])
+    assert len(transport.written) > 2
@@ -0,0 +1,54 @@
+import pytest
+
+from models.blocks import ReceiveBlock, SendBlock
+from network.dependency_registry import DependencyRegistry
+
+
+def send_block(i):
+    return SendBlock(bytes([i]) * 32, bytes(32), bytes(16), bytes(64), bytes(8))
+
+
+@pytest.fixture
+def registry():
+    return DependencyRegistry(capacity=2)
+
+
+def test_release_dependents(registry):
+    block = send_block(1)
+    registry.park(block, [block.previous])
+    assert block.hash_sync() in registry
+
+    assert registry.release(bytes([2]) * 32) == []
+    assert registry.release(block.previous) == [block]
+    assert len(registry) == 0
+    assert registry.parked_count == 1
+    assert registry.released_count == 1
+
+
+def test_release_after_all_dependencies(registry):
+    block = ReceiveBlock(bytes([1]) * 32, bytes([2]) * 32, bytes(64), bytes(8))
+    registry.park(block, [block.previous, block.source])
+
+    assert registry.release(block.previous) == []
+    assert registry.release(block.source) == [block]
+
+
+def test_park_twice(registry):
+    block = send_block(1)
+    registry.park(block, [block.previous])
+    registry.park(block, [block.previous])
+    assert len(registry) == 1
+    assert registry.parked_count == 1
+
+
+def test_evicts_oldest(registry):
+    blocks = [send_block(i) for i in range(3)]
+    for block in blocks:
+        registry.park(block, [block.previous])
+
+    assert len(registry) == 2
+    assert registry.evicted_count == 1
+    assert blocks[0].hash_sync() not in registry
+    assert blocks[0].previous not in registry.dependents
+    assert registry.release(blocks[0].previous) == []
+    assert registry.release(blocks[2].previous) == [blocks[2]]
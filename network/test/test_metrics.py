@@ -0,0 +1,70 @@
+import time
+
+import pytest
+
+from network.metrics import RATE_WINDOW, Histogram, StageMetrics, TimedQueue
+
+
+def test_histogram_percentiles():
+    histogram = Histogram()
+    for i in range(90):
+        histogram.record(0.000010)
+    for i in range(10):
+        histogram.record(0.001)
+
+    snapshot = histogram.snapshot()
+    assert snapshot["count"] == 100
+    assert 0.00001 <= snapshot["p50"] <= 0.00002
+    assert 0.001 <= snapshot["p99"] <= 0.002
+    assert snapshot["mean"] == pytest.approx(0.000109)
+
+
+def test_histogram_merge():
+    a = Histogram()
+    b = Histogram()
+    a.record(0.1)
+    b.record(0.2, count=3)
+    a.merge(b)
+    assert a.count == 4
+    assert a.total == pytest.approx(0.7)
+
+
+@pytest.mark.asyncio
+async def test_timed_queue_records_wait():
+    queue = TimedQueue()
+    await queue.put(1)
+    queue.put_nowait(2)
+    assert await queue.get() == 1
+    assert queue.get_nowait() == 2
+    assert queue.wait.count == 2
+    assert len(queue.enqueue_times) == 0
+
+
+def test_stage_metrics_snapshot():
+    queue = TimedQueue()
+    queue.put_nowait(1)
+    metrics = StageMetrics("pow")
+    metrics.record_batch(4, 0.004)
+    metrics.invalid += 1
+
+    snapshot = metrics.snapshot([queue])
+    assert snapshot["queue_depth"] == 1
+    assert snapshot["processed"] == 4
+    assert snapshot["invalid"] == 1
+    assert snapshot["processing"]["count"] == 4
+    assert snapshot["items_per_second"] > 0
+    # Taking a snapshot doesn't reset the rate for the next one
+    assert metrics.snapshot([queue])["items_per_second"] > 0
+
+
+def test_stage_metrics_rate_window(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    metrics = StageMetrics("pow")
+    for i in range(30):
+        now[0] += 1
+        metrics.record_batch(10, 0.001)
+
+    # The samples cover the last RATE_WINDOW seconds and one before them
+    assert len(metrics.samples) == RATE_WINDOW + 2
+    assert metrics.snapshot([])["items_per_second"] == pytest.approx(10)
@@ -0,0 +1,21 @@
+from network.seen_filter import RecentlySeen
+
+
+def test_check_counts_hits_and_misses():
+    seen = RecentlySeen()
+    assert not seen.check(b"a")
+    seen.add(b"a")
+    assert seen.check(b"a")
+    assert seen.check(b"a")
+    assert (seen.hits, seen.misses) == (2, 1)
+
+
+def test_forgets_oldest_keys():
+    seen = RecentlySeen(capacity=4)
+    for i in range(5):
+        seen.add(bytes([i]))
+
+    assert len(seen) <= 4
+    assert bytes([0]) not in seen
+    assert bytes([3]) in seen
+    assert bytes([4]) in seen
@@ -0,0 +1,20 @@
+import pytest
+
+from network.sharded_queue import ShardedQueue
+
+
+@pytest.mark.asyncio
+async def test_same_key_same_shard():
+    queue = ShardedQueue(shards=4)
+    for i in range(10):
+        await queue.put(i, b"account")
+
+    shard = queue.shard(b"account")
+    assert queue.qsize() == 10
+    assert [shard.get_nowait() for i in range(10)] == list(range(10))
+
+
+def test_capacity_is_split_between_shards():
+    queue = ShardedQueue(shards=4, maxsize=100)
+    assert all(shard.maxsize == 25 for shard in queue.queues)
+    assert all(shard.maxsize == 0 for shard in ShardedQueue(shards=2).queues)
@@ -0,0 +1,121 @@
+import asyncio
+import time
+
+import pytest
+
+from models.blocks import OpenBlock
+from models.messages import BulkPullMessage, FrontierReqMessage
+from network.snapshot_peer import (
+    Shaper,
+    SnapshotLedger,
+    SnapshotPeer,
+    parse_peer,
+)
+from network.stream_decoder import (
+    BlockStreamDecoder,
+    FrontierStreamDecoder,
+    read_batches,
+)
+from storage.snapshot import Snapshot
+from util.ledger_generator import LedgerGenerator
+
+
+@pytest.fixture(scope="module")
+def generator():
+    generator = LedgerGenerator(accounts=5, blocks=20)
+    generator.generate()
+    return generator
+
+
+@pytest.fixture
+def ledger(tmp_path, generator):
+    path = str(tmp_path / "ledger.snapshot")
+    generator.write(path)
+    snapshot = Snapshot(path)
+    yield SnapshotLedger(snapshot)
+    snapshot.close()
+
+
+async def connect(peer):
+    server = await asyncio.start_server(peer.handle_connection, "127.0.0.1", 0)
+    port = server.sockets[0].getsockname()[1]
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    return server, reader, writer
+
+
+async def disconnect(server, writer):
+    writer.close()
+    await writer.wait_closed()
+    # Let the connection handler see the end of the stream before the loop closes
+    await asyncio.sleep(0.01)
+    server.close()
+
+
+async def read_all(reader, decoder):
+    items = []
+    async for batch in read_batches(reader, decoder):
+        items.extend(batch)
+    return items
+
+
+def test_parse_peer():
+    assert parse_peer("::ffff:192.168.1.136:7075") == ("::ffff:192.168.1.136", 7075)
+    assert parse_peer("[::1]:7076") == ("::1", 7076)
+    assert parse_peer("localhost:7075") == ("localhost", 7075)
+
+
+@pytest.mark.asyncio
+async def test_frontiers_and_pulls(ledger, generator):
+    peer = SnapshotPeer(ledger)
+    server, reader, writer = await connect(peer)
+
+    writer.write(FrontierReqMessage(count=bytes([255] * 4)).to_bytes())
+    frontiers = await read_all(reader, FrontierStreamDecoder())
+    expected = sorted(
+        (generator.public_key(i), generator.head(i))
+        for i in range(len(generator.chains))
+    )
+    assert frontiers == expected
+
+    # Several pulls on one connection, the whole chain and the blocks after a known block
+    chain = generator.chains[0]
+    decoder = BlockStreamDecoder()
+    writer.write(BulkPullMessage(start=generator.public_key(0)).to_bytes())
+    blocks = await read_all(reader, decoder)
+    assert [b.to_bytes() for b in blocks] == [b.to_bytes() for b in reversed(chain)]
+    assert isinstance(blocks[-1], OpenBlock)
+
+    decoder.reset()
+    end = chain[1].hash_sync()
+    writer.write(BulkPullMessage(start=generator.public_key(0), end=end).to_bytes())
+    blocks = await read_all(reader, decoder)
+    assert [b.hash_sync() for b in blocks] == [
+        b.hash_sync() for b in reversed(chain[2:])
+    ]
+
+    # Unknown accounts get an empty response
+    decoder.reset()
+    writer.write(BulkPullMessage(start=bytes([9] * 32)).to_bytes())
+    assert await read_all(reader, decoder) == []
+
+    await disconnect(server, writer)
+    assert peer.frontier_requests == 1 and peer.bulk_pulls == 3
+
+
+def test_frontiers_from_start(ledger):
+    frontiers = list(ledger.frontiers(ledger.accounts[2], count=2))
+    assert [account for account, _ in frontiers] == ledger.accounts[2:4]
+
+
+@pytest.mark.asyncio
+async def test_shaping(ledger):
+    peer = SnapshotPeer(ledger, Shaper(latency=0.05, bandwidth=20000))
+    server, reader, writer = await connect(peer)
+
+    s = time.monotonic()
+    writer.write(FrontierReqMessage(count=bytes([255] * 4)).to_bytes())
+    await read_all(reader, FrontierStreamDecoder())
+    # 5 frontiers and the terminator, 384 bytes at 20000 bytes/s after the latency
+    assert time.monotonic() - s >= 0.05 + 384 / 20000
+
+    await disconnect(server, writer)
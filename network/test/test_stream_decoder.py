@@ -0,0 +1,117 @@
+import asyncio
+
+import pytest
+
+from models.blocks import BlockType, OpenBlock, SendBlock
+from network.stream_decoder import (
+    BlockStreamDecoder,
+    FrontierStreamDecoder,
+    StreamDecoder,
+    read_batches,
+)
+
+
+@pytest.fixture
+def blocks():
+    return [
+        SendBlock(bytes([1] * 32), bytes([2] * 32), bytes(16), bytes(64), bytes(8)),
+        OpenBlock(bytes([3] * 32), bytes(32), bytes([4] * 32), bytes(64), bytes(8)),
+    ]
+
+
+@pytest.fixture
+def bulk_pull_response(blocks):
+    return b"".join(block.to_bytes() for block in blocks) + bytes(
+        [BlockType.NOT_A_BLOCK]
+    )
+
+
+def test_decode_whole_response(blocks, bulk_pull_response):
+    decoder = BlockStreamDecoder()
+    decoder.feed(bulk_pull_response)
+    decoded = decoder.decode()
+    assert [block.to_bytes() for block in decoded] == [
+        block.to_bytes() for block in blocks
+    ]
+    assert decoder.finished
+    assert len(decoder.buffer) == 0
+
+
+def test_decode_byte_by_byte(blocks, bulk_pull_response):
+    decoder = BlockStreamDecoder()
+    decoded = []
+    for i in range(len(bulk_pull_response)):
+        decoder.feed(bulk_pull_response[i : i + 1])
+        decoded.extend(decoder.decode())
+    assert [block.hash_sync() for block in decoded] == [
+        block.hash_sync() for block in blocks
+    ]
+    assert decoder.finished
+
+
+def test_decode_keeps_data_after_end(bulk_pull_response):
+    decoder = BlockStreamDecoder()
+    decoder.feed(bulk_pull_response + bulk_pull_response[:10])
+    assert len(decoder.decode()) == 2
+    assert decoder.buffer == bulk_pull_response[:10]
+
+
+def test_stream_decoder_is_abstract():
+    with pytest.raises(TypeError):
+        StreamDecoder()
+
+
+def test_decode_invalid_block_type():
+    decoder = BlockStreamDecoder()
+    decoder.feed(bytes([0xFF]))
+    with pytest.raises(Exception):
+        decoder.decode()
+
+
+def test_decode_frontiers():
+    frontiers = [(bytes([i] * 32), bytes([i + 1] * 32)) for i in range(1, 4)]
+    data = b"".join(account + head for account, head in frontiers) + bytes(64)
+    decoder = FrontierStreamDecoder()
+    decoder.feed(data[:100])
+    decoded = decoder.decode()
+    decoder.feed(data[100:])
+    decoded.extend(decoder.decode())
+    assert decoded == frontiers
+    assert decoder.finished
+
+
+@pytest.mark.asyncio
+async def test_read_batches(blocks, bulk_pull_response):
+    reader = asyncio.StreamReader()
+    reader.feed_data(bulk_pull_response[:50])
+    reader.feed_data(bulk_pull_response[50:])
+    reader.feed_eof()
+
+    batches = [batch async for batch in read_batches(reader, BlockStreamDecoder())]
+    assert sum(len(batch) for batch in batches) == len(blocks)
+
+
+@pytest.mark.asyncio
+async def test_read_batches_max_count(blocks, bulk_pull_response):
+    reader = asyncio.StreamReader()
+    reader.feed_data(bulk_pull_response)
+    decoder = BlockStreamDecoder()
+
+    batches = [batch async for batch in read_batches(reader, decoder, max_count=1)]
+    assert [block.to_bytes() for batch in batches for block in batch] == [
+        blocks[0].to_bytes()
+    ]
+    # The rest of the response is left for the next read
+    assert [block.to_bytes() for block in decoder.decode()] == [blocks[1].to_bytes()]
+    assert decoder.finished
+
+
+@pytest.mark.asyncio
+async def test_read_batches_unexpected_end(bulk_pull_response):
+    reader = asyncio.StreamReader()
+    reader.feed_data(bulk_pull_response[:-1])
+    reader.feed_eof()
+
+    with pytest.raises(EOFError):
+        async for batch in read_batches(reader, BlockStreamDecoder()):
+            pass
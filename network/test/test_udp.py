@@ -0,0 +1,176 @@
+import asyncio
+
+import pytest
+
+from models.blocks import OpenBlock
+from models.messages import (
+    KeepAliveMessage,
+    MessageParser,
+    MessageType,
+    PublishMessage,
+    ReqMessage,
+)
+from network.block_handler import BlockHandler, OverloadPolicy
+from network.udp import MessageDispatcher, UDPIngressProtocol, check_header
+from storage.in_memory import InMemoryStorage
+
+addr = ("::1", 7075, 0, 0)
+
+
+class FakeTransport:
+    def __init__(self):
+        self.sent = []
+
+    def sendto(self, data, addr):
+        self.sent.append((data, addr))
+
+
+@pytest.fixture
+def publish_message():
+    block = OpenBlock(bytes(32), bytes(32), bytes([1] * 32), bytes(64), bytes(8))
+    return PublishMessage(block_type=block.block_type, block=block).to_bytes()
+
+
+def test_check_header(publish_message):
+    assert check_header(publish_message)
+    assert check_header(KeepAliveMessage().to_bytes())
+
+    # Too short, wrong magic, version outside of the advertised range, unknown message type
+    assert not check_header(publish_message[:7])
+    assert not check_header(b"XX" + publish_message[2:])
+    assert not check_header(publish_message[:3] + bytes([6]) + publish_message[4:])
+    assert not check_header(publish_message[:5] + bytes([99]) + publish_message[6:])
+
+
+@pytest.mark.asyncio
+async def test_ingress_batches_datagrams(publish_message):
+    batches = []
+
+    async def handle_batch(batch, transport):
+        batches.append(batch)
+
+    protocol = UDPIngressProtocol(handle_batch, batch_window=0.01)
+    for _ in range(3):
+        protocol.datagram_received(publish_message, addr)
+    protocol.datagram_received(b"garbage", addr)
+    assert batches == []
+
+    await asyncio.sleep(0.05)
+
+    assert len(batches) == 1
+    assert batches[0] == [(publish_message, addr)] * 3
+    assert protocol.received_count == 4
+    assert protocol.rejected_count == 1
+
+
+@pytest.mark.asyncio
+async def test_ingress_flushes_full_batch(publish_message):
+    batches = []
+
+    async def handle_batch(batch, transport):
+        batches.append(batch)
+
+    protocol = UDPIngressProtocol(handle_batch, batch_window=10, max_batch_size=2)
+    for _ in range(5):
+        protocol.datagram_received(publish_message, addr)
+    await asyncio.sleep(0)
+
+    assert [len(batch) for batch in batches] == [2, 2]
+    protocol.connection_lost(None)
+    await asyncio.sleep(0)
+    assert [len(batch) for batch in batches] == [2, 2, 1]
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize(
+    "policy, handled",
+    [(OverloadPolicy.DROP_NEWEST, [0, 1]), (OverloadPolicy.DROP_OLDEST, [0, 2])],
+)
+async def test_ingress_limits_tasks(publish_message, policy, handled):
+    batches = []
+    release = asyncio.Event()
+
+    async def handle_batch(batch, transport):
+        batches.append(batch[0][1])
+        await release.wait()
+
+    protocol = UDPIngressProtocol(
+        handle_batch,
+        max_batch_size=1,
+        max_tasks=1,
+        max_pending=1,
+        overload_policy=policy,
+    )
+    # One batch is handled, one waits and one is dropped
+    for i in range(3):
+        protocol.datagram_received(publish_message, i)
+    await asyncio.sleep(0)
+    assert batches == [0]
+    assert len(protocol.tasks) == 1
+    assert protocol.dropped_count == 1
+
+    release.set()
+    await asyncio.sleep(0.01)
+    assert batches == handled
+    assert not protocol.tasks and not protocol.pending
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_hands_blocks_to_block_handler(publish_message):
+    block_handler = BlockHandler(InMemoryStorage())
+    dispatcher = MessageDispatcher(block_handler)
+    transport = FakeTransport()
+
+    await block_handler.start()
+    await dispatcher.handle_batch(
+        [
+            (publish_message, addr),
+            (KeepAliveMessage().to_bytes(), addr),
+            (publish_message[:-1], addr),
+        ],
+        transport,
+    )
+    await block_handler.stop()
+
+    # The block has no valid PoW, so the pipeline rejects it
+    assert block_handler.invalid_pow_count == 1
+    assert dispatcher.invalid_count == 1
+    assert transport.sent == [(KeepAliveMessage().to_bytes(), addr)]
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_hands_confirm_req_blocks_to_block_handler():
+    block = OpenBlock(bytes(32), bytes(32), bytes([2] * 32), bytes(64), bytes(8))
+    req = ReqMessage(block_type=block.block_type, block=block).to_bytes()
+    block_handler = BlockHandler(InMemoryStorage())
+    dispatcher = MessageDispatcher(block_handler)
+
+    await block_handler.start()
+    await dispatcher.handle_batch([(req, addr), (req, addr)], FakeTransport())
+    await block_handler.stop()
+
+    assert dispatcher.counts[MessageType.CONFIRM_REQ] == 2
+    # The copy is dropped as a duplicate of the block in the pipeline
+    assert dispatcher.duplicate_count == 1
+    assert block_handler.invalid_pow_count == 1
+
+
+@pytest.mark.asyncio
+async def test_dispatcher_checks_duplicates_once(publish_message):
+    block_handler = BlockHandler(InMemoryStorage())
+    dispatcher = MessageDispatcher(block_handler)
+    block_hash = MessageParser.parse(publish_message).block_hash
+
+    await dispatcher.handle_batch([(publish_message, addr)], FakeTransport())
+    assert block_handler.recently_seen.misses == 1
+    assert block_handler.recently_seen.hits == 0
+
+    # A copy of a committed block is a hit, and doesn't reach the pipeline
+    block_handler.pow_queue.queues[0].get_nowait()
+    block_handler.chain_keys.clear()
+    block_handler.recently_seen.add(block_hash)
+    await dispatcher.handle_batch([(publish_message, addr)], FakeTransport())
+    assert block_handler.recently_seen.misses == 1
+    assert block_handler.recently_seen.hits == 1
+    assert dispatcher.duplicate_count == 1
+    assert all(queue.empty() for queue in block_handler.pow_queue.queues)
@@ -0,0 +1,64 @@
+import asyncio
+
+import pytest
+
+from models.vote import Vote
+from network.vote_verifier import VoteVerifier
+from util.crypto import sign
+from util.numbers import deterministic_key
+
+block_hash = bytes([7] * 32)
+
+
+def make_vote(sequence: int, index: int = 0) -> Vote:
+    priv, pub = deterministic_key(bytes(32), index)
+    vote = Vote(pub, bytes(64), sequence.to_bytes(8, "little"))
+    vote.signature = sign(vote.vote_hash(block_hash), priv)
+    return vote
+
+
+@pytest.mark.asyncio
+async def test_vote_verifier_batches_votes():
+    verifier = VoteVerifier(batch_window=0.01)
+    votes = [make_vote(sequence, index) for sequence in range(3) for index in range(2)]
+
+    results = await asyncio.gather(*[verifier.verify(v, block_hash) for v in votes])
+
+    assert results == [True] * len(votes)
+    assert verifier.batch_count == 1
+
+
+@pytest.mark.asyncio
+async def test_vote_verifier_caches_valid_votes():
+    verifier = VoteVerifier(batch_window=0)
+    vote = make_vote(1)
+
+    assert await verifier.verify(vote, block_hash)
+    # Rebroadcast copies of the vote, while it is verified and after that
+    assert all(
+        await asyncio.gather(*[verifier.verify(vote, block_hash) for _ in range(3)])
+    )
+    assert await verifier.verify(vote, block_hash)
+
+    assert verifier.batch_count == 1
+    assert verifier.metrics_snapshot()["cache_hits"] == 4
+
+
+@pytest.mark.asyncio
+async def test_vote_verifier_rejects_invalid_votes():
+    verifier = VoteVerifier(batch_window=0)
+    vote = make_vote(1)
+    forged = Vote(vote.account, bytes(64), vote.sequence)
+
+    assert not await verifier.verify(forged, block_hash)
+    # A different block or sequence is a different vote
+    assert not await verifier.verify(vote, bytes(32))
+    assert await verifier.verify(vote, block_hash)
+
+    # Invalid votes are not cached, so they are checked again
+    assert not await verifier.verify(forged, bytes(32))
+    assert verifier.invalid_count == 3
+
+    # A verified vote doesn't vouch for a copy with another signature
+    assert not await verifier.verify(forged, block_hash)
+    assert verifier.invalid_count == 4
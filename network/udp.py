@@ -0,0 +1,306 @@
+import argparse
+import asyncio
+import multiprocessing
+import os
+import socket
+import time
+from collections import deque
+from typing import Awaitable, Callable, Deque, Dict, List, Optional, Set, Tuple
+
+import uvloop
+
+from models.blocks import SendBlock
+from models.messages import (
+    HEADER_LENGTH,
+    NETWORK_MAGIC,
+    AckMessage,
+    KeepAliveMessage,
+    Message,
+    MessageParser,
+    MessageType,
+    PublishMessage,
+    ReqMessage,
+)
+from network.block_handler import BlockHandler, OverloadPolicy
+from network.vote_verifier import VoteVerifier
+from storage.in_memory import InMemoryStorage
+from type_definitions import Address
+
+# Oldest protocol version we accept messages from
+MIN_PROTOCOL_VERSION = 1
+
+MESSAGE_TYPE_VALUES = frozenset(message_type.value for message_type in MessageType)
+
+Datagram = Tuple[bytes, Address]
+BatchHandler = Callable[[List[Datagram], asyncio.DatagramTransport], Awaitable]
+
+
+def check_header(data: bytes) -> bool:
+    # Rejects datagrams that can't be messages of our network by looking at a few header bytes,
+    # before anything is parsed
+    if len(data) < HEADER_LENGTH or data[0:2] != NETWORK_MAGIC:
+        return False
+    version_max, version_using, version_min = data[2], data[3], data[4]
+    if not version_min <= version_using <= version_max:
+        return False
+    if version_using < MIN_PROTOCOL_VERSION:
+        return False
+    return data[5] in MESSAGE_TYPE_VALUES
+
+
+class UDPIngressProtocol(asyncio.DatagramProtocol):
+    # Collects datagrams that pass the header check for up to batch_window seconds, or until
+    # max_batch_size have been received, and hands them to handle_batch in one call. This keeps
+    # datagram_received down to a few byte comparisons and a list append.
+    # At most max_tasks batches are handled at a time. Up to max_pending more wait for a free task,
+    # beyond that batches are dropped according to the overload policy, like blocks at the block
+    # handler, so a flood of datagrams can't pile up tasks without limit.
+    def __init__(
+        self,
+        handle_batch: BatchHandler,
+        batch_window: float = 0.005,
+        max_batch_size: int = 1024,
+        max_tasks: int = 64,
+        max_pending: int = 64,
+        overload_policy: OverloadPolicy = OverloadPolicy.DROP_NEWEST,
+    ):
+        self.handle_batch = handle_batch
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.max_tasks = max_tasks
+        self.max_pending = max_pending
+        self.overload_policy = overload_policy
+
+        self.transport: Optional[asyncio.DatagramTransport] = None
+        self.batch: List[Datagram] = []
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+        self.tasks: Set[asyncio.Future] = set()
+        self.pending: Deque[List[Datagram]] = deque()
+
+        self.received_count = 0
+        self.rejected_count = 0
+        self.batch_count = 0
+        # Datagrams of dropped batches
+        self.dropped_count = 0
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def connection_lost(self, exc):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+        self.flush()
+
+    def error_received(self, exc):
+        print(f"udp error: {exc}")
+
+    def datagram_received(self, data, addr):
+        self.received_count += 1
+        if not check_header(data):
+            self.rejected_count += 1
+            return
+
+        self.batch.append((data, addr))
+        if len(self.batch) >= self.max_batch_size:
+            if self.flush_handle is not None:
+                self.flush_handle.cancel()
+            self.flush()
+        elif self.flush_handle is None:
+            self.flush_handle = asyncio.get_event_loop().call_later(
+                self.batch_window, self.flush
+            )
+
+    def flush(self):
+        self.flush_handle = None
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        self.batch_count += 1
+
+        if len(self.tasks) < self.max_tasks:
+            self.start_task(batch)
+            return
+        if len(self.pending) >= self.max_pending:
+            if self.overload_policy == OverloadPolicy.DROP_OLDEST and self.pending:
+                self.dropped_count += len(self.pending.popleft())
+            else:
+                self.dropped_count += len(batch)
+                return
+        self.pending.append(batch)
+
+    def start_task(self, batch: List[Datagram]):
+        task = asyncio.ensure_future(self.handle_batch(batch, self.transport))
+        self.tasks.add(task)
+        task.add_done_callback(self.task_done)
+
+    def task_done(self, task: asyncio.Future):
+        self.tasks.discard(task)
+        if self.pending:
+            self.start_task(self.pending.popleft())
+
+
+class MessageDispatcher:
+    # Parses a batch of datagrams and passes the messages on. Published blocks go straight into the
+    # block handler, whose pipeline checks PoW and signatures of many blocks at a time, instead of
+    # verifying every message on its own here.
+    def __init__(
+        self,
+        block_handler: BlockHandler,
+        expand_peers: bool = False,
+        vote_verifier: Optional[VoteVerifier] = None,
+    ):
+        self.block_handler = block_handler
+        self.expand_peers = expand_peers
+        self.vote_verifier = (
+            vote_verifier if vote_verifier is not None else VoteVerifier()
+        )
+
+        self.counts: Dict[MessageType, int] = {}
+        self.duplicate_count = 0
+        self.invalid_count = 0
+
+    def parse(self, data: bytes) -> Optional[Message]:
+        try:
+            return MessageParser.parse(data)
+        except Exception:
+            self.invalid_count += 1
+            return None
+
+    async def handle_batch(
+        self, batch: List[Datagram], transport: asyncio.DatagramTransport
+    ):
+        acks: List[AckMessage] = []
+        for data, addr in batch:
+            message = self.parse(data)
+            if message is None:
+                continue
+            message_type = message.header.message_type
+            self.counts[message_type] = self.counts.get(message_type, 0) + 1
+
+            # The same blocks are published by many peers. Blocks we already have are dropped
+            # before any PoW or signature checks, and before the block is even decoded.
+            if isinstance(
+                message, (PublishMessage, ReqMessage)
+            ) and self.block_handler.is_duplicate_hash(message.block_hash):
+                self.duplicate_count += 1
+                continue
+
+            if isinstance(message, (PublishMessage, ReqMessage)):
+                # The block of a confirm_req is one we may not have yet, so it goes through the
+                # pipeline like a published one. Votes aren't sent, we are not a representative.
+                # Never wait for the pipeline here, blocks are dropped instead when it is full
+                self.block_handler.handle_block_nowait(
+                    message.block, checked_duplicate=True
+                )
+            elif isinstance(message, AckMessage):
+                # Only the vote is checked here. A block we don't have yet goes through the
+                # pipeline like a published one.
+                if message.block_hash not in self.block_handler.recently_seen:
+                    self.block_handler.handle_block_nowait(message.block)
+                acks.append(message)
+            elif isinstance(message, KeepAliveMessage):
+                self.handle_keepalive(message, addr, transport)
+
+        if acks:
+            results = await asyncio.gather(
+                *[ack.verify_signature(self.vote_verifier) for ack in acks]
+            )
+            self.invalid_count += results.count(False)
+
+    def handle_keepalive(
+        self,
+        message: KeepAliveMessage,
+        addr: Address,
+        transport: asyncio.DatagramTransport,
+    ):
+        keepalive_response = KeepAliveMessage().to_bytes()
+        transport.sendto(keepalive_response, addr)
+
+        if self.expand_peers and len(message.peers):
+            transport.sendto(keepalive_response, message.peers[0].to_tuple())
+
+
+def send_datagrams(datagrams: List[bytes], port: int, duration: float, sent):
+    # Runs in its own process, so sending doesn't compete with the receiving event loop
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    count = 0
+    s = time.time()
+    while time.time() - s < duration:
+        for data in datagrams:
+            try:
+                sock.sendto(data, ("127.0.0.1", port))
+            except BlockingIOError:
+                continue
+            count += 1
+    sock.close()
+    sent.value = count
+
+
+async def benchmark(count: int, duration: float, batch_window: float, port: int):
+    # Sends publish messages with random blocks to a local endpoint for duration seconds, and
+    # reports how many messages per second made it through the ingress into the block handler.
+    # The blocks have no valid PoW, so they are dropped by the first pipeline stage.
+    loop = asyncio.get_event_loop()
+    block_handler = BlockHandler(InMemoryStorage())
+    await block_handler.start()
+    dispatcher = MessageDispatcher(block_handler)
+
+    server, protocol = await loop.create_datagram_endpoint(
+        lambda: UDPIngressProtocol(dispatcher.handle_batch, batch_window),
+        local_addr=("127.0.0.1", port),
+    )
+
+    datagrams = [
+        PublishMessage(
+            block_type=SendBlock.BLOCK_TYPE,
+            block=SendBlock.parse(os.urandom(SendBlock.LENGTH)),
+        ).to_bytes()
+        for _ in range(count)
+    ]
+
+    sent = multiprocessing.Value("q", 0)
+    sender = multiprocessing.Process(
+        target=send_datagrams, args=(datagrams, port, duration, sent)
+    )
+    s = time.time()
+    sender.start()
+    await loop.run_in_executor(None, sender.join)
+    await asyncio.sleep(batch_window * 2)
+    # Finished tasks start the pending batches
+    while protocol.tasks:
+        await asyncio.gather(*protocol.tasks)
+    e = time.time()
+
+    server.close()
+    await block_handler.stop()
+
+    dispatched = sum(dispatcher.counts.values())
+    print(
+        f"sent {sent.value} messages, received {protocol.received_count} in "
+        f"{protocol.batch_count} batches, dispatched {dispatched}, "
+        f"dropped {protocol.dropped_count}"
+    )
+    print(
+        f"{dispatched / (e - s):.0f} messages/s sustained over {e - s:.1f}s, "
+        f"{sent.value - protocol.received_count} lost"
+    )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="UDP ingress")
+    parser.add_argument(
+        "--bench", action="store_true", help="measure sustained messages per second"
+    )
+    parser.add_argument("--count", type=int, default=10000, help="distinct messages")
+    parser.add_argument("--duration", type=float, default=5.0, help="seconds")
+    parser.add_argument("--batch-window", type=float, default=0.005, help="seconds")
+    parser.add_argument("--port", type=int, default=17075)
+    args = parser.parse_args()
+
+    if args.bench:
+        # Same event loop as the server
+        loop = uvloop.new_event_loop()
+        asyncio.set_event_loop(loop)
+        loop.run_until_complete(
+            benchmark(args.count, args.duration, args.batch_window, args.port)
+        )
@@ -0,0 +1,94 @@
+import asyncio
+from concurrent.futures import Executor
+from typing import Dict, List, Optional, Tuple
+
+from executors import process_executor
+from models.vote import Vote
+from network.seen_filter import RecentlySeen
+from util.crypto import verify_signatures_batch_async
+
+
+class VoteVerifier:
+    # Verifies vote signatures in batches, and remembers the votes that were valid. Representatives'
+    # votes are rebroadcast by many peers, so most votes are answered from the cache without any
+    # signature check. Votes that miss the cache are collected for up to batch_window seconds, or
+    # until batch_size votes are waiting, and verified together.
+    def __init__(
+        self,
+        batch_size: int = 256,
+        batch_window: float = 0.002,
+        capacity: int = 200000,
+        executor: Executor = process_executor,
+    ):
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.executor = executor
+
+        # Cache keys of verified votes, which include the signature
+        self.verified = RecentlySeen(capacity)
+        # Votes waiting for verification, by cache key. Copies of a vote that arrive while it is
+        # being verified wait for the same result.
+        self.pending: Dict[bytes, asyncio.Future] = {}
+        self.batch: List[Tuple[bytes, Tuple[bytes, bytes, bytes]]] = []
+        self.flush_handle: Optional[asyncio.TimerHandle] = None
+
+        self.batch_count = 0
+        self.invalid_count = 0
+
+    async def verify(self, vote: Vote, block_hash: bytes) -> bool:
+        key = vote.cache_key(block_hash)
+        if self.verified.check(key):
+            return True
+
+        future = self.pending.get(key)
+        if future is None:
+            future = self.pending[key] = asyncio.get_event_loop().create_future()
+            self.batch.append((key, vote.signature_item(block_hash)))
+            if len(self.batch) >= self.batch_size:
+                self.flush()
+            elif self.flush_handle is None:
+                self.flush_handle = asyncio.get_event_loop().call_later(
+                    self.batch_window, self.flush
+                )
+        # Other copies of the vote may be waiting for the same future
+        return await asyncio.shield(future)
+
+    def flush(self):
+        if self.flush_handle is not None:
+            self.flush_handle.cancel()
+            self.flush_handle = None
+        if not self.batch:
+            return
+        batch, self.batch = self.batch, []
+        self.batch_count += 1
+        asyncio.ensure_future(self.verify_batch(batch))
+
+    async def verify_batch(self, batch):
+        try:
+            results = await verify_signatures_batch_async(
+                [item for _, item in batch], self.executor
+            )
+        except Exception as e:
+            results = None
+            error = e
+
+        for i, (key, _) in enumerate(batch):
+            future = self.pending.pop(key)
+            if future.done():
+                continue
+            if results is None:
+                future.set_exception(error)
+                continue
+            if results[i]:
+                self.verified.add(key)
+            else:
+                self.invalid_count += 1
+            future.set_result(results[i])
+
+    def metrics_snapshot(self):
+        return {
+            "cache_hits": self.verified.hits,
+            "cache_misses": self.verified.misses,
+            "batches": self.batch_count,
+            "invalid": self.invalid_count,
+        }
@@ -1,121 +1,172 @@
+import argparse
 import asyncio
 import signal
 from concurrent.futures import Executor
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 
 import time
 
-import marshal
 import uvloop
 import pickle
-from uvloop.loop import UDPTransport, Loop, Server
+from uvloop.loop import Loop, Server
 
 from executors import process_executor, thread_executor
-from models.blocks import BlockType, BlockParser, Block
-from models.messages import (
-    Message,
-    MessageParser,
-    KeepAliveMessage,
-    FrontierReqMessage,
-    BulkPullMessage,
+from models.blocks import BlockType, Block
+from models.messages import FrontierReqMessage, BulkPullMessage
+from network.block_handler import BlockHandler
+from network.bootstrap import BootstrapScheduler, PullRequest, diff_frontiers
+from network.bootstrap_server import BootstrapServerProtocol
+from network.snapshot_peer import parse_peer
+from network.udp import MessageDispatcher, UDPIngressProtocol
+from network.stream_decoder import (
+    BlockStreamDecoder,
+    FrontierStreamDecoder,
+    read_batches,
 )
-from type_definitions import Address
+from storage.account_index import open_lmdb_ledger
+from storage.snapshot import SnapshotWriter
+from util.crypto import POW_THRESHOLD, TEST_POW_THRESHOLD
 
 asyncio.set_event_loop_policy(uvloop.EventLoopPolicy())
 
 EXPAND_PEERS = False
 
-peers = [("::ffff:192.168.1.136", 7075)]
-
-
-async def handle_msg(data: bytes, addr: Address, transport: UDPTransport):
-    message: Message = MessageParser.parse(data)
-    print(message.header.message_type)
-
-    if not await message.verify():
-        print("INVALID MESSAGE!!")
-        print(message.header.message_type)
-        raise Exception("INVALID MESSAGE")
-    else:
-        print("Message valid")
-
-    if isinstance(message, KeepAliveMessage):
-        print("peers..")
-        print(message.peers)
-
-        keepalive_response = KeepAliveMessage().to_bytes()
-        transport.sendto(keepalive_response, addr)
+parser = argparse.ArgumentParser(description="Run a node")
+parser.add_argument(
+    "--peer",
+    type=parse_peer,
+    action="append",
+    help="host:port of a bootstrap peer, such as python -m network.snapshot_peer",
+)
+parser.add_argument(
+    "--ledger",
+    default="lm.db",
+    help="LMDB environment of the blocks and the account index, kept across restarts",
+)
+parser.add_argument(
+    "--pow-threshold",
+    type=lambda value: int(value, 16),
+    default=POW_THRESHOLD,
+    help="hex, ledgers from util.ledger_generator use "
+    f"{TEST_POW_THRESHOLD:x} unless they were generated with another",
+)
+parser.add_argument(
+    "--metrics-interval",
+    type=float,
+    default=0,
+    help="seconds between logs of the block pipeline's per-stage metrics, 0 disables them",
+)
+args = parser.parse_args()
 
-        if EXPAND_PEERS and len(message.peers):
-            print(f"constructing keepalive for first peer {message.peers[0]}")
-            transport.sendto(keepalive_response, message.peers[0].to_tuple())
-        else:
-            print("found no valid peers")
+peers = args.peer or [("::ffff:192.168.1.136", 7075)]
 
-    print("done")
+SNAPSHOT_PATH = "ledger.snapshot"
 
+# Blocks by hash, and the chain metadata of each account, updated as blocks are committed. Both
+# are on disk, so after a restart only accounts that changed since are pulled again.
+block_storage, account_index = open_lmdb_ledger({"path": args.ledger})
 
-# This server needs to respond to frontier_req and bulk_pull
-class TCPServerProtocol(asyncio.Protocol):
-    def __init__(self):
-        print("init")
-        self.transport = None
+block_handler = BlockHandler(
+    block_storage,
+    account_index=account_index,
+    pow_threshold=args.pow_threshold,
+    metrics_interval=args.metrics_interval,
+)
+dispatcher = MessageDispatcher(block_handler, expand_peers=EXPAND_PEERS)
 
-    def connection_made(self, transport):
-        self.transport = transport
-        print("connection made")
 
-    def data_received(self, data):
-        print("tcp data received", data)
+async def connect(
+    peer: Tuple[str, int], attempts: int = 5, backoff: float = 0.5
+) -> Optional[Tuple[asyncio.StreamReader, asyncio.StreamWriter]]:
+    # Waits twice as long after each failed attempt. None if the peer can't be reached.
+    for attempt in range(attempts):
+        try:
+            return await asyncio.open_connection(peer[0], peer[1])
+        except OSError as e:
+            print(f"connecting to {peer[0]} {peer[1]} failed: {e}")
+            if attempt + 1 < attempts:
+                await asyncio.sleep(backoff * 2**attempt)
+    return None
 
 
-# Todo: this needs to fetch from a global queue. If many workers are spawned now they will all pull
-# the same frontiers.
 async def get_accounts(
     i: int,
-    frontiers: List[Tuple[bytes, bytes]],
-    reader: asyncio.StreamReader,
-    writer: asyncio.StreamWriter,
+    scheduler: BootstrapScheduler,
+    peer: Tuple[str, int],
+    snapshot: SnapshotWriter,
 ):
     print(f"start worker {i}")
+    writer: Optional[asyncio.StreamWriter] = None
     account_count = 0
     block_count = 0
     failures = 0
-    chains = []
-    while len(frontiers):
-        start, end = frontiers.pop()
-        message = BulkPullMessage(start=start, end=bytes(32))
-        writer.write(message.to_bytes())
-        await writer.drain()
+    while True:
+        pull = await scheduler.next_pull()
+        if pull is None:
+            break
+
+        if writer is None:
+            connection = await connect(peer)
+            if connection is None:
+                # The other workers may still get through, the pull goes back to them
+                scheduler.retry(pull)
+                print(f"worker {i} can't reach the peer, stopping")
+                break
+            reader, writer = connection
+            decoder = BlockStreamDecoder()
 
         try:
-            blocks = await read_bulk_pull(reader)
+            message = BulkPullMessage(start=pull.account, end=pull.end)
+            writer.write(message.to_bytes())
+            await writer.drain()
+            blocks = await read_bulk_pull(reader, decoder, pull.end)
         except Exception:
-            # If getting blocks failed, retry at a later stage
-            frontiers.append((start, end))
+            # If getting blocks failed, retry at a later stage. The stream is out of sync after a
+            # failed pull, so continue on a new connection.
+            scheduler.retry(pull)
             failures += 1
+            writer.close()
+            writer = None
             continue
 
+        scheduler.complete(pull)
+        # Bulk pulls return the newest block first. Waiting for the pipeline slows down the pulls
+        # when it can't keep up.
+        for block in reversed(blocks):
+            await block_handler.handle_block(block)
         account_count += 1
         block_count += len(blocks)
-        chains.append(blocks)
-        if len(frontiers) != 0 and len(frontiers) % 100 == 0:
-            print(f"frontiers left:{len(frontiers)}")
-
+        # Progress is saved as the chains arrive, the snapshot is flushed in large segments. A pull
+        # from our head only returns the newer blocks, which follow the head's height.
+        chain_height = len(blocks)
+        if pull.end != bytes(32):
+            end_height = account_index.block_height(pull.end)
+            chain_height += end_height.height if end_height is not None else 0
+        snapshot.add_chain(pull.account, blocks, chain_height)
+        if scheduler.outstanding != 0 and scheduler.outstanding % 100 == 0:
+            print(f"frontiers left:{scheduler.outstanding}")
+
+    if writer is not None:
+        writer.close()
     print(
         f"worker {i} done. Pulled {account_count} accounts, {block_count} blocks."
         f"Failures: {failures}"
     )
-    return chains
+    return account_count, block_count
 
 
-async def get_all_accounts(frontiers, num_workers=10):
-    tasks = []
-    for i in range(num_workers):
-        peer = peers[0]
-        reader, writer = await asyncio.open_connection(peer[0], peer[1])
-        tasks.append(get_accounts(i, frontiers, reader, writer))
-    return [chain for chains in await asyncio.gather(*tasks) for chain in chains]
+async def get_all_accounts(
+    pulls: List[PullRequest],
+    snapshot: SnapshotWriter,
+    num_workers=10,
+):
+    scheduler = BootstrapScheduler(pulls)
+    peer = peers[0]
+    tasks = [get_accounts(i, scheduler, peer, snapshot) for i in range(num_workers)]
+    counts = await asyncio.gather(*tasks)
+    if scheduler.failed or scheduler.outstanding:
+        print(f"Gave up on {len(scheduler.failed) + scheduler.outstanding} accounts")
+    return sum(c[0] for c in counts), sum(c[1] for c in counts)
 
 
 async def get_frontiers(host, port=7075):
@@ -137,85 +188,64 @@ async def get_frontiers(host, port=7075):
     frontiers = await read_frontiers(reader)
     print(f"Got {len(frontiers)} frontiers")
 
-    # TODO: Need to filter frontiers. If we already have frontiers newest block, don't fetch.
+    # Accounts where we have the frontier block, or a newer one, are skipped
+    pulls = diff_frontiers(frontiers, account_index)
+    print(f"Skipping {len(frontiers) - len(pulls)} accounts that are up to date")
     # TODO: If we have a newer block than the peer, we need to send them the update (bulk_push?)
 
     print("Getting accounts")
-    chains = await get_all_accounts(frontiers)
+    # All account chains are appended to the ledger snapshot
+    with SnapshotWriter(SNAPSHOT_PATH) as snapshot:
+        account_count, block_count = await get_all_accounts(pulls, snapshot)
     print("Finished getting accounts")
-    print(
-        f"Got {len(chains)} accounts with total of {sum(len(chain) for chain in chains)} blocks"
-    )
+    print(f"Got {account_count} accounts with total of {block_count} blocks")
     writer.close()
 
-    # Dump all account chains to file
-    with open("marshal_chains.dump", "wb") as f:
-        chains = list(
-            map(lambda chain: list(map(lambda block: block.to_bytes(), chain)), chains)
-        )
-        marshal.dump(chains, f)
-
     print(f"get_frontiers from {host} {port} done in {(time.time()-s)*1000}ms")
 
 
 async def read_frontiers(reader: asyncio.StreamReader):
-    c = 0
     frontiers = []
     # Note: frontiers arrive ordered by ascending account value
-    while True:
-        # Each frontier is 2x32 bytes
-        line = bytes()
-        while len(line) != 64:
-            line += await reader.read(64 - len(line))
-        account = line[0:32]
-        # The account 0000...0 signals the end of the frontiers message
-        if account == bytes(32):
-            break
-        block_hash = line[32:64]
-        frontiers.append((account, block_hash))
-        c += 1
+    async for batch in read_batches(reader, FrontierStreamDecoder()):
+        frontiers.extend(batch)
 
-    print(f"done pulling {c} frontiers!")
+    print(f"done pulling {len(frontiers)} frontiers!")
     return frontiers
 
 
-async def read_multiple_blocks(reader: asyncio.StreamReader, max_count: int = 0):
-    blocks: List[Block] = []
-    while True:
-        block_type_byte = await reader.read(1)
-        if not block_type_byte:
-            print("unexpected end of stream")
-            break
-
-        try:
-            block_type = BlockType(block_type_byte[0])
-        except ValueError:
-            raise Exception(f"{block_type_byte.hex()} is not a valid block type..")
-
-        # Block type 0x01 (NOT_A_BLOCK) signals that there are no more blocks
-        if block_type == BlockType.NOT_A_BLOCK:
-            break
-
-        # Need to read the right amount of bytes so that we start at the right place when reading
-        # the next block
-        length = BlockParser.length(block_type)
-        block_data = bytes()
-        # This is needed because reader.read(n) may return less than n bytes
-        while len(block_data) != length:
-            block_data += await reader.read(length - len(block_data))
-
-        block = BlockParser.parse(block_type, block_data)
-        blocks.append(block)
+async def read_multiple_blocks(
+    reader: asyncio.StreamReader,
+    decoder: Optional[BlockStreamDecoder] = None,
+    max_count: int = 0,
+):
+    # A decoder can be reused for consecutive responses on the same connection. With max_count,
+    # reading stops after that many blocks.
+    if decoder is None:
+        decoder = BlockStreamDecoder()
+    decoder.reset()
 
-        if max_count != 0 and len(blocks) == max_count:
-            break
+    blocks: List[Block] = []
+    try:
+        async for batch in read_batches(reader, decoder, max_count=max_count):
+            blocks.extend(batch)
+    except EOFError:
+        print("unexpected end of stream")
 
     return blocks
 
 
-async def read_bulk_pull(reader: asyncio.StreamReader):
-    blocks: List[Block] = read_multiple_blocks(reader)
-    if len(blocks) and blocks[-1].block_type != BlockType.OPEN:
+async def read_bulk_pull(
+    reader: asyncio.StreamReader,
+    decoder: Optional[BlockStreamDecoder] = None,
+    end: bytes = bytes(32),
+):
+    blocks: List[Block] = await read_multiple_blocks(reader, decoder)
+    if end != bytes(32):
+        # Only the blocks after end were requested, so the last block must follow it
+        if len(blocks) and blocks[-1].root != end:
+            raise Exception(f"Last block should follow {end.hex()}")
+    elif len(blocks) and blocks[-1].block_type != BlockType.OPEN:
         raise Exception(
             f"Last block should be OPEN, but was {blocks[-1].block_type.name}"
         )
@@ -231,17 +261,35 @@ async def startup():
 
     # Fetch frontiers and blocks from the local rai_node instance (separate service).
     # This should only be done on bootstrap in the future.
+    # Block storage filled by an import, or before the index existed, is indexed once
+    if account_index.is_empty():
+        count = account_index.rebuild(block_storage)
+        if count:
+            print(f"indexed {count} blocks")
+    await block_handler.start()
     peer = peers[0]
     await get_frontiers(peer[0], peer[1])
 
 
-loop = asyncio.get_event_loop()
+# A uvloop loop, from the policy set above
+loop = asyncio.new_event_loop()
+asyncio.set_event_loop(loop)
 
-tcp_coro = loop.create_server(TCPServerProtocol, "::", 8888)
+# Serves frontier_req and bulk_pull from our ledger
+tcp_coro = loop.create_server(
+    lambda: BootstrapServerProtocol(block_storage, account_index), "::", 8888
+)
 
 
 print("starting TCP server")
 server = loop.run_until_complete(tcp_coro)
+
+udp_coro = loop.create_datagram_endpoint(
+    lambda: UDPIngressProtocol(dispatcher.handle_batch), local_addr=("::", 7075)
+)
+
+print("starting UDP endpoint")
+udp_transport, _ = loop.run_until_complete(udp_coro)
 asyncio.ensure_future(startup(), loop=loop)
 
 
@@ -251,11 +299,12 @@ def shutdown(
     executors: List[Executor],
 ):
     print("shutting down sockets, processes, threads and abort tasks")
-    for task in asyncio.Task.all_tasks():
+    for task in asyncio.all_tasks(_loop):
         task.cancel()
     for executor in executors:
         executor.shutdown()
     _server.close()
+    udp_transport.close()
     _loop.stop()
 
 
@@ -269,3 +318,5 @@ loop.add_signal_handler(
 loop.run_forever()
 print("closing loop")
 loop.close()
+# The tables share one environment
+block_storage.close()
@@ -0,0 +1,236 @@
+import struct
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+from models.blocks import Block, BlockType
+from storage.in_memory import InMemoryStorage
+from storage.lmdb_storage import LmdbStorage
+from storage.storage import Storage
+
+# Index records. Integers are little endian, except for the height in chain keys.
+ACCOUNT_RECORD = struct.Struct("<32s32sQ")
+HEIGHT_RECORD = struct.Struct("<32sQ")
+
+
+class AccountInfo(NamedTuple):
+    head: bytes
+    open_block: bytes
+    block_count: int
+
+
+class BlockHeight(NamedTuple):
+    account: bytes
+    # The open block has height 1
+    height: int
+
+
+def chain_key(account: bytes, height: int) -> bytes:
+    # Big endian, so the keys of an account sort by height
+    return account + height.to_bytes(8, byteorder="big")
+
+
+def open_lmdb_ledger(config=None) -> Tuple[LmdbStorage, "AccountIndex"]:
+    # Blocks and their index in named databases of one LMDB environment, so committed blocks and
+    # their index records are written in one transaction
+    environment = LmdbStorage({**(config or {}), "max_dbs": 4})
+    return environment.open_table(b"blocks"), AccountIndex(
+        *[environment.open_table(name) for name in [b"accounts", b"heights", b"chains"]]
+    )
+
+
+class AccountIndex:
+    # Secondary indexes of the block storage, so chain metadata takes one lookup instead of a walk
+    # along previous hashes:
+    #
+    #   accounts: account -> head, open block hash, block count
+    #   heights:  block hash -> account, height
+    #   chains:   account, height -> block hash
+    #
+    # The indexes are updated with every batch of committed blocks. They follow the first chain
+    # seen of each account: blocks that don't extend the head of their account are forks and are
+    # not indexed.
+    def __init__(
+        self,
+        accounts: Optional[Storage] = None,
+        heights: Optional[Storage] = None,
+        chains: Optional[Storage] = None,
+    ):
+        self.accounts = accounts if accounts is not None else InMemoryStorage()
+        self.heights = heights if heights is not None else InMemoryStorage()
+        self.chains = chains if chains is not None else InMemoryStorage()
+        self.fork_count = 0
+
+    def account_info(self, account: bytes) -> Optional[AccountInfo]:
+        value = self.accounts.get(account)
+        return AccountInfo(*ACCOUNT_RECORD.unpack(value)) if value else None
+
+    def bulk_account_info(
+        self, accounts: List[bytes]
+    ) -> Dict[bytes, Optional[AccountInfo]]:
+        return {
+            account: AccountInfo(*ACCOUNT_RECORD.unpack(value)) if value else None
+            for account, value in self.accounts.bulk_get(accounts).items()
+        }
+
+    def block_height(self, block_hash: bytes) -> Optional[BlockHeight]:
+        value = self.heights.get(block_hash)
+        return BlockHeight(*HEIGHT_RECORD.unpack(value)) if value else None
+
+    def bulk_block_heights(
+        self, block_hashes: List[bytes]
+    ) -> Dict[bytes, Optional[BlockHeight]]:
+        return {
+            block_hash: BlockHeight(*HEIGHT_RECORD.unpack(value)) if value else None
+            for block_hash, value in self.heights.bulk_get(block_hashes).items()
+        }
+
+    def chain_hashes(self, account: bytes, low: int, high: int) -> List[bytes]:
+        # Hashes of the blocks from height low to high, oldest first. Stops at the first height
+        # that isn't indexed.
+        keys = [chain_key(account, height) for height in range(low, high + 1)]
+        values = self.chains.bulk_get(keys)
+        hashes = []
+        for key in keys:
+            if values[key] is None:
+                break
+            hashes.append(values[key])
+        return hashes
+
+    def frontiers(self, start: bytes, limit: int) -> List[Tuple[bytes, bytes]]:
+        # (account, head) of up to limit accounts from start on, in ascending account order
+        return [
+            (account, value[:32]) for account, value in self.accounts.scan(start, limit)
+        ]
+
+    def is_empty(self) -> bool:
+        return not self.accounts.scan(bytes(), 1)
+
+    def rebuild(self, blocks: Storage, page_size: int = 100000) -> int:
+        # Indexes all chains of a block storage that was filled without add_blocks, such as by an
+        # import. One scan of the blocks finds the open block of every account and the successor of
+        # every block, then each chain is walked once from its open block. Like add_blocks, the
+        # first open block of an account and the first successor of a block (in hash order here)
+        # are followed and forks are not indexed. Returns the number of blocks indexed.
+        opens: Dict[bytes, bytes] = {}
+        successors: Dict[bytes, bytes] = {}
+        start = bytes()
+        while True:
+            items = blocks.scan(start, page_size)
+            for block_hash, value in items:
+                # Values are the block type byte followed by the block. The account of an open
+                # block follows the source and representative, the other blocks start with the
+                # previous hash.
+                if value[0] == BlockType.OPEN:
+                    account = bytes(value[65:97])
+                    if account in opens:
+                        self.fork_count += 1
+                    else:
+                        opens[account] = block_hash
+                elif value[0] in (BlockType.SEND, BlockType.RECEIVE, BlockType.CHANGE):
+                    previous = bytes(value[1:33])
+                    if previous in successors:
+                        self.fork_count += 1
+                    else:
+                        successors[previous] = block_hash
+            if len(items) < page_size:
+                break
+            start = items[-1][0] + bytes(1)
+
+        count = 0
+        accounts: Dict[bytes, bytes] = {}
+        heights: Dict[bytes, bytes] = {}
+        chains: Dict[bytes, bytes] = {}
+        for account, open_block in opens.items():
+            block_hash, height = open_block, 1
+            while True:
+                heights[block_hash] = HEIGHT_RECORD.pack(account, height)
+                chains[chain_key(account, height)] = block_hash
+                successor = successors.get(block_hash)
+                if successor is None:
+                    break
+                block_hash, height = successor, height + 1
+            accounts[account] = ACCOUNT_RECORD.pack(block_hash, open_block, height)
+            count += height
+            if len(heights) >= page_size:
+                self.write_records(heights, chains)
+        self.write_records(heights, chains)
+        # Accounts go last, so the index stays empty, and is rebuilt again on the next start, if
+        # this is interrupted
+        self.accounts.bulk_put(accounts)
+        return count
+
+    def write_records(self, heights: Dict[bytes, bytes], chains: Dict[bytes, bytes]):
+        self.heights.bulk_put_tables([(self.heights, heights), (self.chains, chains)])
+        heights.clear()
+        chains.clear()
+
+    def add_blocks(self, blocks: List[Block]) -> int:
+        # Indexes blocks in commit order, the previous block of each one must be indexed already or
+        # come earlier in the list. Returns the number of blocks indexed.
+        count, writes = self.index_writes(blocks)
+        self.accounts.bulk_put_tables(writes)
+        return count
+
+    def index_writes(
+        self, blocks: List[Block]
+    ) -> Tuple[int, List[Tuple[Storage, Dict[bytes, bytes]]]]:
+        # The records add_blocks writes, for callers that write them together with the blocks.
+        # Blocks that are indexed already are skipped.
+        heights: Dict[bytes, Optional[BlockHeight]] = self.bulk_block_heights(
+            [block.root for block in blocks if block.block_type != BlockType.OPEN]
+            + [block.hash_sync() for block in blocks]
+        )
+        accounts: Dict[bytes, Optional[AccountInfo]] = self.bulk_account_info(
+            [block.account for block in blocks if block.block_type == BlockType.OPEN]
+            + [height.account for height in heights.values() if height is not None]
+        )
+
+        new_heights: Dict[bytes, BlockHeight] = {}
+        changed = set()
+        for block in blocks:
+            block_hash = block.hash_sync()
+            if heights.get(block_hash) is not None:
+                continue
+            if block.block_type == BlockType.OPEN:
+                account = block.account
+                if accounts.get(account) is not None:
+                    self.fork_count += 1
+                    continue
+                info = AccountInfo(block_hash, block_hash, 1)
+            else:
+                previous = heights.get(block.root)
+                info = accounts.get(previous.account) if previous else None
+                if info is None or info.head != block.root:
+                    self.fork_count += 1
+                    continue
+                account = previous.account
+                info = AccountInfo(block_hash, info.open_block, info.block_count + 1)
+
+            accounts[account] = info
+            changed.add(account)
+            heights[block_hash] = new_heights[block_hash] = BlockHeight(
+                account, info.block_count
+            )
+
+        return len(new_heights), [
+            (
+                self.accounts,
+                {
+                    account: ACCOUNT_RECORD.pack(*accounts[account])
+                    for account in changed
+                },
+            ),
+            (
+                self.heights,
+                {
+                    block_hash: HEIGHT_RECORD.pack(*height)
+                    for block_hash, height in new_heights.items()
+                },
+            ),
+            (
+                self.chains,
+                {
+                    chain_key(*height): block_hash
+                    for block_hash, height in new_heights.items()
+                },
+            ),
+        ]
@@ -1,28 +1,13 @@
-import itertools
-
-import marshal
 import rocksdb
 import time
 import lmdb
 
-from models.blocks import BlockParser, BlockType
+from storage.rocks_storage import DEFAULT_CONFIG, get_options
+from storage.snapshot import Snapshot
 
 
 def get_rocks_db():
-    size = 128 * 1024 * 1024
-    opts = rocksdb.Options()
-    opts.create_if_missing = True
-    opts.write_buffer_size = size
-    opts.max_write_buffer_number = 2
-    opts.target_file_size_base = size
-    opts.compression = rocksdb.CompressionType.no_compression
-    opts.disable_auto_compactions = True
-    opts.table_factory = rocksdb.BlockBasedTableFactory(
-        block_size=512,
-        filter_policy=rocksdb.BloomFilterPolicy(10),
-        block_cache=rocksdb.LRUCache(2 * (1024 ** 3)),
-        block_cache_compressed=rocksdb.LRUCache(500 * (1024 ** 2)),
-    )
+    opts = get_options({**DEFAULT_CONFIG, "bulk_ingest": True})
     db = rocksdb.DB("rocks.db", opts)
     return db
 
@@ -65,33 +50,19 @@ def test_rocks_db(tuples, batch_write=True, batch_read=False, read_only=False):
         s = e
 
 
-def get_hash(block):
-    b = BlockParser.parse(BlockType(block[0]), block[1:])
-    return b.hash_sync()
-
-
-def get_tuples(filename="marshal_chains.dump"):
+def get_tuples(filename="ledger.snapshot"):
+    # The snapshot holds the block hashes, so nothing needs to be parsed or hashed here
     s = time.time()
-    chains = []
-    with open(filename, "rb") as f:
-        chains = marshal.load(f)
-    e = time.time()
-    print(f"loaded chains in {(e-s)*1000}ms")
-    s = e
-
-    blocks = list(itertools.chain.from_iterable(chains))
-    e = time.time()
-    print(f"transformed chains in {(e-s)*1000}ms")
-    s = e
-
-    print(f"{len(chains)} chains, {len(blocks)} blocks")
-
-    tuples = [(get_hash(block), block[1:]) for block in blocks]
+    with Snapshot(filename) as snapshot:
+        tuples = [
+            (bytes(block_hash), bytes(data)) for block_hash, _, data in snapshot.blocks()
+        ]
+        account_count = len(snapshot.accounts())
     e = time.time()
-    print(f"calculated hashes in {(e-s)*1000}ms")
+    print(f"loaded snapshot in {(e-s)*1000}ms")
+    print(f"{account_count} chains, {len(tuples)} blocks")
     print(f"total size of keys: {sum([len(k) for k,v in tuples])}")
-    print(f"total size of values: {sum([len(v) for v in tuples])}")
-    s = e
+    print(f"total size of values: {sum([len(v) for k,v in tuples])}")
 
     return tuples
 
@@ -1,3 +1,6 @@
+import bisect
+from typing import List, Tuple
+
 from storage.storage import Storage
 
 
@@ -5,6 +8,12 @@ class InMemoryStorage(Storage):
     def __init__(self, config=None):
         super(InMemoryStorage, self).__init__()
         self.data = {}
+        # All keys for scans. New keys are appended and sorted into place by the next scan, which
+        # is a merge of the sorted keys with the new ones rather than a full sort.
+        self.keys: List[bytes] = []
+        self.keys_sorted = True
+        # After deletes, which are rare, the next scan rebuilds the list
+        self.keys_deleted = False
 
     def get(self, key: bytes):
         try:
@@ -13,10 +22,24 @@ class InMemoryStorage(Storage):
             return None
 
     def put(self, key: bytes, value: bytes):
+        if key not in self.data:
+            self.keys.append(key)
+            self.keys_sorted = False
         self.data[key] = value
 
     def delete(self, key: bytes):
         try:
             self.data.pop(key)
+            self.keys_deleted = True
         except KeyError:
             pass
+
+    def scan(self, start: bytes, limit: int) -> List[Tuple[bytes, bytes]]:
+        if self.keys_deleted:
+            self.keys = sorted(self.data)
+            self.keys_deleted = False
+        elif not self.keys_sorted:
+            self.keys.sort()
+        self.keys_sorted = True
+        i = bisect.bisect_left(self.keys, start)
+        return [(key, self.data[key]) for key in self.keys[i : i + limit]]
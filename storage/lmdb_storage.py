@@ -0,0 +1,98 @@
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import lmdb
+
+from storage.storage import Storage
+
+DEFAULT_CONFIG = {
+    "path": "lm.db",
+    "map_size": 2 * 1024 * 1024 * 1024,  # 2GB
+    # Turning off sync or metasync trades durability of the last transactions for write speed
+    "sync": True,
+    "metasync": True,
+    "map_async": False,
+    "writemap": False,
+    # Number of named databases that open_table can create
+    "max_dbs": 0,
+}
+
+
+class LmdbStorage(Storage):
+    def __init__(self, config=None, env: Optional[lmdb.Environment] = None, db=None):
+        super(LmdbStorage, self).__init__(config)
+        if env is None:
+            config = {**DEFAULT_CONFIG, **(config or {})}
+            env = lmdb.Environment(
+                config["path"],
+                map_size=config["map_size"],
+                sync=config["sync"],
+                metasync=config["metasync"],
+                map_async=config["map_async"],
+                writemap=config["writemap"],
+                max_dbs=config["max_dbs"],
+            )
+        self.env = env
+        # The named database of a table from open_table, None for the main database
+        self.db = db
+
+    def open_table(self, name: bytes) -> "LmdbStorage":
+        # A table in a named database of the same environment. Tables of one environment can be
+        # written in one transaction with bulk_put_tables. Closing any of them closes all.
+        return LmdbStorage(env=self.env, db=self.env.open_db(name))
+
+    def get(self, key: bytes):
+        with self.env.begin(db=self.db) as txn:
+            return txn.get(key)
+
+    def put(self, key: bytes, value: bytes):
+        with self.env.begin(db=self.db, write=True) as txn:
+            txn.put(key, value)
+
+    def delete(self, key: bytes):
+        with self.env.begin(db=self.db, write=True) as txn:
+            txn.delete(key)
+
+    def bulk_get(self, keys: List[bytes]) -> Dict[bytes, bytes]:
+        with self.env.begin(db=self.db) as txn:
+            return {key: txn.get(key) for key in keys}
+
+    @contextmanager
+    def bulk_get_buffers(self, keys: List[bytes]) -> Iterator[Dict[bytes, memoryview]]:
+        # Values are memoryviews into the memory map, which avoids copying them. They are only
+        # valid inside the with block, since the read transaction ends when it exits.
+        with self.env.begin(db=self.db, buffers=True) as txn:
+            yield {key: txn.get(key) for key in keys}
+
+    def bulk_put(self, kv: Dict[bytes, bytes]):
+        with self.env.begin(db=self.db, write=True) as txn:
+            txn.cursor().putmulti(kv.items())
+
+    def bulk_put_tables(self, writes: List[Tuple[Storage, Dict[bytes, bytes]]]):
+        if any(
+            not isinstance(table, LmdbStorage) or table.env is not self.env
+            for table, _ in writes
+        ):
+            super(LmdbStorage, self).bulk_put_tables(writes)
+            return
+        with self.env.begin(write=True) as txn:
+            for table, kv in writes:
+                txn.cursor(db=table.db).putmulti(kv.items())
+
+    def bulk_delete(self, keys: List[bytes]):
+        with self.env.begin(db=self.db, write=True) as txn:
+            for key in keys:
+                txn.delete(key)
+
+    def scan(self, start: bytes, limit: int) -> List[Tuple[bytes, bytes]]:
+        items = []
+        with self.env.begin(db=self.db) as txn:
+            cursor = txn.cursor()
+            more = cursor.set_range(start)
+            while more and len(items) < limit:
+                items.append(cursor.item())
+                more = cursor.next()
+        return items
+
+    def close(self):
+        self.env.close()
@@ -0,0 +1,335 @@
+import bisect
+import marshal
+import mmap
+import os
+import struct
+import sys
+from typing import Dict, Iterator, List, NamedTuple, Optional, Tuple
+
+from models.blocks import BLOCK_CLASSES, Block, BlockParser, BlockType
+from util.crypto import hash_blocks
+
+# A ledger snapshot is a file of segments, written one after the other:
+#
+#   file:    MAGIC, segment, segment, ...
+#   segment: kind (1 byte), block type (1 byte), 2 unused bytes, record count (4 bytes),
+#            record size (4 bytes), followed by count fixed size records
+#
+# BLOCKS segments hold blocks of one type, as a 32 byte block hash followed by the block data.
+# ACCOUNTS segments hold the account index: account, head block hash, number of blocks in the chain
+# and the file offset of the head block record. Integers are little endian.
+#
+# New segments are only ever appended, so a snapshot can be written while bootstrapping and read
+# back after an interruption. An account appearing in several ACCOUNTS segments has the entry of
+# the last one. A segment that was not completely written is ignored, and is overwritten when
+# the snapshot is opened for writing again.
+
+MAGIC = b"NANOSNP1"
+
+SEGMENT_HEADER = struct.Struct("<BBxxII")
+SEGMENT_BLOCKS = 1
+SEGMENT_ACCOUNTS = 2
+
+HASH_LENGTH = 32
+ACCOUNT_RECORD = struct.Struct("<32s32sIQ")
+
+
+class Segment(NamedTuple):
+    kind: int
+    block_type: BlockType
+    # File offset of the first record
+    offset: int
+    count: int
+    record_size: int
+
+    @property
+    def end(self) -> int:
+        return self.offset + self.count * self.record_size
+
+
+class AccountEntry(NamedTuple):
+    head: bytes
+    block_count: int
+    head_offset: int
+
+
+def read_segments(data) -> Tuple[List[Segment], int]:
+    # Returns the complete segments of the snapshot data and the length they cover
+    if len(data) < len(MAGIC):
+        return [], 0
+    if data[: len(MAGIC)] != MAGIC:
+        raise ValueError("Not a ledger snapshot")
+
+    segments: List[Segment] = []
+    offset = len(MAGIC)
+    while offset + SEGMENT_HEADER.size <= len(data):
+        kind, block_type, count, record_size = SEGMENT_HEADER.unpack_from(data, offset)
+        segment = Segment(
+            kind,
+            BlockType(block_type),
+            offset + SEGMENT_HEADER.size,
+            count,
+            record_size,
+        )
+        if segment.end > len(data):
+            break
+        segments.append(segment)
+        offset = segment.end
+    return segments, offset
+
+
+def segments_length(file) -> int:
+    # The length covered by the complete segments of a snapshot file, like read_segments, but only
+    # the segment headers are read
+    size = os.fstat(file.fileno()).st_size
+    file.seek(0)
+    if size < len(MAGIC):
+        return 0
+    if file.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a ledger snapshot")
+
+    offset = len(MAGIC)
+    while offset + SEGMENT_HEADER.size <= size:
+        file.seek(offset)
+        _, _, count, record_size = SEGMENT_HEADER.unpack(file.read(SEGMENT_HEADER.size))
+        end = offset + SEGMENT_HEADER.size + count * record_size
+        if end > size:
+            break
+        offset = end
+    return offset
+
+
+class SnapshotWriter:
+    # Collects blocks and account entries and appends them as segments on flush. Blocks are flushed
+    # automatically once flush_size of them are pending.
+    def __init__(self, path: str, flush_size: int = 100000):
+        self.path = path
+        self.flush_size = flush_size
+
+        self.file = open(path, "a+b")
+        valid_length = segments_length(self.file)
+        if valid_length == 0:
+            self.file.truncate(0)
+            self.file.write(MAGIC)
+        else:
+            # Drop a segment that was only partly written
+            self.file.truncate(valid_length)
+
+        self.blocks: Dict[BlockType, List[Tuple[bytes, bytes]]] = {}
+        # account -> (head hash, block count, head block type, head index in self.blocks)
+        self.accounts: Dict[bytes, Tuple[bytes, int, BlockType, int]] = {}
+        self.pending_count = 0
+
+        self.block_count = 0
+        self.account_count = 0
+
+    def add_block(self, block: Block):
+        self._add_block(block)
+        if self.pending_count >= self.flush_size:
+            self.flush()
+
+    def _add_block(self, block: Block) -> Tuple[BlockType, int]:
+        records = self.blocks.setdefault(block.block_type, [])
+        records.append((block.hash_sync(), block.data))
+        self.pending_count += 1
+        return block.block_type, len(records) - 1
+
+    def add_chain(
+        self, account: bytes, blocks: List[Block], block_count: Optional[int] = None
+    ):
+        # Blocks are newest first, as returned by a bulk pull. block_count is the length of the
+        # whole chain, if blocks is only the newest part of it.
+        if not blocks:
+            return
+        head_type, head_index = self._add_block(blocks[0])
+        for block in blocks[1:]:
+            self._add_block(block)
+        if block_count is None:
+            block_count = len(blocks)
+        self.accounts[account] = (
+            blocks[0].hash_sync(),
+            block_count,
+            head_type,
+            head_index,
+        )
+        if self.pending_count >= self.flush_size:
+            self.flush()
+
+    def flush(self):
+        # Account entries are written after the blocks they point to, so a complete ACCOUNTS
+        # segment never refers to a block that is not in the file
+        self.file.seek(0, os.SEEK_END)
+        offsets: Dict[BlockType, int] = {}
+        for block_type, records in self.blocks.items():
+            record_size = HASH_LENGTH + BlockParser.length(block_type)
+            offsets[block_type] = self.file.tell() + SEGMENT_HEADER.size
+            self.file.write(
+                SEGMENT_HEADER.pack(
+                    SEGMENT_BLOCKS, block_type.value, len(records), record_size
+                )
+            )
+            self.file.write(b"".join(block_hash + data for block_hash, data in records))
+            self.block_count += len(records)
+
+        if self.accounts:
+            self.file.write(
+                SEGMENT_HEADER.pack(
+                    SEGMENT_ACCOUNTS,
+                    BlockType.INVALID.value,
+                    len(self.accounts),
+                    ACCOUNT_RECORD.size,
+                )
+            )
+            self.file.write(
+                b"".join(
+                    ACCOUNT_RECORD.pack(
+                        account,
+                        head,
+                        block_count,
+                        offsets[head_type]
+                        + head_index * (HASH_LENGTH + BlockParser.length(head_type)),
+                    )
+                    for account, (head, block_count, head_type, head_index) in (
+                        self.accounts.items()
+                    )
+                )
+            )
+            self.account_count += len(self.accounts)
+
+        self.file.flush()
+        self.blocks = {}
+        self.accounts = {}
+        self.pending_count = 0
+
+    def close(self):
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+class Snapshot:
+    # Reads a snapshot through a read only memory map. Block hashes and data are returned as
+    # memoryviews into the map, which are only valid until the snapshot is closed.
+    def __init__(self, path: str):
+        self.file = open(path, "rb")
+        size = os.fstat(self.file.fileno()).st_size
+        self.map = (
+            mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+        )
+        self.view = memoryview(self.map)
+        self.segments, _ = read_segments(self.view)
+        self.block_segments = [s for s in self.segments if s.kind == SEGMENT_BLOCKS]
+        self.block_segment_offsets = [s.offset for s in self.block_segments]
+
+    def __len__(self):
+        return sum(segment.count for segment in self.block_segments)
+
+    def blocks(
+        self, block_type: Optional[BlockType] = None
+    ) -> Iterator[Tuple[memoryview, BlockType, memoryview]]:
+        # Yields (hash, block type, block data) in file order
+        for segment in self.block_segments:
+            if block_type is not None and segment.block_type != block_type:
+                continue
+            for offset in range(segment.offset, segment.end, segment.record_size):
+                yield (
+                    self.view[offset : offset + HASH_LENGTH],
+                    segment.block_type,
+                    self.view[offset + HASH_LENGTH : offset + segment.record_size],
+                )
+
+    def block_at(self, offset: int) -> Tuple[memoryview, BlockType, memoryview]:
+        # The block record starting at offset, such as the head offset of an account entry
+        i = bisect.bisect_right(self.block_segment_offsets, offset) - 1
+        if i < 0 or offset >= self.block_segments[i].end:
+            raise IndexError(f"No block record at offset {offset}")
+        segment = self.block_segments[i]
+        if (offset - segment.offset) % segment.record_size:
+            raise IndexError(f"No block record at offset {offset}")
+        return (
+            self.view[offset : offset + HASH_LENGTH],
+            segment.block_type,
+            self.view[offset + HASH_LENGTH : offset + segment.record_size],
+        )
+
+    def accounts(self) -> Dict[bytes, AccountEntry]:
+        index: Dict[bytes, AccountEntry] = {}
+        for segment in self.segments:
+            if segment.kind != SEGMENT_ACCOUNTS:
+                continue
+            for offset in range(segment.offset, segment.end, segment.record_size):
+                account, head, count, head_offset = ACCOUNT_RECORD.unpack_from(
+                    self.view, offset
+                )
+                index[account] = AccountEntry(head, count, head_offset)
+        return index
+
+    def close(self):
+        self.view.release()
+        if self.map:
+            self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+
+def hash_chains(chains: List[List[bytes]]) -> List[List[Block]]:
+    # Parses chains of block.to_bytes() values. The hashes of all blocks of a type are computed in
+    # one hash_blocks call, and handed to the parsed blocks.
+    records: Dict[BlockType, bytearray] = {}
+    for chain in chains:
+        for data in chain:
+            records.setdefault(BlockType(data[0]), bytearray()).extend(data[1:])
+
+    hashes = {
+        block_type: hash_blocks(
+            data,
+            BlockParser.length(block_type),
+            BLOCK_CLASSES[block_type].HASHED_LENGTH,
+        )
+        for block_type, data in records.items()
+    }
+
+    indexes = dict.fromkeys(records, 0)
+    parsed = []
+    for chain in chains:
+        blocks = []
+        for data in chain:
+            block_type = BlockType(data[0])
+            i = indexes[block_type]
+            indexes[block_type] += 1
+            block_hash = bytes(
+                hashes[block_type][i * HASH_LENGTH : (i + 1) * HASH_LENGTH]
+            )
+            blocks.append(BlockParser.parse(block_type, data[1:], block_hash))
+        parsed.append(blocks)
+    return parsed
+
+
+def convert_marshal_dump(source: str, destination: str):
+    # Converts a marshal_chains.dump file, a list of chains of block.to_bytes() values with the
+    # newest block first. Chains are indexed by the account of their open block; chains without
+    # one are stored without an account entry.
+    with open(source, "rb") as f:
+        chains = hash_chains(marshal.load(f))
+
+    with SnapshotWriter(destination) as writer:
+        for blocks in chains:
+            if blocks and blocks[-1].block_type == BlockType.OPEN:
+                writer.add_chain(blocks[-1].account, blocks)
+            else:
+                for block in blocks:
+                    writer.add_block(block)
+
+
+if __name__ == "__main__":
+    convert_marshal_dump(sys.argv[1], sys.argv[2])
@@ -1,4 +1,4 @@
-from typing import List, Dict
+from typing import List, Dict, Tuple
 
 
 class Storage:
@@ -27,3 +27,18 @@ class Storage:
     def bulk_delete(self, keys: List[bytes]):
         for key in keys:
             self.delete(key)
+
+    def bulk_put_tables(self, writes: List[Tuple["Storage", Dict[bytes, bytes]]]):
+        # Writes to several tables of this backend. Backends that can do it in one transaction
+        # override this, so the tables can't be left out of step with each other by a crash.
+        for table, kv in writes:
+            table.bulk_put(kv)
+
+    def scan(self, start: bytes, limit: int) -> List[Tuple[bytes, bytes]]:
+        # Up to limit items in ascending key order, from the first key at or after start. Long
+        # scans are done a page at a time, continuing after the last key of the previous page, so
+        # no read transaction or iterator is held open between pages.
+        raise NotImplementedError()
+
+    def close(self):
+        pass
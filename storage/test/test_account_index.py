@@ -0,0 +1,123 @@
+import pytest
+
+from models.blocks import ChangeBlock, OpenBlock, SendBlock
+from storage.account_index import AccountIndex, AccountInfo, BlockHeight
+from storage.in_memory import InMemoryStorage
+from storage.lmdb_storage import LmdbStorage
+
+
+def make_chain(account, length):
+    # Oldest block first
+    blocks = [OpenBlock(bytes(32), account, account, bytes(64), bytes(8))]
+    for i in range(length - 1):
+        previous = blocks[-1].hash_sync()
+        if i % 2:
+            blocks.append(ChangeBlock(previous, account, bytes(64), bytes(8)))
+        else:
+            blocks.append(
+                SendBlock(previous, bytes(32), bytes(16), bytes(64), bytes(8))
+            )
+    return blocks
+
+
+@pytest.fixture(params=["memory", "lmdb"])
+def index(request, tmp_path):
+    if request.param == "memory":
+        yield AccountIndex()
+        return
+    tables = [
+        LmdbStorage({"path": str(tmp_path / name), "map_size": 10 * 1024 * 1024})
+        for name in ["accounts", "heights", "chains"]
+    ]
+    yield AccountIndex(*tables)
+    for table in tables:
+        table.close()
+
+
+def test_add_blocks(index):
+    a, b = bytes([1] * 32), bytes([2] * 32)
+    chain_a, chain_b = make_chain(a, 5), make_chain(b, 3)
+
+    # Blocks may follow a block of the same batch
+    assert index.add_blocks(chain_a[:3] + chain_b) == 6
+    assert index.add_blocks(chain_a[3:]) == 2
+
+    assert index.account_info(a) == AccountInfo(
+        chain_a[-1].hash_sync(), chain_a[0].hash_sync(), 5
+    )
+    assert index.account_info(b).block_count == 3
+    assert index.account_info(bytes(32)) is None
+    assert index.block_height(chain_a[3].hash_sync()) == BlockHeight(a, 4)
+    assert index.bulk_block_heights([chain_b[0].hash_sync(), bytes(32)]) == {
+        chain_b[0].hash_sync(): BlockHeight(b, 1),
+        bytes(32): None,
+    }
+    assert index.chain_hashes(a, 2, 4) == [block.hash_sync() for block in chain_a[1:4]]
+    assert index.chain_hashes(b, 2, 10) == [block.hash_sync() for block in chain_b[1:]]
+    assert index.frontiers(bytes(32), 10) == [
+        (a, chain_a[-1].hash_sync()),
+        (b, chain_b[-1].hash_sync()),
+    ]
+    assert index.frontiers(b, 10) == [(b, chain_b[-1].hash_sync())]
+
+
+def test_forks_are_not_indexed(index):
+    account = bytes([1] * 32)
+    chain = make_chain(account, 3)
+    index.add_blocks(chain)
+
+    fork = SendBlock(
+        chain[1].hash_sync(), bytes([9] * 32), bytes(16), bytes(64), bytes(8)
+    )
+    unknown_previous = SendBlock(
+        bytes([7] * 32), bytes(32), bytes(16), bytes(64), bytes(8)
+    )
+    second_open = OpenBlock(bytes([5] * 32), account, account, bytes(64), bytes(8))
+    assert index.add_blocks([fork, unknown_previous, second_open]) == 0
+
+    assert index.fork_count == 3
+    assert index.account_info(account).head == chain[-1].hash_sync()
+    assert index.block_height(fork.hash_sync()) is None
+
+
+def test_rebuild_from_storage(index):
+    a, b = bytes([1] * 32), bytes([2] * 32)
+    chain_a, chain_b = make_chain(a, 5), make_chain(b, 3)
+    # The first successor in hash order is followed, so the fork must sort after chain_a[2]
+    forks = [
+        SendBlock(
+            chain_a[1].hash_sync(), bytes([i] * 32), bytes(16), bytes(64), bytes(8)
+        )
+        for i in range(8)
+    ]
+    fork = next(f for f in forks if f.hash_sync() > chain_a[2].hash_sync())
+    blocks = InMemoryStorage()
+    blocks.bulk_put(
+        {block.hash_sync(): block.to_bytes() for block in chain_a + chain_b + [fork]}
+    )
+
+    assert index.is_empty()
+    # Small pages, so the scan continues across pages
+    assert index.rebuild(blocks, page_size=3) == 8
+    assert not index.is_empty()
+    assert index.fork_count == 1
+
+    expected = AccountIndex()
+    expected.add_blocks(chain_a + chain_b)
+    for account in [a, b]:
+        assert index.account_info(account) == expected.account_info(account)
+    for block in chain_a + chain_b:
+        block_hash = block.hash_sync()
+        assert index.block_height(block_hash) == expected.block_height(block_hash)
+    assert index.chain_hashes(a, 1, 5) == expected.chain_hashes(a, 1, 5)
+
+
+def test_indexed_blocks_are_skipped(index):
+    account = bytes([1] * 32)
+    chain = make_chain(account, 3)
+    index.add_blocks(chain[:2])
+
+    # Blocks added again, as after a retried commit, are neither indexed twice nor forks
+    assert index.add_blocks(chain) == 1
+    assert index.fork_count == 0
+    assert index.account_info(account).block_count == 3
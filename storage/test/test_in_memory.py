@@ -60,3 +60,25 @@ def test_bulk_delete(storage):
     storage.bulk_delete([b"a", b"b"])
     assert storage.get(b"a") is None
     assert storage.get(b"b") is None
+
+
+def test_scan(storage):
+    storage.bulk_put({b"c": b"3", b"a": b"1", b"b": b"2", b"d": b"4"})
+    assert storage.scan(b"", 2) == [(b"a", b"1"), (b"b", b"2")]
+    assert storage.scan(b"b", 10) == [(b"b", b"2"), (b"c", b"3"), (b"d", b"4")]
+    # The next page starts right after the last key
+    assert storage.scan(b"b" + bytes(1), 1) == [(b"c", b"3")]
+    assert storage.scan(b"e", 10) == []
+
+
+def test_scan_after_changes(storage):
+    storage.bulk_put({b"b": b"2", b"d": b"4"})
+    assert storage.scan(b"", 10) == [(b"b", b"2"), (b"d", b"4")]
+    # Keys added, overwritten and deleted between scans
+    storage.bulk_put({b"c": b"3", b"a": b"1", b"b": b"5"})
+    storage.delete(b"d")
+    storage.delete(b"c")
+    storage.put(b"c", b"3")
+    assert storage.scan(b"", 10) == [(b"a", b"1"), (b"b", b"5"), (b"c", b"3")]
+    storage.put(b"d", b"6")
+    assert storage.scan(b"c", 10) == [(b"c", b"3"), (b"d", b"6")]
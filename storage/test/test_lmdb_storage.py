@@ -0,0 +1,84 @@
+import lmdb
+import pytest
+
+from storage.lmdb_storage import LmdbStorage
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = LmdbStorage({"path": str(tmp_path), "map_size": 10 * 1024 * 1024})
+    yield storage
+    storage.close()
+
+
+def test_put_then_get(storage):
+    storage.put(b"1", b"a")
+    assert storage.get(b"1") == b"a"
+
+
+def test_get_empty(storage):
+    assert storage.get(b"1") is None
+
+
+def test_bulk_put_bulk_get(storage):
+    values = {b"a": b"1", b"b": b"2"}
+    storage.bulk_put(values)
+    res = storage.bulk_get(list(values.keys()) + [b"c"])
+    assert res == {b"a": b"1", b"b": b"2", b"c": None}
+
+
+def test_bulk_get_buffers(storage):
+    storage.bulk_put({b"a": b"1", b"b": b"2"})
+    with storage.bulk_get_buffers([b"a", b"b", b"c"]) as res:
+        assert bytes(res[b"a"]) == b"1"
+        assert bytes(res[b"b"]) == b"2"
+        assert res[b"c"] is None
+
+
+def test_delete(storage):
+    storage.put(b"a", b"1")
+    storage.delete(b"a")
+    assert storage.get(b"a") is None
+
+
+def test_bulk_delete(storage):
+    storage.bulk_put({b"a": b"1", b"b": b"2"})
+    storage.bulk_delete([b"a", b"b", b"c"])
+    assert storage.get(b"a") is None
+    assert storage.get(b"b") is None
+
+
+def test_scan(storage):
+    storage.bulk_put({b"c": b"3", b"a": b"1", b"b": b"2", b"d": b"4"})
+    assert storage.scan(b"", 2) == [(b"a", b"1"), (b"b", b"2")]
+    assert storage.scan(b"b", 10) == [(b"b", b"2"), (b"c", b"3"), (b"d", b"4")]
+    # The next page starts right after the last key
+    assert storage.scan(b"b" + bytes(1), 1) == [(b"c", b"3")]
+    assert storage.scan(b"e", 10) == []
+
+
+def test_data_persists(tmp_path):
+    config = {"path": str(tmp_path), "map_size": 10 * 1024 * 1024, "sync": False}
+    storage = LmdbStorage(config)
+    storage.put(b"a", b"1")
+    storage.close()
+
+    storage = LmdbStorage(config)
+    assert storage.get(b"a") == b"1"
+    storage.close()
+
+
+def test_tables_are_written_in_one_transaction(tmp_path):
+    environment = LmdbStorage(
+        {"path": str(tmp_path), "map_size": 10 * 1024 * 1024, "max_dbs": 2}
+    )
+    blocks, index = environment.open_table(b"blocks"), environment.open_table(b"index")
+    blocks.bulk_put_tables([(blocks, {b"a": b"1"}), (index, {b"a": b"2"})])
+    assert blocks.get(b"a") == b"1"
+    assert index.scan(bytes(), 10) == [(b"a", b"2")]
+
+    # An empty key fails the second write, which rolls back the first one too
+    with pytest.raises(lmdb.Error):
+        blocks.bulk_put_tables([(blocks, {b"b": b"1"}), (index, {b"": b"2"})])
+    assert blocks.get(b"b") is None
+    environment.close()
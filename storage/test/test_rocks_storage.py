@@ -0,0 +1,66 @@
+import pytest
+
+rocksdb = pytest.importorskip("rocksdb")
+
+from storage.rocks_storage import RocksStorage
+
+
+@pytest.fixture
+def storage(tmp_path):
+    storage = RocksStorage(
+        {
+            "path": str(tmp_path / "rocks.db"),
+            "block_cache_size": 1024 * 1024,
+            "block_cache_compressed_size": 1024 * 1024,
+        }
+    )
+    yield storage
+    storage.close()
+
+
+def test_put_then_get(storage):
+    storage.put(b"1", b"a")
+    assert storage.get(b"1") == b"a"
+
+
+def test_get_empty(storage):
+    assert storage.get(b"1") is None
+
+
+def test_bulk_put_bulk_get(storage):
+    values = {b"a": b"1", b"b": b"2"}
+    storage.bulk_put(values)
+    res = storage.bulk_get(list(values.keys()) + [b"c"])
+    assert res == {b"a": b"1", b"b": b"2", b"c": None}
+
+
+def test_bulk_delete(storage):
+    storage.bulk_put({b"a": b"1", b"b": b"2"})
+    storage.bulk_delete([b"a", b"b", b"c"])
+    assert storage.get(b"a") is None
+    assert storage.get(b"b") is None
+
+
+def test_bulk_ingest(tmp_path):
+    storage = RocksStorage(
+        {
+            "path": str(tmp_path / "rocks.db"),
+            "bulk_ingest": True,
+            "disable_wal": True,
+            "block_cache_size": 1024 * 1024,
+            "block_cache_compressed_size": 1024 * 1024,
+        }
+    )
+    storage.bulk_put({bytes([i]) * 32: bytes([i]) * 100 for i in range(100)})
+    storage.finish_bulk_ingest()
+    assert storage.get(bytes([5]) * 32) == bytes([5]) * 100
+    storage.close()
+
+
+def test_scan(storage):
+    storage.bulk_put({b"c": b"3", b"a": b"1", b"b": b"2", b"d": b"4"})
+    assert storage.scan(b"", 2) == [(b"a", b"1"), (b"b", b"2")]
+    assert storage.scan(b"b", 10) == [(b"b", b"2"), (b"c", b"3"), (b"d", b"4")]
+    # The next page starts right after the last key
+    assert storage.scan(b"b" + bytes(1), 1) == [(b"c", b"3")]
+    assert storage.scan(b"e", 10) == []
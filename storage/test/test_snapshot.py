@@ -0,0 +1,102 @@
+import marshal
+import os
+
+import pytest
+
+from models.blocks import BlockType, OpenBlock, ReceiveBlock, SendBlock
+from storage.snapshot import (
+    Snapshot,
+    SnapshotWriter,
+    convert_marshal_dump,
+    read_segments,
+    segments_length,
+)
+
+account = bytes([9] * 32)
+
+
+@pytest.fixture
+def chain():
+    # Newest block first, as returned by a bulk pull
+    open_block = OpenBlock(bytes([1] * 32), bytes(32), account, bytes(64), bytes(8))
+    send = SendBlock(
+        open_block.hash_sync(), bytes([2] * 32), bytes(16), bytes(64), bytes(8)
+    )
+    receive = ReceiveBlock(send.hash_sync(), bytes([3] * 32), bytes(64), bytes(8))
+    return [receive, send, open_block]
+
+
+def test_write_and_read(tmp_path, chain):
+    path = str(tmp_path / "ledger.snapshot")
+    with SnapshotWriter(path) as writer:
+        writer.add_chain(account, chain)
+
+    with Snapshot(path) as snapshot:
+        assert len(snapshot) == 3
+        blocks = {bytes(h): (t, bytes(d)) for h, t, d in snapshot.blocks()}
+        for block in chain:
+            assert blocks[block.hash_sync()] == (block.block_type, block.data)
+
+        sends = list(snapshot.blocks(BlockType.SEND))
+        assert [bytes(h) for h, _, _ in sends] == [chain[1].hash_sync()]
+        del blocks, sends
+
+        entry = snapshot.accounts()[account]
+        assert entry.head == chain[0].hash_sync()
+        assert entry.block_count == 3
+        head_hash, head_type, head_data = snapshot.block_at(entry.head_offset)
+        assert bytes(head_hash) == chain[0].hash_sync()
+        assert head_type == BlockType.RECEIVE
+        assert bytes(head_data) == chain[0].data
+        del head_hash, head_data
+
+
+def test_append_and_truncated_segment(tmp_path, chain):
+    path = str(tmp_path / "ledger.snapshot")
+    with SnapshotWriter(path) as writer:
+        writer.add_chain(account, chain[1:])
+    with SnapshotWriter(path) as writer:
+        writer.add_chain(account, chain[:1], block_count=3)
+
+    # An interrupted write leaves a partial segment at the end
+    with open(path, "ab") as f:
+        f.write(bytes([1, 2, 0, 0, 10, 0, 0, 0, 200, 0, 0, 0]) + bytes(50))
+
+    with Snapshot(path) as snapshot:
+        assert len(snapshot) == 3
+        entry = snapshot.accounts()[account]
+        assert entry.head == chain[0].hash_sync()
+        assert entry.block_count == 3
+
+    # The writer finds the end of the complete segments from their headers
+    with open(path, "rb") as f:
+        length = segments_length(f)
+        f.seek(0)
+        assert length == read_segments(f.read())[1] == os.path.getsize(path) - 62
+
+    # Writing again replaces the partial segment
+    with SnapshotWriter(path) as writer:
+        writer.add_block(chain[0])
+    with Snapshot(path) as snapshot:
+        assert len(snapshot) == 4
+
+
+def test_auto_flush(tmp_path, chain):
+    path = str(tmp_path / "ledger.snapshot")
+    writer = SnapshotWriter(path, flush_size=2)
+    writer.add_chain(account, chain)
+    with Snapshot(path) as snapshot:
+        assert len(snapshot) == 3
+    writer.close()
+
+
+def test_convert_marshal_dump(tmp_path, chain):
+    source = str(tmp_path / "marshal_chains.dump")
+    with open(source, "wb") as f:
+        marshal.dump([[block.to_bytes() for block in chain]], f)
+
+    destination = str(tmp_path / "ledger.snapshot")
+    convert_marshal_dump(source, destination)
+    with Snapshot(destination) as snapshot:
+        assert len(snapshot) == 3
+        assert snapshot.accounts()[account].head == chain[0].hash_sync()
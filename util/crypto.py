@@ -3,17 +3,64 @@ import functools
 import logging
 from concurrent.futures import Executor
 from hashlib import blake2b
+from typing import Dict, List, Tuple
 
 from pure25519_blake2b.ed25519_oop import VerifyingKey, BadSignatureError, SigningKey
 
 from executors import thread_executor, process_executor
 
+try:
+    from multiprocessing.shared_memory import SharedMemory
+except ImportError:
+    # Python 3.7 has no shared memory, hash_blocks hashes everything inline there
+    SharedMemory = None
+
 EXECUTORS_ENABLED = False
 
+# Number of signatures checked per process pool task in verify_signatures_batch_async
+SIGNATURE_CHUNK_SIZE = 64
+
+# The 8 byte PoW digest is read as a little endian integer and has to be at least this value
+POW_THRESHOLD = 0xFFFFFFC000000000
+# Threshold of the test network, about 256 hashes per block instead of 2**26
+TEST_POW_THRESHOLD = 0xFF00000000000000
+# Batches up to this size are hashed inline, since executor overhead is larger than the work
+POW_INLINE_BATCH_SIZE = 256
+# Batches up to this size are hashed on a thread, larger batches are split across processes
+POW_PROCESS_BATCH_SIZE = 8192
+POW_CHUNK_SIZE = 2048
+
+HASH_LENGTH = 32
+# Up to this many records are hashed inline by hash_blocks, larger inputs are split across processes
+HASH_INLINE_COUNT = 16384
+HASH_CHUNK_SIZE = 65536
+
+
+def verify_pow(data: bytes, work: bytes, threshold: int = POW_THRESHOLD):
+    digest = blake2b_hash(work + data, digest_size=8)
+    return int.from_bytes(digest, byteorder="little") >= threshold
 
-def verify_pow(data: bytes, work: bytes):
-    digest = blake2b_hash(work + data, digest_size=8)[::-1]
-    return digest >= bytes.fromhex("ffffffc000000000")
+
+def generate_work(root: bytes, threshold: int = POW_THRESHOLD, start: int = 0) -> bytes:
+    # Tries nonces from start, so the same root always gets the same work
+    nonce = start
+    while True:
+        work = nonce.to_bytes(8, byteorder="little")
+        digest = blake2b(work + root, digest_size=8).digest()
+        if int.from_bytes(digest, byteorder="little") >= threshold:
+            return work
+        nonce += 1
+
+
+def verify_pow_batch(
+    items: List[Tuple[bytes, bytes]], threshold: int = POW_THRESHOLD
+) -> List[bool]:
+    # Items are (root, work) pairs
+    return [
+        int.from_bytes(blake2b(work + root, digest_size=8).digest(), "little")
+        >= threshold
+        for root, work in items
+    ]
 
 
 async def verify_pow_async(
@@ -26,6 +73,35 @@ async def verify_pow_async(
     return await _loop.run_in_executor(executor, verify_pow, data, work)
 
 
+async def verify_pow_batch_async(
+    items: List[Tuple[bytes, bytes]],
+    thread_pool: Executor = thread_executor,
+    process_pool: Executor = process_executor,
+    threshold: int = POW_THRESHOLD,
+) -> List[bool]:
+    if not EXECUTORS_ENABLED or len(items) <= POW_INLINE_BATCH_SIZE:
+        return verify_pow_batch(items, threshold)
+
+    _loop = asyncio.get_event_loop()
+    if len(items) <= POW_PROCESS_BATCH_SIZE:
+        return await _loop.run_in_executor(
+            thread_pool, verify_pow_batch, items, threshold
+        )
+
+    chunks = await asyncio.gather(
+        *[
+            _loop.run_in_executor(
+                process_pool,
+                verify_pow_batch,
+                items[i : i + POW_CHUNK_SIZE],
+                threshold,
+            )
+            for i in range(0, len(items), POW_CHUNK_SIZE)
+        ]
+    )
+    return [valid for chunk in chunks for valid in chunk]
+
+
 def verify_signature(msg: bytes, signature: bytes, public_key: bytes):
     verifying_key = VerifyingKey(public_key)
     try:
@@ -36,6 +112,22 @@ def verify_signature(msg: bytes, signature: bytes, public_key: bytes):
         return False
 
 
+def verify_signatures_batch(items: List[Tuple[bytes, bytes, bytes]]) -> List[bool]:
+    # Blocks in a batch mostly come from a few account chains, so the verifying keys are reused
+    verifying_keys: Dict[bytes, VerifyingKey] = {}
+    results: List[bool] = []
+    for msg, signature, public_key in items:
+        verifying_key = verifying_keys.get(public_key)
+        if verifying_key is None:
+            verifying_key = verifying_keys[public_key] = VerifyingKey(public_key)
+        try:
+            verifying_key.verify(signature, msg)
+            results.append(True)
+        except BadSignatureError:
+            results.append(False)
+    return results
+
+
 def sign(msg: bytes, private_key: bytes):
     sk = SigningKey(private_key)
     return sk.sign(msg)
@@ -58,11 +150,109 @@ async def verify_signature_async(
     return res
 
 
+# Splits the (hash, signature, public_key) triples into chunks that are verified in parallel.
+# Results are returned in the same order as the items.
+async def verify_signatures_batch_async(
+    items: List[Tuple[bytes, bytes, bytes]],
+    executor: Executor = process_executor,
+    chunk_size: int = SIGNATURE_CHUNK_SIZE,
+) -> List[bool]:
+    if not EXECUTORS_ENABLED:
+        return verify_signatures_batch(items)
+
+    _loop = asyncio.get_event_loop()
+    chunks = await asyncio.gather(
+        *[
+            _loop.run_in_executor(
+                executor, verify_signatures_batch, items[i : i + chunk_size]
+            )
+            for i in range(0, len(items), chunk_size)
+        ]
+    )
+    return [valid for chunk in chunks for valid in chunk]
+
+
 def blake2b_hash(value: bytes, digest_size: int = 32):
     h = blake2b(value, digest_size=digest_size)
     return h.digest()
 
 
+def hash_records(
+    data: bytes, output, start: int, end: int, stride: int, hashed_length: int
+):
+    # Writes the hashes of records start to end into output, at the same record index
+    view = memoryview(data)
+    for i in range(start, end):
+        offset = i * stride
+        output[i * HASH_LENGTH : (i + 1) * HASH_LENGTH] = blake2b(
+            view[offset : offset + hashed_length], digest_size=HASH_LENGTH
+        ).digest()
+    view.release()
+
+
+def hash_records_shared(
+    data_name: str,
+    output_name: str,
+    start: int,
+    end: int,
+    stride: int,
+    hashed_length: int,
+):
+    # The pool workers share the resource tracker of the process that created the segments, which
+    # unlinks them
+    data = SharedMemory(data_name)
+    output = SharedMemory(output_name)
+    try:
+        hash_records(data.buf, output.buf, start, end, stride, hashed_length)
+    finally:
+        data.close()
+        output.close()
+
+
+def hash_blocks(
+    data: bytes,
+    stride: int,
+    hashed_length: int,
+    executor: Executor = process_executor,
+    chunk_size: int = HASH_CHUNK_SIZE,
+) -> bytearray:
+    # Hashes a buffer of fixed size records, such as the block data of one block type, where the
+    # hash of a record covers its first hashed_length bytes. Returns the 32 byte hashes one after
+    # the other. Large inputs are copied once into shared memory, and hashed in chunks by the
+    # process pool, which write their hashes into a shared output buffer. Nothing is pickled per
+    # block.
+    count = len(data) // stride
+    if count <= HASH_INLINE_COUNT or SharedMemory is None:
+        output = bytearray(count * HASH_LENGTH)
+        hash_records(data, output, 0, count, stride, hashed_length)
+        return output
+
+    shared_data = SharedMemory(create=True, size=len(data))
+    shared_output = SharedMemory(create=True, size=count * HASH_LENGTH)
+    try:
+        shared_data.buf[: len(data)] = data
+        futures = [
+            executor.submit(
+                hash_records_shared,
+                shared_data.name,
+                shared_output.name,
+                start,
+                min(start + chunk_size, count),
+                stride,
+                hashed_length,
+            )
+            for start in range(0, count, chunk_size)
+        ]
+        for future in futures:
+            future.result()
+        return bytearray(shared_output.buf[: count * HASH_LENGTH])
+    finally:
+        shared_data.close()
+        shared_data.unlink()
+        shared_output.close()
+        shared_output.unlink()
+
+
 async def blake2b_async(
     value: bytes, digest_size: int = 32, executor: Executor = thread_executor
 ):
@@ -0,0 +1,258 @@
+import argparse
+import itertools
+import os
+import random
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+from models.blocks import Block, ChangeBlock, OpenBlock, ReceiveBlock, SendBlock
+from storage.snapshot import SnapshotWriter
+from util.crypto import TEST_POW_THRESHOLD, generate_work, sign
+from util.numbers import deterministic_key
+
+GENESIS_BALANCE = 2**128 - 1
+# Blocks per process pool task when deriving keys, signing and generating work
+CHUNK_SIZE = 256
+
+# Share of the generated blocks that are change blocks
+CHANGE_RATIO = 0.05
+
+
+def derive_keys(indexes: List[int], seed: bytes) -> List[Tuple[bytes, bytes]]:
+    return [deterministic_key(seed, i) for i in indexes]
+
+
+def sign_blocks(
+    items: List[Tuple[bytes, bytes, bytes]], threshold: int
+) -> List[Tuple[bytes, bytes]]:
+    # Items are (block hash, private key, PoW root). Returns (signature, work) pairs.
+    return [
+        (sign(block_hash, private_key), generate_work(root, threshold))
+        for block_hash, private_key, root in items
+    ]
+
+
+def map_chunks(executor: Optional[Executor], function, items: List, *args) -> List:
+    # Runs function over chunks of items, on the executor if there is one, and joins the results
+    chunks = [items[i : i + CHUNK_SIZE] for i in range(0, len(items), CHUNK_SIZE)]
+    if executor is None:
+        results = [function(chunk, *args) for chunk in chunks]
+    else:
+        futures = [executor.submit(function, chunk, *args) for chunk in chunks]
+        results = [future.result() for future in futures]
+    return [item for result in results for item in result]
+
+
+class LedgerGenerator:
+    # Builds a valid ledger of legacy blocks in two phases. The first phase decides every block
+    # serially with a seeded random generator. Block hashes don't cover signatures and work, so
+    # all links between blocks are known after this phase. The second phase, signing and PoW,
+    # is where the time goes, and is spread over the process pool.
+    #
+    # Account 0 is the genesis account holding the whole supply. Senders and recipients are
+    # picked with Zipf weights over the account indexes, so a few accounts have long chains and
+    # most have short ones, as on the live network.
+    def __init__(
+        self,
+        accounts: int,
+        blocks: int,
+        seed: int = 0,
+        skew: float = 1.1,
+        pow_threshold: int = TEST_POW_THRESHOLD,
+    ):
+        assert blocks >= 2 * accounts - 1, "Every account needs a send and an open"
+        self.account_count = accounts
+        self.block_count = blocks
+        self.seed = seed.to_bytes(32, byteorder="big")
+        self.random = random.Random(seed)
+        self.pow_threshold = pow_threshold
+        self.weights = [1 / (i + 1) ** skew for i in range(accounts)]
+        self.cum_weights = list(itertools.accumulate(self.weights))
+
+        self.keys: List[Tuple[bytes, bytes]] = []
+        # Chains by account index, oldest block first
+        self.chains: List[List[Block]] = [[] for _ in range(accounts)]
+        self.balances = [0] * accounts
+        # Sends that haven't been received, as (destination, send hash, amount). Sends to
+        # accounts that are not opened yet are kept apart, since they must all be received.
+        self.pending: List[Tuple[int, bytes, int]] = []
+        self.pending_opens: List[Tuple[int, bytes, int]] = []
+        # Opened accounts, and their cumulative weights for picking senders
+        self.opened: List[int] = []
+        self.opened_cum_weights: List[float] = []
+
+    def public_key(self, index: int) -> bytes:
+        return self.keys[index][1]
+
+    def head(self, index: int) -> bytes:
+        return self.chains[index][-1].hash_sync()
+
+    def pick_account(self) -> int:
+        return self.random.choices(
+            range(self.account_count), cum_weights=self.cum_weights
+        )[0]
+
+    def pick_opened(self) -> int:
+        return self.random.choices(self.opened, cum_weights=self.opened_cum_weights)[0]
+
+    def pick_sender(self) -> int:
+        # Accounts that only received a tiny amount can't send, genesis always can
+        for _ in range(10):
+            index = self.pick_opened()
+            if self.balances[index] > 1:
+                return index
+        return 0
+
+    def add(self, index: int, block: Block):
+        if not self.chains[index]:
+            self.opened.append(index)
+            self.opened_cum_weights.append(
+                self.weights[index]
+                + (self.opened_cum_weights[-1] if self.opened_cum_weights else 0)
+            )
+        self.chains[index].append(block)
+
+    def open_genesis(self):
+        genesis = self.public_key(0)
+        self.add(0, OpenBlock(genesis, genesis, genesis, bytes(64), bytes(8)))
+        self.balances[0] = GENESIS_BALANCE
+
+    def send(self, sender: int, destination: int):
+        # Up to 1 Nano (10**30 raw), so the genesis supply lasts for any ledger size
+        amount = self.random.randint(1, max(1, min(self.balances[sender] // 2, 10**30)))
+        self.balances[sender] -= amount
+        block = SendBlock(
+            self.head(sender),
+            self.public_key(destination),
+            self.balances[sender].to_bytes(16, byteorder="big"),
+            bytes(64),
+            bytes(8),
+        )
+        self.add(sender, block)
+        pending = self.pending if self.chains[destination] else self.pending_opens
+        pending.append((destination, block.hash_sync(), amount))
+
+    def receive(self, pending: List[Tuple[int, bytes, int]]):
+        # Takes a random pending send. It is swapped with the last one, so removing it is O(1).
+        i = self.random.randrange(len(pending))
+        pending[i], pending[-1] = pending[-1], pending[i]
+        destination, source, amount = pending.pop()
+        if self.chains[destination]:
+            block = ReceiveBlock(self.head(destination), source, bytes(64), bytes(8))
+        else:
+            account = self.public_key(destination)
+            representative = self.public_key(self.pick_account())
+            block = OpenBlock(source, representative, account, bytes(64), bytes(8))
+        self.add(destination, block)
+        self.balances[destination] += amount
+
+    def change(self, index: int):
+        representative = self.public_key(self.pick_account())
+        self.add(
+            index,
+            ChangeBlock(self.head(index), representative, bytes(64), bytes(8)),
+        )
+
+    def build(self):
+        self.open_genesis()
+        # Accounts that no send has been made to yet are sent to in order, starting with this one
+        next_new = 1
+        for generated in range(1, self.block_count):
+            # Every account that hasn't been sent to needs a send and an open block, and every
+            # pending send to an unopened account needs an open block. When the remaining blocks
+            # are only enough for those, they come first.
+            new_accounts = self.account_count - next_new
+            forced = self.block_count - generated <= 2 * new_accounts + len(
+                self.pending_opens
+            )
+
+            roll = self.random.random()
+            if forced:
+                if self.pending_opens and (not new_accounts or roll < 0.5):
+                    self.receive(self.pending_opens)
+                else:
+                    self.send(self.pick_sender(), next_new)
+                    next_new += 1
+            elif roll < CHANGE_RATIO:
+                self.change(self.pick_opened())
+            elif self.pending_opens and roll < 0.2:
+                self.receive(self.pending_opens)
+            elif self.pending and roll < 0.5:
+                self.receive(self.pending)
+            elif new_accounts and roll < 0.65:
+                self.send(self.pick_sender(), next_new)
+                next_new += 1
+            else:
+                self.send(self.pick_sender(), self.pick_opened())
+
+    def sign(self, executor: Optional[Executor]):
+        items = []
+        blocks = []
+        for index, chain in enumerate(self.chains):
+            private_key, public_key = self.keys[index]
+            for block in chain:
+                root = public_key if isinstance(block, OpenBlock) else block.previous
+                items.append((block.hash_sync(), private_key, root))
+                blocks.append(block)
+
+        results = map_chunks(executor, sign_blocks, items, self.pow_threshold)
+        for block, (signature, work) in zip(blocks, results):
+            block.signature = signature
+            block.work = work
+
+    def generate(self, executor: Optional[Executor] = None):
+        s = time.time()
+        self.keys = map_chunks(
+            executor, derive_keys, list(range(self.account_count)), self.seed
+        )
+        e = time.time()
+        print(f"derived {self.account_count} keys in {(e-s)*1000:.0f}ms")
+
+        s = e
+        self.build()
+        e = time.time()
+        print(f"built {self.block_count} blocks in {(e-s)*1000:.0f}ms")
+
+        s = e
+        self.sign(executor)
+        e = time.time()
+        print(f"signed and generated work in {(e-s)*1000:.0f}ms")
+
+    def write(self, path: str):
+        # Snapshots are appended to, so an existing file would be merged with this ledger
+        if os.path.exists(path):
+            os.remove(path)
+        with SnapshotWriter(path) as writer:
+            for index, chain in enumerate(self.chains):
+                # Newest block first, like a bulk pull
+                writer.add_chain(self.public_key(index), chain[::-1])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Generate a valid synthetic ledger snapshot"
+    )
+    parser.add_argument("--accounts", type=int, default=1000)
+    parser.add_argument("--blocks", type=int, default=10000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument(
+        "--skew", type=float, default=1.1, help="Zipf exponent of account activity"
+    )
+    parser.add_argument(
+        "--pow-threshold",
+        type=lambda value: int(value, 16),
+        default=TEST_POW_THRESHOLD,
+        help="hex, the live network threshold is ffffffc000000000",
+    )
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--output", default="synthetic.snapshot")
+    args = parser.parse_args()
+
+    generator = LedgerGenerator(
+        args.accounts, args.blocks, args.seed, args.skew, args.pow_threshold
+    )
+    with ProcessPoolExecutor(args.workers) as pool:
+        generator.generate(pool)
+    generator.write(args.output)
+    print(f"wrote {args.output}")
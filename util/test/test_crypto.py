@@ -1,7 +1,35 @@
-from util.crypto import sign, verify_signature, private_to_public
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from util.crypto import (
+    POW_CHUNK_SIZE,
+    POW_PROCESS_BATCH_SIZE,
+    TEST_POW_THRESHOLD,
+    sign,
+    verify_signature,
+    private_to_public,
+    verify_signatures_batch,
+    verify_pow,
+    verify_pow_batch,
+    verify_pow_batch_async,
+    hash_blocks,
+    blake2b_hash,
+)
+import util.crypto
 from util.numbers import deterministic_key
 
 
+class CountingExecutor(ThreadPoolExecutor):
+    def __init__(self):
+        super(CountingExecutor, self).__init__(1)
+        self.tasks = 0
+
+    def submit(self, *args, **kwargs):
+        self.tasks += 1
+        return super(CountingExecutor, self).submit(*args, **kwargs)
+
+
 def test_sign_verify():
     priv, pub = deterministic_key(bytes(32), 0)
     msg = b"123"
@@ -25,3 +53,57 @@ def test_signature_valid():
     public_key = b"J\xf2\xb8L\xae\xe7\x8c0\xd2\xcaM\xdb\x1fq\xb2E\t\xec[\x06\x19\xe5\xa7\xd7\x90\x9c\x84\x0e\x8d\x84\x9a\x1e"
     assert verify_signature(msg, signature, public_key)
     assert not verify_signature(msg + b"123", signature, public_key)
+
+
+def test_verify_signatures_batch():
+    priv0, pub0 = deterministic_key(bytes(32), 0)
+    priv1, pub1 = deterministic_key(bytes(32), 1)
+    items = [
+        (b"123", sign(b"123", priv0), pub0),
+        (b"456", sign(b"456", priv1), pub1),
+        (b"789", sign(b"123", priv0), pub0),
+        (b"123", sign(b"123", priv0), pub1),
+    ]
+    assert verify_signatures_batch(items) == [True, True, False, False]
+
+
+def test_verify_pow_batch():
+    priv, pub = deterministic_key(bytes(32), 0)
+    work = bytes.fromhex("591bcb21af41d3bf")[::-1]
+    items = [(pub, work), (pub, bytes(8)), (bytes(32), work)]
+    assert verify_pow_batch(items) == [True, False, False]
+    assert verify_pow_batch(items) == [verify_pow(root, work) for root, work in items]
+
+
+@pytest.mark.asyncio
+async def test_verify_pow_batch_async_splits_large_batches(monkeypatch):
+    monkeypatch.setattr(util.crypto, "EXECUTORS_ENABLED", True)
+    thread_pool, process_pool = CountingExecutor(), CountingExecutor()
+    items = [
+        (i.to_bytes(32, "little"), bytes(8)) for i in range(POW_PROCESS_BATCH_SIZE + 1)
+    ]
+    results = await verify_pow_batch_async(
+        items, thread_pool, process_pool, TEST_POW_THRESHOLD
+    )
+
+    assert results == verify_pow_batch(items, TEST_POW_THRESHOLD)
+    assert thread_pool.tasks == 0
+    assert process_pool.tasks == -(-len(items) // POW_CHUNK_SIZE)
+
+
+def test_hash_blocks(monkeypatch):
+    stride, hashed_length = 40, 24
+    data = bytes(range(256)) * 25
+    expected = b"".join(
+        blake2b_hash(data[i : i + hashed_length])
+        for i in range(0, len(data) - stride + 1, stride)
+    )
+    assert hash_blocks(data, stride, hashed_length) == expected
+
+    # Split across the process pool
+    monkeypatch.setattr(util.crypto, "HASH_INLINE_COUNT", 0)
+    assert hash_blocks(data, stride, hashed_length, chunk_size=7) == expected
+
+    # Without shared memory (Python 3.7) large inputs are hashed inline
+    monkeypatch.setattr(util.crypto, "SharedMemory", None)
+    assert hash_blocks(data, stride, hashed_length, chunk_size=7) == expected
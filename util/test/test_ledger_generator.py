@@ -0,0 +1,60 @@
+from models.blocks import BlockType, OpenBlock, ReceiveBlock, SendBlock
+from storage.snapshot import Snapshot
+from util.crypto import TEST_POW_THRESHOLD, verify_pow, verify_signature
+from util.ledger_generator import LedgerGenerator
+
+
+def generate(seed=0):
+    generator = LedgerGenerator(accounts=6, blocks=24, seed=seed)
+    generator.generate()
+    return generator
+
+
+def test_ledger_is_valid():
+    generator = generate()
+    blocks = {
+        block.hash_sync(): (index, block)
+        for index, chain in enumerate(generator.chains)
+        for block in chain
+    }
+    assert len(blocks) == 24
+
+    for index, chain in enumerate(generator.chains):
+        account = generator.public_key(index)
+        # Every account is opened exactly once, by its first block
+        assert isinstance(chain[0], OpenBlock) and chain[0].account == account
+        assert not any(isinstance(block, OpenBlock) for block in chain[1:])
+
+        for i, block in enumerate(chain):
+            assert verify_signature(block.hash_sync(), block.signature, account)
+            root = account if i == 0 else chain[i - 1].hash_sync()
+            assert block.root == root
+            assert verify_pow(root, block.work, TEST_POW_THRESHOLD)
+
+            if isinstance(block, (OpenBlock, ReceiveBlock)) and index != 0:
+                sender, send = blocks[block.source]
+                assert isinstance(send, SendBlock) and send.destination == account
+
+
+def test_ledger_is_deterministic():
+    first, second = generate(), generate()
+    assert [[b.to_bytes() for b in chain] for chain in first.chains] == [
+        [b.to_bytes() for b in chain] for chain in second.chains
+    ]
+    assert generate(seed=1).chains[0][1].hash_sync() != first.chains[0][1].hash_sync()
+
+
+def test_write_snapshot(tmp_path):
+    generator = generate()
+    path = str(tmp_path / "synthetic.snapshot")
+    generator.write(path)
+    generator.write(path)
+
+    with Snapshot(path) as snapshot:
+        assert len(snapshot) == 24
+        accounts = snapshot.accounts()
+        assert len(accounts) == 6
+        entry = accounts[generator.public_key(0)]
+        assert entry.head == generator.head(0)
+        assert entry.block_count == len(generator.chains[0])
+        assert len(list(snapshot.blocks(BlockType.OPEN))) == 6